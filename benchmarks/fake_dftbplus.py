@@ -0,0 +1,121 @@
+#!/usr/bin/env python3
+"""Stub DFTB+ executable for benchmarking the wrapper's own overhead.
+
+Behaves like a (very fast) DFTB+ binary from the wrapper's point of view: it
+reads 'dftb_in.hsd' and its GenFormat geometry (embedded or included from a
+gen-file) from the working directory, prints a short log to STDOUT and writes
+a synthetic 'detailed.out' and 'charges.bin' and, if a 'Driver' block is
+present, a 'geo_end.xyz'. The energy is a deterministic function of the
+geometry so that reactions and atomization energies can be evaluated as usual.
+With 'ReadInitialCharges = Yes' the charges.bin of an earlier run is read and
+the SCC needs a third of the iterations. Geometry optimizations print one
+geometry step per halving of the force from 0.1 down to MaxForceComponent
+but leave the geometry as it is.
+
+Environment variables:
+FAKE_DFTBPLUS_LATENCY: Seconds to sleep per calculation (default 0).
+FAKE_DFTBPLUS_LOG: File to append one "<pid> <seconds>" line per call to.
+FAKE_DFTBPLUS_SCC_PER_ATOM: SCC iterations needed per atom. If the
+    MaxSCCIterations of the input are fewer, the SCC does not converge.
+    Without this variable, 10 plus the number of atoms are needed and the
+    SCC always converges.
+"""
+
+from os import environ, getpid
+from time import perf_counter, sleep
+
+import math
+import re
+
+# Synthetic atomic energies in Hartree (roughly DFTB3/3OB magnitude)
+ATOMIC_ENERGIES = {"h": -0.28, "c": -1.44, "n": -2.22, "o": -3.14}
+DEFAULT_ENERGY = -1.0
+AU2EV = 27.211386245988
+DEFAULT_MAX_SCC = 100  # DFTB+ default of MaxSCCIterations
+DEFAULT_MAX_FORCE = 1e-4  # DFTB+ default of MaxForceComponent
+
+
+def read_gen(hsd):
+    """Reads the GenFormat geometry into a list of (atom, [x, y, z]) tuples."""
+    block = re.search(r"Geometry\s*=\s*GenFormat\s*\{(.*?)\}", hsd, re.S)
+    content = block.group(1)
+    include = re.search(r'<<<\s*"([^"]+)"', content)
+    if include:
+        with open(include.group(1), "r") as gen_in:
+            content = gen_in.read()
+    lines = [x for x in content.splitlines() if x.strip()]
+    n_atoms = int(lines[0].split()[0])
+    species = lines[1].split()
+    geom = []
+    for line in lines[2:2 + n_atoms]:
+        splt = line.split()
+        geom.append((species[int(splt[1]) - 1],
+                     [float(x) for x in splt[2:5]]))
+    return geom
+
+
+def energy(geom):
+    """Returns a synthetic total energy in Hartree."""
+    total = 0.0
+    for at, _vec in geom:
+        total += ATOMIC_ENERGIES.get(at.lower(), DEFAULT_ENERGY)
+    for i, (_at_i, vec_i) in enumerate(geom):
+        for _at_j, vec_j in geom[i + 1:]:
+            dist = math.sqrt(sum((x - y) ** 2 for x, y in zip(vec_i, vec_j)))
+            total -= 0.1 * math.exp(-dist)
+    return total
+
+
+def main():
+    start = perf_counter()
+    with open("dftb_in.hsd", "r") as hsd_in:
+        hsd = hsd_in.read()
+    geom = read_gen(hsd)
+    sleep(float(environ.get("FAKE_DFTBPLUS_LATENCY", 0.0)))
+    total = energy(geom)
+    print("Fake DFTB+ (wrapper benchmark stub)")
+    max_scc = re.search(r"MaxSCCIterations\s*=\s*(\d+)", hsd, re.I)
+    max_scc = int(max_scc.group(1)) if max_scc else DEFAULT_MAX_SCC
+    per_atom = environ.get("FAKE_DFTBPLUS_SCC_PER_ATOM")
+    if per_atom is None:
+        needed = 10 + len(geom)
+        max_scc = max(max_scc, needed)
+    else:
+        needed = len(geom) * int(per_atom)
+    if re.search(r"ReadInitialCharges\s*=\s*Yes", hsd, re.I):
+        with open("charges.bin", "r") as charges_in:
+            if int(charges_in.read().split()[0]) != len(geom):
+                print("ERROR: Incompatible charges.bin")
+                return
+        needed = max(needed // 3, 1)
+    print("  iSCC Total electronic   Diff electronic      SCC error")
+    for i in range(min(needed, max_scc)):
+        print("%5d   %16.8E  %16.8E  %16.8E"
+              % (i + 1, total, 0.0, 0.1**(i + 1)))
+    if needed > max_scc:
+        print("WARNING: SCC is NOT converged, maximal SCC iterations exceeded")
+        return
+    with open("charges.bin", "w") as charges_out:
+        charges_out.write("%d fake charges\n" % len(geom))
+    with open("detailed.out", "w") as out:
+        out.write("Total energy:   %20.12f H   %20.12f eV\n"
+                  % (total, total * AU2EV))
+    if re.search(r"^\s*Driver\s*=", hsd, re.MULTILINE):
+        max_force = re.search(r"MaxForceComponent\s*=\s*([-+.\deE]+)", hsd)
+        max_force = (float(max_force.group(1)) if max_force
+                     else DEFAULT_MAX_FORCE)
+        for i in range(max(math.ceil(math.log2(0.1 / max_force)), 1)):
+            print("  Geometry step: %d" % i)
+        with open("geo_end.xyz", "w") as out:
+            out.write("%d\nGeometry Step: 0\n" % len(geom))
+            for at, vec in geom:
+                out.write("%s %16.10f %16.10f %16.10f %16.10f\n"
+                          % (at, vec[0], vec[1], vec[2], 0.0))
+        print("Geometry converged")
+    if "FAKE_DFTBPLUS_LOG" in environ:
+        with open(environ["FAKE_DFTBPLUS_LOG"], "a") as log:
+            log.write("%d %.6f\n" % (getpid(), perf_counter() - start))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+/*
+ * Stub libdftbplus for testing the in-process DFTB+ backend.
+ *
+ * Implements the part of the DFTB+ C API used by dftbplus_library.py with
+ * the synthetic energy of fake_dftbplus.py, so that the library and the
+ * subprocess backend can be compared. The species and coordinates are read
+ * from the GenFormat block of the input file. If FAKE_DFTBPLUS_LOG is set,
+ * one "process_input" line is appended to it per processed input. Every
+ * energy is written to the output file of the instance. If
+ * FAKE_DFTBPLUS_ABORT is set, processing an input stops the process with an
+ * error like DFTB+ does.
+ *
+ * Build: cc -shared -fPIC -o libfakedftbplus.so fake_libdftbplus.c -lm
+ */
+
+#include <math.h>
+#include <stdio.h>
+#include <stdlib.h>
+#include <string.h>
+
+#define BOHR__AA 0.529177249
+#define MAX_SPECIES 64
+
+typedef struct { void *instance; } DftbPlus;
+typedef struct { void *pDftbPlusInput; } DftbPlusInput;
+
+typedef struct {
+    int n_atoms;
+    double *atomic;  /* energy of every free atom in Hartree */
+    double *coords;  /* Bohr */
+    FILE *output;
+} Fake;
+
+static double atomic_energy(const char *symbol)
+{
+    if (!strcmp(symbol, "H") || !strcmp(symbol, "h")) return -0.28;
+    if (!strcmp(symbol, "C") || !strcmp(symbol, "c")) return -1.44;
+    if (!strcmp(symbol, "N") || !strcmp(symbol, "n")) return -2.22;
+    if (!strcmp(symbol, "O") || !strcmp(symbol, "o")) return -3.14;
+    return -1.0;
+}
+
+void dftbp_init(DftbPlus *instance, const char *outputfilename)
+{
+    Fake *fake = calloc(1, sizeof(Fake));
+    fake->output = fopen(outputfilename, "a");
+    instance->instance = fake;
+}
+
+void dftbp_final(DftbPlus *instance)
+{
+    Fake *fake = instance->instance;
+    free(fake->atomic);
+    free(fake->coords);
+    fclose(fake->output);
+    free(fake);
+    instance->instance = NULL;
+}
+
+void dftbp_get_input_from_file(DftbPlus *instance, const char *filename,
+                               DftbPlusInput *input)
+{
+    (void)instance;
+    input->pDftbPlusInput = strdup(filename);
+}
+
+void dftbp_input_final(DftbPlusInput *input)
+{
+    free(input->pDftbPlusInput);
+    input->pDftbPlusInput = NULL;
+}
+
+void dftbp_process_input(DftbPlus *instance, DftbPlusInput *input)
+{
+    Fake *fake = instance->instance;
+    char species[MAX_SPECIES][8], line[1024], *token;
+    int n_species = 0, i, type;
+    double x, y, z;
+    FILE *hsd = fopen(input->pDftbPlusInput, "r");
+    const char *log = getenv("FAKE_DFTBPLUS_LOG");
+
+    if (getenv("FAKE_DFTBPLUS_ABORT")) {
+        fprintf(fake->output, "ERROR!\n-> Aborted by FAKE_DFTBPLUS_ABORT\n");
+        fflush(fake->output);
+        exit(1);
+    }
+    while (fgets(line, sizeof(line), hsd) && !strstr(line, "GenFormat"));
+    fscanf(hsd, "%d %*s\n", &fake->n_atoms);
+    fgets(line, sizeof(line), hsd);
+    for (token = strtok(line, " \n"); token && n_species < MAX_SPECIES;
+         token = strtok(NULL, " \n"))
+        strncpy(species[n_species++], token, 7);
+    fake->atomic = calloc(fake->n_atoms, sizeof(double));
+    fake->coords = calloc(3 * fake->n_atoms, sizeof(double));
+    for (i = 0; i < fake->n_atoms; i++) {
+        fscanf(hsd, "%*d %d %lf %lf %lf", &type, &x, &y, &z);
+        fake->atomic[i] = atomic_energy(species[type - 1]);
+        fake->coords[3 * i] = x / BOHR__AA;
+        fake->coords[3 * i + 1] = y / BOHR__AA;
+        fake->coords[3 * i + 2] = z / BOHR__AA;
+    }
+    fclose(hsd);
+    if (log) {
+        FILE *out = fopen(log, "a");
+        fprintf(out, "process_input\n");
+        fclose(out);
+    }
+}
+
+int dftbp_get_nr_atoms(DftbPlus *instance)
+{
+    return ((Fake *)instance->instance)->n_atoms;
+}
+
+void dftbp_set_coords(DftbPlus *instance, double *coords)
+{
+    Fake *fake = instance->instance;
+    memcpy(fake->coords, coords, 3 * fake->n_atoms * sizeof(double));
+}
+
+static double distance(const Fake *fake, int i, int j, double *vec)
+{
+    int k;
+    double sum = 0.0;
+    for (k = 0; k < 3; k++) {
+        vec[k] = (fake->coords[3 * i + k] - fake->coords[3 * j + k])
+                 * BOHR__AA;
+        sum += vec[k] * vec[k];
+    }
+    return sqrt(sum);
+}
+
+void dftbp_get_energy(DftbPlus *instance, double *mermin_energy)
+{
+    Fake *fake = instance->instance;
+    double total = 0.0, vec[3];
+    int i, j;
+    for (i = 0; i < fake->n_atoms; i++)
+        total += fake->atomic[i];
+    for (i = 0; i < fake->n_atoms; i++)
+        for (j = i + 1; j < fake->n_atoms; j++)
+            total -= 0.1 * exp(-distance(fake, i, j, vec));
+    *mermin_energy = total;
+    fprintf(fake->output, "Total Mermin free energy: %.10f H\n", total);
+    fflush(fake->output);
+}
+
+void dftbp_get_gradients(DftbPlus *instance, double *gradients)
+{
+    Fake *fake = instance->instance;
+    double vec[3], dist, factor;
+    int i, j, k;
+    memset(gradients, 0, 3 * fake->n_atoms * sizeof(double));
+    for (i = 0; i < fake->n_atoms; i++)
+        for (j = i + 1; j < fake->n_atoms; j++) {
+            dist = distance(fake, i, j, vec);
+            factor = 0.1 * exp(-dist) / dist * BOHR__AA;
+            for (k = 0; k < 3; k++) {
+                gradients[3 * i + k] += factor * vec[k];
+                gradients[3 * j + k] -= factor * vec[k];
+            }
+        }
+}
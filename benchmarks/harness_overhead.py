@@ -0,0 +1,179 @@
+#!/usr/bin/env python3
+"""Benchmarks the wrapper overhead per system with a stub DFTB+ executable.
+
+Copies a testset directory (default: example/GMTKN55_testset) into a scratch
+folder, points its config at fake_dftbplus.py and drives the whole run through
+run_testsets.main(). Everything that is not spent inside the stub (process
+spawn, file copies, log parsing, analysis, CSV writing) is counted as wrapper
+overhead. The cold import time of every method backend is measured in a
+fresh interpreter. Results are appended to a JSON-lines history file so
+regressions can be tracked across commits.
+
+Usage:
+python3 benchmarks/harness_overhead.py [--latency 0.0] [--repeat 3]
+"""
+
+from contextlib import redirect_stdout
+from io import StringIO
+from os import chdir, environ, getcwd
+from os.path import abspath, dirname, exists, join
+from shutil import copy2, copytree, rmtree
+from tempfile import mkdtemp
+from time import perf_counter, strftime
+
+import argparse
+import json
+import subprocess
+import sys
+import yaml
+
+BENCH_DIR = dirname(abspath(__file__))
+REPO_DIR = dirname(BENCH_DIR)
+FAKE_DFTBPLUS = join(BENCH_DIR, "fake_dftbplus.py")
+
+sys.path.insert(0, REPO_DIR)
+import run_testsets  # noqa: E402
+from libtestset import backends  # noqa: E402
+
+IMPORT_PROBE = ("import sys\n"
+                "sys.path.insert(0, sys.argv[1])\n"
+                "from libtestset import backends\n"
+                "backend = backends.get(sys.argv[2])\n"
+                "backend.load()\n"
+                "print(backend.import_time)\n")
+
+
+def prepare_run_dir(testset_dir, hsd, scratch):
+    """Copies testset and HSD template to scratch and rewrites the config.
+
+    @:returns path of the prepared run directory.
+    """
+    run_dir = join(scratch, "run")
+    copytree(testset_dir, run_dir)
+    copy2(hsd, join(run_dir, "dftb_in.hsd"))
+    config = join(run_dir, "testsets_config.yml")
+    with open(config, "r") as infile:
+        settings = yaml.safe_load(infile)
+    settings["Options"]["DFTBPlusHSD"] = "dftb_in.hsd"
+    settings["Options"]["DFTBPlusPath"] = FAKE_DFTBPLUS
+    with open(config, "w") as outfile:
+        yaml.safe_dump(settings, outfile, sort_keys=False)
+    return run_dir
+
+
+def run_once(run_dir, stub_log):
+    """Runs run_testsets.main() once in run_dir.
+
+    @:returns (wall time, number of stub calls, time spent inside the stub).
+    """
+    open(stub_log, "w").close()
+    base_dir = getcwd()
+    chdir(run_dir)
+    try:
+        start = perf_counter()
+        with redirect_stdout(StringIO()):
+            run_testsets.main([])
+        wall = perf_counter() - start
+    finally:
+        chdir(base_dir)
+    n_calls = 0
+    stub_time = 0.0
+    with open(stub_log, "r") as log:
+        for line in log:
+            n_calls += 1
+            stub_time += float(line.split()[1])
+    return wall, n_calls, stub_time
+
+
+def backend_import_times():
+    """Measures the cold import time of each backend in a fresh process.
+
+    @:returns dictionary of backend names and import times in seconds (None
+        if the backend cannot be loaded on this machine).
+    """
+    times = dict()
+    for name in backends.names():
+        probe = subprocess.run([sys.executable, "-c", IMPORT_PROBE, REPO_DIR,
+                                name], capture_output=True, text=True)
+        if probe.returncode == 0:
+            times[name] = float(probe.stdout.split()[-1])
+        else:
+            times[name] = None
+    return times
+
+
+def git_revision():
+    try:
+        rev = subprocess.run(["git", "rev-parse", "--short", "HEAD"],
+                             cwd=REPO_DIR, capture_output=True, text=True,
+                             check=True)
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+    return rev.stdout.strip()
+
+
+def report(record, history):
+    """Prints a benchmark record and its change to the previous entry."""
+    print("Revision:            %s" % record["revision"])
+    print("Systems per run:     %d" % record["systems"])
+    print("Wall time per run:   %.3f s" % record["wall"])
+    print("Stub time per run:   %.3f s" % record["stub"])
+    print("Overhead per system: %.3f ms" % record["overhead_ms"])
+    for name, import_time in record["imports"].items():
+        if import_time is None:
+            print("Import of %-9s unavailable" % (name + ":"))
+        else:
+            print("Import of %-9s %.1f ms"
+                  % (name + ":", 1000.0 * import_time))
+    previous = None
+    if exists(history):
+        with open(history, "r") as hist:
+            lines = [x for x in hist.read().splitlines() if x.strip()]
+        if lines:
+            previous = json.loads(lines[-1])
+    if previous and previous["overhead_ms"] > 0.0:
+        change = record["overhead_ms"] / previous["overhead_ms"] - 1.0
+        print("Change vs. %s:    %+.1f %%" % (previous["revision"],
+                                              100.0 * change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--testset-dir",
+                        default=join(REPO_DIR, "example", "GMTKN55_testset"))
+    parser.add_argument("--hsd", default=join(REPO_DIR, "example",
+                                              "G2_97_testset", "dftb_in.hsd"))
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="Seconds the stub sleeps per calculation.")
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--history",
+                        default=join(BENCH_DIR, "bench_history.jsonl"),
+                        help="JSON-lines file the results are appended to.")
+    args = parser.parse_args()
+
+    scratch = mkdtemp(prefix="testset_bench_")
+    stub_log = join(scratch, "stub.log")
+    environ["FAKE_DFTBPLUS_LATENCY"] = str(args.latency)
+    environ["FAKE_DFTBPLUS_LOG"] = stub_log
+    try:
+        run_dir = prepare_run_dir(args.testset_dir, args.hsd, scratch)
+        timings = [run_once(run_dir, stub_log) for _i in range(args.repeat)]
+    finally:
+        rmtree(scratch)
+    wall, n_calls, stub_time = min(timings)
+    record = {"revision": git_revision(),
+              "date": strftime("%Y-%m-%d %H:%M:%S"),
+              "testset_dir": args.testset_dir,
+              "latency": args.latency,
+              "systems": n_calls,
+              "wall": wall,
+              "stub": stub_time,
+              "overhead_ms": 1000.0 * (wall - stub_time) / max(n_calls, 1),
+              "imports": backend_import_times()}
+    report(record, args.history)
+    with open(args.history, "a") as hist:
+        hist.write(json.dumps(record) + "\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,224 @@
+from copy import copy, deepcopy
+from dataclasses import dataclass, field
+from libtestset import atomic, backends, input_parser, results, statistics
+from libtestset.jobs import collect_jobs, distribute
+from libtestset.statistics import DEFAULT_CONFIDENCE, DEFAULT_SAMPLES
+from os import getcwd
+from os.path import abspath, dirname, exists, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from time import perf_counter
+from typing import Dict, List, Optional
+
+import numpy as np
+
+# Attribute holding the calculated value of the result objects per set type
+VALUES = {"reaction": "energy", "atomization": "eat", "distance": "value",
+          "angle": "value", "dihedral": "value"}
+
+
+class APIError(Exception):
+    """Error raised when an evaluation cannot be set up."""
+    pass
+
+
+@dataclass
+class TestsetResult:
+    """Calculated values and deviation statistics of one testset.
+
+    Values and references are in input order (reactions or systems as
+    listed in the input), values of failed calculations are NaN. Energies
+    are in kcal/mol, distances in Angstrom, angles in degrees.
+    """
+    name: str
+    set_type: str
+    labels: List[str]
+    reference: np.ndarray
+    values: np.ndarray
+    msd: float
+    mad: float
+    rmsd: float
+    max: float
+    n_missing: int
+    collection: Optional[str] = None
+
+    @property
+    def deviations(self):
+        """Returns reference minus calculated values."""
+        return self.reference - self.values
+
+
+@dataclass
+class Evaluation:
+    """Results of all testsets calculated with one method."""
+    method: str
+    testsets: Dict[str, TestsetResult]
+    errors: Dict[str, List[str]] = field(default_factory=dict)
+    wall_time: float = 0.0
+
+    @property
+    def statistics(self):
+        """Returns an Nx4 array of MSD, MAD, RMSD and MAX of all testsets."""
+        return np.array([[x.msd, x.mad, x.rmsd, x.max]
+                         for x in self.testsets.values()]).reshape(-1, 4)
+
+    def confidence_intervals(self, samples=DEFAULT_SAMPLES,
+                             confidence=DEFAULT_CONFIDENCE, seed=None):
+        """Returns bootstrap confidence intervals of the statistics.
+
+        @:returns Nx4x2 array of the lower and upper bounds of MSD, MAD,
+            RMSD and MAX of all testsets.
+        """
+        deviations = [x.deviations[~np.isnan(x.deviations)]
+                      for x in self.testsets.values()]
+        return statistics.intervals(
+            statistics.bootstrap(deviations, samples, seed), confidence)
+
+    @property
+    def wtmad(self):
+        """Returns WTMAD-1 and WTMAD-2 of the GMTKN55 testsets.
+
+        @:returns dictionary of 'WTMAD-1' and 'WTMAD-2' and their values,
+            empty without testsets of the GMTKN55 collection.
+        """
+        subsets = [x for x in self.testsets.values()
+                   if x.collection == statistics.GMTKN55]
+        if not subsets:
+            return dict()
+        values = statistics.wtmad([x.reference for x in subsets],
+                                  [x.mad for x in subsets])
+        return {"WTMAD-1": float(values[0]), "WTMAD-2": float(values[1])}
+
+
+class Plan(object):
+    """Validated settings and unique calculations of an input, prepared once.
+
+    A plan can be evaluated any number of times, e.g. with changing HSD
+    overrides, without parsing the input or indexing geometries again.
+
+    Inputs for instantiation:
+    @:param settings: Settings dictionary as in the input file, or path to
+        the input file.
+    @:param base_dir: Directory relative paths of a settings dictionary are
+        resolved against, defaults to the current working directory. Free
+        atom energies are cached there, or next to the input file.
+    """
+
+    def __init__(self, settings, base_dir=None):
+        if isinstance(settings, str):
+            if not exists(settings):
+                raise APIError("Input file %s does not exist." % settings)
+            base_dir = dirname(abspath(settings))
+            settings = input_parser.load(settings)
+        else:
+            base_dir = abspath(base_dir or getcwd())
+            settings = input_parser.validate(deepcopy(settings), base_dir)
+        self.settings = settings
+        self.options = settings["Options"]
+        self.testsets = settings["Testsets"]
+        self.jobs = collect_jobs(self.testsets)
+        self.atomic_cache = atomic.AtomicEnergyCache(
+            join(base_dir, atomic.CACHE_FILE))
+
+
+def evaluate(plan, overrides=None, hsd=None, methods=None, workdir=None):
+    """Runs all testsets of a plan and returns their results.
+
+    Neither the working directory nor STDOUT of the process are touched and
+    no result files are written. Calculations run in a temporary directory
+    that is removed afterwards. The 'FaultTolerance' and 'WarmStart' options
+    of the settings apply, 'KeepOutputs' does not.
+
+    Inputs:
+    @:param plan: Plan object, settings dictionary or path to the input file.
+    @:param overrides: Dictionary of HSD paths and values applied to all
+        calculations on top of the testset settings.
+    @:param hsd: Path to a dftb_in.hsd template used instead of the one of
+        the settings.
+    @:param methods: Names of the methods to run, defaults to all enabled.
+    @:param workdir: Directory for the temporary calculation directories,
+        defaults to the system's temporary directory.
+
+    @:returns dictionary of method names and Evaluation objects.
+    """
+    if not isinstance(plan, Plan):
+        plan = Plan(plan)
+    options = dict(plan.options)
+    if hsd is not None:
+        options["DFTBPlusHSD"] = abspath(hsd)
+    jobs = [with_overrides(x, overrides) for x in plan.jobs]
+    tmp_dir = mkdtemp(prefix="testset_eval_", dir=workdir)
+    evaluations = dict()
+    try:
+        for backend in backends.enabled(options):
+            if methods is not None and backend.name not in methods:
+                continue
+            start = perf_counter()
+            drivers = backend.run_jobs(jobs, options, workdir=tmp_dir)
+            atomics = None
+            if backend.name == "DFTB+":
+                atomics = atomic.reference_energies(
+                    plan.testsets, options, plan.atomic_cache, overrides,
+                    tmp_dir)
+            evaluations[backend.name] = evaluation(
+                backend.name, plan.testsets, jobs, drivers,
+                perf_counter() - start, atomics)
+    finally:
+        rmtree(tmp_dir, ignore_errors=True)
+    return evaluations
+
+
+def with_overrides(job, overrides):
+    """Returns a copy of a job with extra overrides and no errors."""
+    job = copy(job)
+    if overrides:
+        job.overrides = dict(job.overrides or dict())
+        job.overrides.update(overrides)
+    job.errors = dict()
+    return job
+
+
+def evaluation(method, testsets, jobs, drivers, wall_time=0.0, atomics=None):
+    """Evaluates finished calculations of all testsets.
+
+    Inputs:
+    @:param method: Method name.
+    @:param testsets: Dictionary of testset names and definitions.
+    @:param jobs: List of jobs.Job objects, errors are taken from them.
+    @:param drivers: Dictionary of job keys and finished drivers.
+    @:param wall_time: Wall time of the calculations in seconds.
+    @:param atomics: Optional free atom energies for atomization energies,
+        see results.AtomizationEnergy.
+
+    @:returns Evaluation object.
+    """
+    calcs = distribute(jobs, drivers)
+    set_results = dict()
+    for set_name, set_definition in testsets.items():
+        set_type = set_definition["type"]
+        entries = results.get_entries(set_definition,
+                                      calcs.get(set_name, dict()), atomics)
+        deviations = results.Deviations(entries)
+        if set_type == "reaction":
+            labels = [x["equation"] for x in set_definition["reactions"]]
+        else:
+            labels = list(set_definition["references"])
+        values = [getattr(x, VALUES[set_type]) for x in entries]
+        set_results[set_name] = TestsetResult(
+            set_name, set_type, labels,
+            np.array([x.ref for x in entries], dtype=float),
+            np.array([np.nan if x is None else x for x in values],
+                     dtype=float),
+            float(deviations.msd), float(deviations.mad),
+            float(deviations.rmsd), float(deviations.max),
+            deviations.n_missing, set_definition.get("collection"))
+    errors = dict()
+    for job in jobs:
+        if method in job.errors:
+            for alias in job.aliases:
+                errors["%s/%s" % alias] = list(job.errors[method])
+    return Evaluation(method, set_results, errors, wall_time)
+
+
+if __name__ == "__main__":
+    pass
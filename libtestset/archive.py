@@ -0,0 +1,194 @@
+from fnmatch import fnmatch
+from itertools import product
+from os import listdir, sep
+from os.path import isfile, join
+from pathlib import Path
+from queue import Queue
+from threading import Lock, Thread
+
+import zipfile
+
+COMPRESSION = {"deflated": zipfile.ZIP_DEFLATED,
+               "bzip2": zipfile.ZIP_BZIP2,
+               "lzma": zipfile.ZIP_LZMA,
+               "stored": zipfile.ZIP_STORED}
+DEFAULT_FILES = ("detailed.out", "dftbplus_output.log")
+DEFAULT_PATH = "outputs"
+
+
+class ArchiveError(Exception):
+    """Error raised when output files cannot be archived or read back."""
+    pass
+
+
+class OutputArchive(object):
+    """Keeps selected output files of finished calculations.
+
+    Instead of one directory per calculation, the files of all systems of a
+    testset are packed into one compressed zip archive <testset>.zip, with
+    members named <method>/<system>/<file>, or
+    <method>/<variant>/<system>/<file> for the variants of a sweep. The
+    files are read right after each calculation, so the calculation
+    directory can be removed, and compressed and written by a background
+    thread. At most max_pending calculations wait in memory for the writer.
+
+    Inputs for instantiation:
+    @:param directory: Directory the archives are written to.
+    @:param files: File names or shell patterns of the files to keep.
+    @:param compression: One of the keys of COMPRESSION.
+    @:param max_pending: Maximum number of queued calculations.
+    """
+
+    def __init__(self, directory, files=DEFAULT_FILES, compression="deflated",
+                 max_pending=64):
+        if compression not in COMPRESSION:
+            raise ArchiveError("Unknown compression '%s', use one of %s."
+                               % (compression, ", ".join(COMPRESSION)))
+        self.directory = directory
+        self.files = list(files)
+        self.compression = COMPRESSION[compression]
+        self._queue = Queue(maxsize=max_pending)
+        self._thread = None
+        self._lock = Lock()  # backends may add files from several threads
+        self._error = None
+        self._written = set()  # archives created by this object
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_args):
+        self.close()
+
+    def add(self, aliases, exec_dir, method="DFTB+", variants=None):
+        """Queues the output files of one calculation for archiving.
+
+        Inputs:
+        @:param aliases: List of (testset, system) tuples the calculation
+            stands for (jobs.Job.aliases).
+        @:param exec_dir: Directory of the finished calculation.
+        @:param method: Method name used as top level folder in the archive.
+        @:param variants: Optional names of the sweep variants the
+            calculation belongs to (jobs.Job.variants), its files are kept
+            in a folder per variant below the method folder.
+        """
+        if self._error is not None:
+            self.close()
+        files = dict()
+        for name in sorted(listdir(exec_dir)):
+            path = join(exec_dir, name)
+            if any(fnmatch(name, x) for x in self.files) and isfile(path):
+                with open(path, "rb") as infile:
+                    files[name] = infile.read()
+        with self._lock:
+            if self._thread is None:
+                Path(self.directory).mkdir(parents=True, exist_ok=True)
+                self._thread = Thread(target=self._write, daemon=True)
+                self._thread.start()
+        folders = [method]
+        if variants:
+            folders = ["%s/%s" % (method, x.replace("/", "_"))
+                       for x in variants]
+        self._queue.put((folders, list(aliases), files))
+
+    def close(self):
+        """Waits until all queued files are written and closes the archives.
+
+        Raises ArchiveError if the background writer failed.
+        """
+        if self._thread is not None:
+            self._queue.put(None)
+            self._thread.join()
+            self._thread = None
+        if self._error is not None:
+            error, self._error = self._error, None
+            raise ArchiveError("Output files could not be archived in %s: %s"
+                               % (self.directory, error))
+
+    def _write(self):
+        """Background thread writing queued files until None is received."""
+        archives = dict()
+        try:
+            while True:
+                item = self._queue.get()
+                if item is None:
+                    break
+                if self._error is not None:
+                    continue  # only drain the queue to unblock producers
+                folders, aliases, files = item
+                try:
+                    for set_name, sys_name in aliases:
+                        if set_name not in archives:
+                            archives[set_name] = self._open(set_name)
+                        for folder, name in product(folders, files):
+                            member = "%s/%s/%s" % (folder, sys_name, name)
+                            archives[set_name].writestr(member, files[name])
+                except (OSError, zipfile.BadZipFile) as exc:
+                    self._error = exc
+        finally:
+            for zip_file in archives.values():
+                zip_file.close()
+
+    def _open(self, set_name):
+        """Opens a testset archive, replacing archives of earlier runs."""
+        path = archive_path(self.directory, set_name)
+        mode = "a" if path in self._written else "w"
+        self._written.add(path)
+        return zipfile.ZipFile(path, mode, compression=self.compression)
+
+
+def from_options(options):
+    """Returns an OutputArchive for the 'KeepOutputs' option or None."""
+    settings = options.get("KeepOutputs")
+    if not settings:
+        return None
+    return OutputArchive(settings["path"], settings["files"],
+                         settings["compression"])
+
+
+def archive_path(directory, set_name):
+    """Returns the path of the archive of a testset."""
+    return join(directory, "%s.zip" % set_name.replace(sep, "_"))
+
+
+def list_systems(path, method="DFTB+"):
+    """Returns the names of all systems with files in an archive.
+
+    @:returns sorted list of system names.
+    """
+    with _open_archive(path) as zip_file:
+        names = zip_file.namelist()
+    prefix = method + "/"
+    return sorted({x[len(prefix):].split("/")[0] for x in names
+                   if x.startswith(prefix)})
+
+
+def read_system(path, system, method="DFTB+"):
+    """Reads the kept files of one system without unpacking the archive.
+
+    Inputs:
+    @:param path: Path to the testset archive.
+    @:param system: System name.
+    @:param method: Method the files belong to, "<method>/<variant>" for
+        the files of a sweep variant.
+
+    @:returns dictionary of file names and file contents (bytes).
+    """
+    prefix = "%s/%s/" % (method, system)
+    with _open_archive(path) as zip_file:
+        files = {x[len(prefix):]: zip_file.read(x)
+                 for x in zip_file.namelist() if x.startswith(prefix)}
+    if not files:
+        raise ArchiveError("No %s files of system '%s' in %s."
+                           % (method, system, path))
+    return files
+
+
+def _open_archive(path):
+    try:
+        return zipfile.ZipFile(path, "r")
+    except (OSError, zipfile.BadZipFile) as exc:
+        raise ArchiveError("Cannot read output archive %s: %s" % (path, exc))
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,221 @@
+from copy import deepcopy
+from hashlib import sha1
+from libtestset.constants import element_symbols
+from libtestset.dftbplus_runner import DFTBPlusDriver, DFTBPlusRunnerError
+from libtestset.dftbplus_runner import get_random_folder
+from libtestset.geometry import XYZError, load_index
+from libtestset.hsd import apply_overrides, load_template
+from os import getpid, replace, stat
+from os.path import dirname, join
+from shutil import rmtree
+from threading import Lock
+
+import json
+import numpy as np
+
+CACHE_FILE = ".atomic_energies.json"
+MODES = ("calculate", "builtin")  # values of the AtomicEnergies option
+NOBLE_GASES = (2, 10, 18, 36, 54)  # atomic numbers closing each period
+
+
+class AtomicEnergyError(Exception):
+    """Error raised when a free atom energy cannot be calculated."""
+    pass
+
+
+class AtomicEnergyCache(object):
+    """Free atom energies of earlier runs, stored in a JSON file.
+
+    Energies are stored under a hash of the complete DFTB+ input of the atom
+    and the size and modification time of its Slater-Koster file, so they
+    are calculated again as soon as anything they depend on changes.
+
+    Inputs for instantiation:
+    @:param path: Path to the cache file, which does not need to exist.
+    """
+
+    def __init__(self, path=CACHE_FILE):
+        self.path = path
+        try:
+            with open(path, "r") as infile:
+                self._energies = json.load(infile)
+        except (OSError, ValueError):
+            self._energies = dict()
+        self._lock = Lock()
+
+    def get(self, key):
+        """Returns the stored energy in kcal/mol or None."""
+        return self._energies.get(key)
+
+    def put(self, key, energy):
+        """Stores an energy and writes the cache file."""
+        with self._lock:
+            self._energies[key] = energy
+            tmp = "%s.%d.tmp" % (self.path, getpid())
+            try:
+                with open(tmp, "w") as outfile:
+                    json.dump(self._energies, outfile)
+                replace(tmp, self.path)
+            except OSError:
+                pass  # read-only directory, keep the energies in memory
+
+
+def unpaired_electrons(symbol):
+    """Returns the unpaired electrons of a free atom in its ground state.
+
+    Follows Hund's rule for the valence s, p and d shells up to xenon,
+    ignoring exceptions such as chromium and copper.
+    """
+    number = element_symbols.index(symbol.capitalize())
+    if number > NOBLE_GASES[-1]:
+        raise AtomicEnergyError("No ground state spin known for element %s."
+                                % symbol)
+    core = max(x for x in (0,) + NOBLE_GASES if x < number)
+    valence = number - core
+    if valence <= 2:
+        return valence % 2
+    if core >= 18:  # periods with d shell
+        if valence <= 12:
+            d_electrons = valence - 2
+            return d_electrons if d_electrons <= 5 else 10 - d_electrons
+        valence -= 10
+    p_electrons = valence - 2
+    return p_electrons if p_electrons <= 3 else 6 - p_electrons
+
+
+def elements(testsets):
+    """Returns the elements of all systems of atomization testsets.
+
+    @:returns sorted list of lower case element symbols.
+    """
+    found = set()
+    for set_definition in testsets.values():
+        if set_definition["type"] != "atomization":
+            continue
+        index = load_index(set_definition["path"])
+        for sys_name in set_definition["references"]:
+            try:
+                found.update(index.element_counts(sys_name))
+            except XYZError:
+                pass  # reported when the testset is evaluated
+    return sorted(found)
+
+
+def reference_energies(testsets, options, cache=None, overrides=None,
+                       workdir=None):
+    """Returns the free atom energies needed by the atomization testsets.
+
+    Inputs:
+    @:param testsets: Dictionary of testset names and definitions.
+    @:param options: Options of the input file.
+    @:param cache: Optional AtomicEnergyCache.
+    @:param overrides: HSD overrides applied to all calculations.
+    @:param workdir: Directory for the calculation directories.
+
+    @:returns dictionary of lower case element symbols and energies in
+        kcal/mol, None if the builtin energies are used.
+    """
+    if options.get("AtomicEnergies", MODES[0]) == "builtin":
+        return None
+    symbols = elements(testsets)
+    if not symbols:
+        return None
+    return calculate(symbols, options["DFTBPlusHSD"], options["DFTBPlusPath"],
+                     overrides, cache, workdir)
+
+
+def calculate(symbols, hsd, executable, overrides=None, cache=None,
+              workdir=None):
+    """Returns the free atom energies of elements for a DFTB+ setup.
+
+    Every atom is calculated as single point. Atoms with unpaired electrons
+    are calculated spin polarized if the template contains SpinConstants,
+    otherwise spin restricted like the molecules.
+
+    Inputs:
+    @:param symbols: Element symbols.
+    @:param hsd: Path to dftb_in.hsd or hsd.HSDTemplate object.
+    @:param executable: Path to DFTB+ executable.
+    @:param overrides: HSD overrides applied to all calculations.
+    @:param cache: Optional AtomicEnergyCache.
+    @:param workdir: Directory for the calculation directories, defaults to
+        the current working directory.
+
+    @:returns dictionary of lower case element symbols and energies in
+        kcal/mol.
+    """
+    template = hsd if not isinstance(hsd, str) else load_template(hsd)
+    spin = template.tree.find("Hamiltonian/SpinConstants") is not None
+    energies = dict()
+    for symbol in symbols:
+        symbol = symbol.capitalize()
+        atom_overrides = dict(overrides or dict())
+        atom_overrides["Driver"] = None
+        atom_overrides["Hamiltonian/Charge"] = 0
+        unpaired = unpaired_electrons(symbol)
+        if spin and unpaired:
+            atom_overrides["Hamiltonian/SpinPolarisation"] = (
+                "Colinear { UnpairedElectrons = %d }" % unpaired)
+        geometry = ([symbol], np.zeros((1, 3)))
+        key = _key(executable, template, geometry, atom_overrides, symbol)
+        energy = cache.get(key) if cache is not None else None
+        if energy is None:
+            exec_dir = join(workdir or "", get_random_folder(
+                prefix="dftb+_atom_"))
+            driver = DFTBPlusDriver(executable, template, None, exec_dir,
+                                    atom_overrides, geometry)
+            try:
+                driver.run()
+            except DFTBPlusRunnerError as exc:
+                raise AtomicEnergyError("Free atom calculation of %s "
+                                        "failed: %s" % (symbol, exc))
+            rmtree(exec_dir)
+            energy = driver.energy
+            if cache is not None:
+                cache.put(key, energy)
+        energies[symbol.lower()] = energy
+    return energies
+
+
+def _key(executable, template, geometry, overrides, symbol):
+    """Hash of the atom's input, executable and Slater-Koster file."""
+    digest = sha1(template.render(*geometry, overrides).encode())
+    digest.update(executable.encode())
+    for path in _skf_files(template, symbol, overrides):
+        try:
+            info = stat(path)
+        except OSError:
+            continue
+        digest.update(("%s %d %d\n" % (path, info.st_size,
+                                       info.st_mtime_ns)).encode())
+    return digest.hexdigest()[:16]
+
+
+def _skf_files(template, symbol, overrides):
+    """Returns the possible paths of the homonuclear SKF of an element."""
+    tree = deepcopy(template.tree)
+    apply_overrides(tree, overrides)
+    node = tree.find("Hamiltonian/SlaterKosterFiles")
+    if node is None or node.children is None:
+        return []
+    if (node.method or "").lower() == "type2filenames":
+        settings = {x.name.lower(): (x.value or "").strip("\"'")
+                    for x in node.children if x.name}
+        name = symbol
+        if settings.get("lowercasetypename", "no").lower() == "yes":
+            name = symbol.lower()
+        path = "%s%s%s%s%s" % (settings.get("prefix", ""), name,
+                               settings.get("separator", ""), name,
+                               settings.get("suffix", ""))
+    else:
+        pair = "%s-%s" % (symbol, symbol)
+        values = [x.value for x in node.children
+                  if x.name and x.name.lower() == pair.lower()]
+        if not values:
+            return []
+        path = values[0].strip("\"'")
+    return [path, join(dirname(template.path), path)]
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,148 @@
+from importlib import import_module
+from libtestset import charges
+from time import perf_counter
+
+
+class BackendError(Exception):
+    """Error raised when a method backend is unknown or cannot be loaded."""
+    pass
+
+
+class Backend(object):
+    """Method backend whose runner module is imported on first use.
+
+    Backends are only loaded when the input file enables them, so e.g. a
+    plain DFTB+ run never imports torch or SchNetPack.
+
+    Inputs for instantiation:
+    @:param name: Method name as used in output files (e.g. "DFTB+").
+    @:param module: Import path of the runner module.
+    @:param runner: Function (module, jobs, options, archive, workdir)
+        running a list of jobs.Job objects and returning a dictionary of job
+        keys and drivers.
+    @:param option: Key in the 'Options' section that enables the backend,
+        None for backends that always run.
+    @:param key: Name in the registry, defaults to name. Backends of the
+        same method are registered under different keys.
+    @:param concurrent: False if calculations of the backend must not run
+        in several threads of one process at the same time, e.g. because
+        they redirect sys.stdout.
+    """
+
+    def __init__(self, name, module, runner, option=None, key=None,
+                 concurrent=True):
+        self.name = name
+        self.key = key or name
+        self.concurrent = concurrent
+        self.module_name = module
+        self.option = option
+        self._runner = runner
+        self._module = None
+        self.import_time = None
+
+    def enabled(self, options):
+        """Returns whether the backend is requested in the options."""
+        return self.option is None or self.option in options
+
+    def load(self):
+        """Imports the runner module and records the import time."""
+        if self._module is None:
+            start = perf_counter()
+            try:
+                self._module = import_module(self.module_name)
+            except ImportError as exc:
+                msg = "Backend %s could not be loaded (%s)."
+                raise BackendError(msg % (self.name, exc))
+            self.import_time = perf_counter() - start
+        return self._module
+
+    def run_jobs(self, jobs, options, archive=None, workdir=None):
+        """Runs a list of unique calculations with this backend.
+
+        Inputs:
+        @:param jobs: List of jobs.Job objects.
+        @:param options: 'Options' section of the settings.
+        @:param archive: Optional archive.OutputArchive for output files.
+        @:param workdir: Directory for the calculation directories, defaults
+            to the current working directory.
+
+        @:returns Dictionary of job keys and their driver objects.
+        """
+        return self._runner(self.load(), jobs, options, archive, workdir)
+
+
+def retries(options):
+    """Returns the fallback overrides of the 'FaultTolerance' option.
+
+    @:returns None if failed calculations should stop the run, otherwise a
+        list of HSD override dictionaries.
+    """
+    settings = options.get("FaultTolerance")
+    if not settings:
+        return None
+    return settings["retries"]
+
+
+def _run_dftbplus(module, jobs, options, archive=None, workdir=None):
+    return module.run_jobs(jobs, options["DFTBPlusHSD"],
+                           options["DFTBPlusPath"], archive, retries(options),
+                           charges.from_options(options), workdir)
+
+
+def _run_dftbplus_library(module, jobs, options, archive=None, workdir=None):
+    return module.run_jobs(jobs, options["DFTBPlusHSD"],
+                           options["DFTBPlusPath"], options["DFTBPlusLibrary"],
+                           archive, retries(options),
+                           charges.from_options(options), workdir)
+
+
+def _run_dtnn(module, jobs, options, archive=None, workdir=None):
+    dtnn = options["DTNN"]
+    return module.run_jobs(jobs, dtnn["DTNNModel"], options["DFTBPlusPath"],
+                           dtnn["DTNNSkfPath"], archive,
+                           retries(options) is not None, workdir)
+
+
+_registry = dict()
+
+
+def register(backend):
+    """Adds a backend to the registry (replacing one of the same key)."""
+    _registry[backend.key] = backend
+
+
+def get(name):
+    """Returns the registered backend of the given key."""
+    try:
+        return _registry[name]
+    except KeyError:
+        raise BackendError("Unknown method backend '%s'." % name)
+
+
+def names():
+    """Returns the keys of all registered backends."""
+    return list(_registry.keys())
+
+
+def enabled(options):
+    """Returns all backends enabled by the 'Options' section.
+
+    If several backends of one method are enabled, the one registered last
+    is used, e.g. the DFTB+ library instead of the DFTB+ executable.
+    """
+    methods = dict()
+    for backend in _registry.values():
+        if backend.enabled(options):
+            methods[backend.name] = backend
+    return list(methods.values())
+
+
+register(Backend("DFTB+", "libtestset.dftbplus_runner", _run_dftbplus))
+register(Backend("DTNN", "libtestset.dtnn_runner", _run_dtnn, option="DTNN",
+                 concurrent=False))
+register(Backend("DFTB+", "libtestset.dftbplus_library", _run_dftbplus_library,
+                 option="DFTBPlusLibrary", key="DFTB+ library"))
+
+
+if __name__ == "__main__":
+    pass
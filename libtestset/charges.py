@@ -0,0 +1,152 @@
+from hashlib import sha1
+from os import getpid, remove, replace
+from os.path import exists, join
+from pathlib import Path
+from shutil import copyfile
+from threading import get_ident
+
+import json
+
+CHARGE_FILE = "charges.bin"
+DEFAULT_PATH = ".charge_store"
+# Settings that change the layout or meaning of charges.bin
+COMPATIBILITY_PATHS = ("Hamiltonian/SCC",
+                       "Hamiltonian/Charge",
+                       "Hamiltonian/MaxAngularMomentum",
+                       "Hamiltonian/SpinPolarisation",
+                       "Hamiltonian/OrbitalResolvedSCC")
+
+
+class ChargeStore(object):
+    """Converged charges of earlier calculations for SCC warm starts.
+
+    The charges.bin written by DFTB+ is kept per geometry (job key) and
+    compatible setup, i.e. the same charge, spin and angular momenta. When
+    the same geometry runs again, e.g. with changed parameters, the stored
+    charges are passed to DFTB+ with ReadInitialCharges. The SCC iterations
+    of the first calculation without warm start are kept for comparison.
+
+    Inputs for instantiation:
+    @:param directory: Directory of the store.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+
+    def key(self, job, template, overrides=None):
+        """Returns the store key of a job run with a template.
+
+        Copies of a job with other overrides (e.g. sweep variants) share
+        the key as long as the settings the charges depend on are the same.
+
+        Inputs:
+        @:param job: jobs.Job object.
+        @:param template: hsd.HSDTemplate object.
+        @:param overrides: HSD overrides of the calculation.
+        """
+        setup = template.settings(COMPATIBILITY_PATHS, overrides)
+        text = "%s\n%s" % (job.base_key, setup)
+        return sha1(text.encode()).hexdigest()[:16]
+
+    def get(self, key, exec_dir):
+        """Copies stored charges into exec_dir.
+
+        @:returns True if charges were found.
+        """
+        stored = join(self.directory, "%s.bin" % key)
+        if not exists(stored):
+            return False
+        Path(exec_dir).mkdir(parents=True, exist_ok=True)
+        copyfile(stored, join(exec_dir, CHARGE_FILE))
+        return True
+
+    def put(self, key, exec_dir, scc_iterations, warm):
+        """Stores the charges of a finished calculation.
+
+        Inputs:
+        @:param key: Store key (see key()).
+        @:param exec_dir: Directory of the finished calculation.
+        @:param scc_iterations: Number of SCC iterations of the calculation.
+        @:param warm: Whether the calculation started from stored charges.
+        """
+        charges = join(exec_dir, CHARGE_FILE)
+        if not exists(charges):
+            return
+        Path(self.directory).mkdir(parents=True, exist_ok=True)
+        target = join(self.directory, "%s.bin" % key)
+        # variants of a sweep may store the same key from several threads
+        tmp = "%s.%d.%d.tmp" % (target, getpid(), get_ident())
+        copyfile(charges, tmp)
+        replace(tmp, target)
+        if not warm and scc_iterations is not None:
+            _write_json(join(self.directory, "%s.json" % key),
+                        {"cold_iterations": scc_iterations})
+
+    def discard(self, key):
+        """Removes stored charges, e.g. after a failed warm start."""
+        for suffix in (".bin", ".json"):
+            try:
+                remove(join(self.directory, key + suffix))
+            except FileNotFoundError:
+                pass
+
+    def cold_iterations(self, key):
+        """Returns the SCC iterations without warm start or None."""
+        try:
+            with open(join(self.directory, "%s.json" % key), "r") as infile:
+                return json.load(infile)["cold_iterations"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+
+def from_options(options):
+    """Returns a ChargeStore for the 'WarmStart' option or None."""
+    settings = options.get("WarmStart")
+    if not settings:
+        return None
+    return ChargeStore(settings["path"])
+
+
+def report(testsets, jobs, drivers):
+    """Returns the SCC iterations saved by warm starts per testset.
+
+    Inputs:
+    @:param testsets: Dictionary of testset names and definitions.
+    @:param jobs: List of jobs.Job objects.
+    @:param drivers: Dictionary of job keys and finished DFTBPlusDriver
+        objects.
+    """
+    # systems, warm started systems, SCC iterations, iterations when cold
+    counts = {x: [0, 0, 0, 0] for x in testsets}
+    for job in jobs:
+        driver = drivers.get(job.key)
+        if getattr(driver, "scc_iterations", None) is None:
+            continue  # failed or run elsewhere
+        iterations = driver.scc_iterations
+        cold = iterations
+        if driver.warm_start:
+            cold = driver.cold_iterations or iterations
+        for set_name, _sys_name in job.aliases:
+            count = counts[set_name]
+            count[0] += 1
+            count[1] += driver.warm_start
+            count[2] += iterations
+            count[3] += cold
+    lines = ["SCC warm start:"]
+    for set_name, (n_jobs, n_warm, iterations, cold) in counts.items():
+        saved = 100.0 * (1.0 - iterations / cold) if cold else 0.0
+        lines.append("  %s: %d of %d systems warm started, %d SCC "
+                     "iterations instead of %d (%.1f %% saved)"
+                     % (set_name, n_warm, n_jobs, iterations, cold, saved))
+    return "\n".join(lines)
+
+
+def _write_json(path, data):
+    tmp = "%s.%d.%d.tmp" % (path, getpid(), get_ident())
+    with open(tmp, "w") as outfile:
+        json.dump(data, outfile)
+    replace(tmp, path)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,157 @@
+from libtestset.dftbplus_runner import DFTBPlusRunnerError
+from libtestset.dftbplus_runner import get_random_folder, run_staged
+from libtestset.hsd import load_template
+from libtestset.statistics import DEFAULT_CONFIDENCE, DEFAULT_SAMPLES
+from libtestset.statistics import intervals, resample
+from shutil import rmtree
+
+import csv
+import numpy as np
+
+
+class Variant(object):
+    """One side of an A/B comparison.
+
+    Inputs for instantiation:
+    @:param label: Short name used in the output (e.g. "A").
+    @:param executable: Path to the DFTB+ executable.
+    @:param hsd: Path to the dftb_in.hsd template.
+    """
+
+    def __init__(self, label, executable, hsd):
+        self.label = label
+        self.executable = executable
+        self.hsd = hsd
+        self.template = load_template(hsd)
+
+
+class Comparison(object):
+    """Timings and energies of all jobs run with two variants.
+
+    Inputs for instantiation:
+    @:param jobs: List of jobs.Job objects that finished with both variants.
+    @:param times: Nx2 array of wall times in seconds (A, B).
+    @:param energies: Nx2 array of total energies in kcal/mol (A, B).
+    """
+
+    def __init__(self, jobs, times, energies):
+        self.jobs = jobs
+        self.times = times
+        self.energies = energies
+
+    @property
+    def ratios(self):
+        """Returns per job wall-time ratios B/A."""
+        return self.times[:, 1] / self.times[:, 0]
+
+    @property
+    def energy_differences(self):
+        """Returns per job energy differences B - A in kcal/mol."""
+        return self.energies[:, 1] - self.energies[:, 0]
+
+    @property
+    def speedup(self):
+        """Returns the total wall time of A divided by the one of B."""
+        return self.times[:, 0].sum() / self.times[:, 1].sum()
+
+    def speedup_interval(self, n_bootstrap=DEFAULT_SAMPLES,
+                         confidence=DEFAULT_CONFIDENCE, seed=0):
+        """Bootstrap confidence interval of the speedup.
+
+        Jobs are resampled with replacement, see statistics.resample().
+
+        @:returns (lower bound, upper bound).
+        """
+        speedups = resample(self.times, _speedups, n_bootstrap, seed)
+        return tuple(intervals(speedups, confidence))
+
+    def summary(self):
+        """Returns a short report of speed and energy differences."""
+        if not self.jobs:
+            return "No job finished with both variants."
+        lower, upper = self.speedup_interval()
+        diffs = np.abs(self.energy_differences)
+        return ("%d jobs compared\n"
+                "Total wall time A: %.3f s, B: %.3f s\n"
+                "Speedup of B over A: %.3f (%d %% CI %.3f - %.3f)\n"
+                "Median time ratio B/A per job: %.3f\n"
+                "Energy difference B - A: mean absolute %.6f, "
+                "max. absolute %.6f kcal/mol"
+                % (len(self.jobs), self.times[:, 0].sum(),
+                   self.times[:, 1].sum(), self.speedup,
+                   round(100 * DEFAULT_CONFIDENCE), lower, upper,
+                   np.median(self.ratios), diffs.mean(), diffs.max()))
+
+    def write(self, filename):
+        """Writes per job timings and energies to a csv file."""
+        categories = ["Systems", "Atoms", "Time A", "Time B", "Ratio B/A",
+                      "Energy A", "Energy B", "ΔE"]
+        with open(filename, "w") as out:
+            writer = csv.DictWriter(out, fieldnames=categories)
+            writer.writeheader()
+            for i, job in enumerate(self.jobs):
+                writer.writerow({
+                    "Systems": " ".join("%s/%s" % x for x in job.aliases),
+                    "Atoms": job.n_atoms,
+                    "Time A": str(np.round(self.times[i, 0], 4)),
+                    "Time B": str(np.round(self.times[i, 1], 4)),
+                    "Ratio B/A": str(np.round(self.ratios[i], 3)),
+                    "Energy A": str(np.round(self.energies[i, 0], 6)),
+                    "Energy B": str(np.round(self.energies[i, 1], 6)),
+                    "ΔE": str(np.round(self.energy_differences[i], 6))})
+
+
+def compare(jobs, variant_a, variant_b, seed=0):
+    """Runs all jobs with two variants, interleaved job by job.
+
+    Both variants of a job run right after each other in random order, so
+    that changes of the machine load affect both variants alike. Jobs that
+    fail with either variant are recorded in Job.errors and left out.
+
+    Inputs:
+    @:param jobs: List of jobs.Job objects.
+    @:param variant_a: Variant object of the baseline.
+    @:param variant_b: Variant object to compare to the baseline.
+    @:param seed: Seed of the random run order.
+
+    @:returns Comparison object.
+    """
+    rng = np.random.default_rng(seed)
+    finished = []
+    times = []
+    energies = []
+    for job in jobs:
+        order = [variant_a, variant_b]
+        if rng.random() < 0.5:
+            order.reverse()
+        drivers = dict()
+        for variant in order:
+            try:
+                drivers[variant.label] = _run(job, variant)
+            except DFTBPlusRunnerError as exc:
+                job.errors.setdefault(variant.label, []).append(str(exc))
+        if len(drivers) < 2:
+            continue
+        finished.append(job)
+        pair = (drivers[variant_a.label], drivers[variant_b.label])
+        times.append([x.wall_time for x in pair])
+        energies.append([x.energy for x in pair])
+    return Comparison(finished, np.array(times).reshape(-1, 2),
+                      np.array(energies).reshape(-1, 2))
+
+
+def _speedups(times):
+    """Speedups of resampled (n, N, 2) wall times of A and B."""
+    return times[:, :, 0].sum(axis=1) / times[:, :, 1].sum(axis=1)
+
+
+def _run(job, variant):
+    exec_dir = get_random_folder(prefix="dftb+_%s_" % variant.label)
+    driver = run_staged(variant.executable, variant.template, job.xyz,
+                        exec_dir, job.overrides, job.staged)
+    rmtree(exec_dir)
+    return driver
+
+
+if __name__ == "__main__":
+    pass
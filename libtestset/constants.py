@@ -4,6 +4,8 @@ class UnitConversion:
     kcal2au = 1 / au2kcal
     au2ev = 27.211386245988
     ev2au = 1 / au2ev
+    bohr2aa = 0.529177249  # value used by DFTB+
+    aa2bohr = 1 / bohr2aa
 
 
 class Hydrogen:
@@ -36,3 +38,18 @@ hubbard_derivatives = {
     "s": -0.11,
     "zn": -0.03,
 }
+
+# Element symbols ordered by atomic number (index 0 is a dummy atom)
+element_symbols = [
+    "X",
+    "H", "He",
+    "Li", "Be", "B", "C", "N", "O", "F", "Ne",
+    "Na", "Mg", "Al", "Si", "P", "S", "Cl", "Ar",
+    "K", "Ca", "Sc", "Ti", "V", "Cr", "Mn", "Fe", "Co", "Ni", "Cu", "Zn",
+    "Ga", "Ge", "As", "Se", "Br", "Kr",
+    "Rb", "Sr", "Y", "Zr", "Nb", "Mo", "Tc", "Ru", "Rh", "Pd", "Ag", "Cd",
+    "In", "Sn", "Sb", "Te", "I", "Xe",
+    "Cs", "Ba", "La", "Ce", "Pr", "Nd", "Pm", "Sm", "Eu", "Gd", "Tb", "Dy",
+    "Ho", "Er", "Tm", "Yb", "Lu", "Hf", "Ta", "W", "Re", "Os", "Ir", "Pt",
+    "Au", "Hg", "Tl", "Pb", "Bi", "Po", "At", "Rn",
+]
@@ -0,0 +1,207 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import asdict
+from libtestset import api, atomic, backends
+from libtestset.hsd import load_template
+from os import remove
+from os.path import abspath, exists
+from shutil import rmtree
+from socket import AF_UNIX, SOCK_STREAM, socket
+from socketserver import StreamRequestHandler, ThreadingMixIn
+from socketserver import UnixStreamServer
+from tempfile import mkdtemp
+from time import perf_counter
+
+import json
+import numpy as np
+
+
+class DaemonError(Exception):
+    """Error raised when the daemon cannot start or a request is invalid."""
+    pass
+
+
+class EvaluationServer(ThreadingMixIn, UnixStreamServer):
+    """Evaluates testsets for clients connecting to a Unix socket.
+
+    The input is parsed, the geometries are indexed and the method backends
+    are imported once at start. Calculations of all clients share one pool
+    of worker threads, each running one calculation at a time. Backends
+    that cannot run in several threads (DTNN) get one extra thread of their
+    own and run one calculation after the other.
+
+    Every request is one line of JSON with the optional keys 'testsets'
+    (names, default all), 'overrides' (HSD paths and values), 'hsd' (path to
+    another template) and 'methods' (default all enabled). The answer is a
+    stream of JSON lines: one 'system' message per finished calculation, one
+    'testset' message per testset and method, and a final 'done' message,
+    or a single 'error' message for an invalid request.
+
+    Inputs for instantiation:
+    @:param path: Path of the Unix socket.
+    @:param plan: api.Plan object of the input.
+    @:param workers: Number of calculations running at the same time.
+    """
+
+    daemon_threads = True
+
+    def __init__(self, path, plan, workers):
+        if exists(path):
+            probe = socket(AF_UNIX, SOCK_STREAM)
+            try:
+                probe.connect(path)
+            except OSError:
+                remove(path)  # left over by a daemon that was killed
+            else:
+                raise DaemonError("Another daemon is listening on %s." % path)
+            finally:
+                probe.close()
+        self.plan = plan
+        self.methods = backends.enabled(plan.options)
+        for backend in self.methods:
+            backend.load()
+        load_template(plan.options["DFTBPlusHSD"])
+        self.pool = ThreadPoolExecutor(max(int(workers), 1))
+        self.serial = ThreadPoolExecutor(1)
+        super().__init__(path, _Handler)
+
+    def evaluate(self, request, send):
+        """Runs one evaluation request and sends its results.
+
+        Inputs:
+        @:param request: Request dictionary (see class description).
+        @:param send: Function sending one message dictionary.
+        """
+        names = request.get("testsets") or list(self.plan.testsets)
+        unknown = sorted(set(names) - set(self.plan.testsets))
+        if unknown:
+            raise DaemonError("Unknown testset(s) %s." % ", ".join(unknown))
+        testsets = {x: self.plan.testsets[x] for x in names}
+        requested = request.get("methods")
+        methods = [x for x in self.methods
+                   if requested is None or x.name in requested]
+        options = dict(self.plan.options)
+        if request.get("hsd"):
+            if not exists(request["hsd"]):
+                raise DaemonError("HSD template %s does not exist."
+                                  % request["hsd"])
+            options["DFTBPlusHSD"] = abspath(request["hsd"])
+        jobs = [api.with_overrides(x, request.get("overrides"))
+                for x in self.plan.jobs
+                if any(y[0] in testsets for y in x.aliases)]
+        start = perf_counter()
+        tmp_dir = mkdtemp(prefix="testset_daemon_")
+        drivers = {x.name: dict() for x in methods}
+        try:
+            futures = dict()
+            for backend in methods:
+                pool = self.pool if backend.concurrent else self.serial
+                for job in jobs:
+                    future = pool.submit(backend.run_jobs, [job], options,
+                                         None, tmp_dir)
+                    futures[future] = (backend.name, job)
+            for future in as_completed(futures):
+                method, job = futures[future]
+                try:
+                    drivers[method].update(future.result())
+                except Exception as exc:
+                    job.errors.setdefault(method, []).append(str(exc))
+                driver = drivers[method].get(job.key)
+                for set_name, sys_name in job.aliases:
+                    if set_name not in testsets:
+                        continue
+                    send({"type": "system", "method": method,
+                          "testset": set_name, "system": sys_name,
+                          "energy": getattr(driver, "energy", None),
+                          "errors": job.errors.get(method, [])})
+            atomics = None
+            if "DFTB+" in drivers:
+                atomics = atomic.reference_energies(
+                    testsets, options, self.plan.atomic_cache,
+                    request.get("overrides"), tmp_dir)
+        except atomic.AtomicEnergyError as exc:
+            raise DaemonError(str(exc))
+        finally:
+            rmtree(tmp_dir, ignore_errors=True)
+        wall_time = perf_counter() - start
+        for method in drivers:
+            evaluation = api.evaluation(
+                method, testsets, jobs, drivers[method], wall_time,
+                atomics if method == "DFTB+" else None)
+            for result in evaluation.testsets.values():
+                message = {"type": "testset", "method": method}
+                message.update(_encode(asdict(result)))
+                send(message)
+        send({"type": "done", "wall_time": wall_time})
+
+    def server_close(self):
+        super().server_close()
+        self.pool.shutdown(wait=False)
+        self.serial.shutdown(wait=False)
+        if exists(self.server_address):
+            remove(self.server_address)
+
+
+class _Handler(StreamRequestHandler):
+    """Answers the requests of one client connection in turn."""
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                request = json.loads(line)
+                if not isinstance(request, dict):
+                    raise DaemonError("Requests need to be JSON objects.")
+                self.server.evaluate(request, self._send)
+            except (DaemonError, ValueError) as exc:
+                self._send({"type": "error", "message": str(exc)})
+            except Exception as exc:
+                self._send({"type": "error", "message": "%s: %s"
+                            % (type(exc).__name__, exc)})
+
+    def _send(self, message):
+        self.wfile.write((json.dumps(message) + "\n").encode())
+        self.wfile.flush()
+
+
+def request(path, testsets=None, overrides=None, hsd=None, methods=None):
+    """Sends an evaluation request to a daemon and yields its answers.
+
+    Inputs:
+    @:param path: Path of the daemon's Unix socket.
+    @:param testsets: Names of the testsets to evaluate, default all.
+    @:param overrides: Dictionary of HSD paths and values for all systems.
+    @:param hsd: Path to a dftb_in.hsd template used instead of the daemon's.
+    @:param methods: Names of the methods to run, default all enabled.
+
+    @:returns generator of message dictionaries, the last one of type 'done'
+        or 'error'.
+    """
+    data = {"testsets": testsets, "overrides": overrides, "hsd": hsd,
+            "methods": methods}
+    with socket(AF_UNIX, SOCK_STREAM) as sock:
+        sock.connect(path)
+        sock.sendall((json.dumps(data) + "\n").encode())
+        with sock.makefile("r") as stream:
+            for line in stream:
+                message = json.loads(line)
+                yield message
+                if message["type"] in ("done", "error"):
+                    return
+    raise DaemonError("Daemon at %s closed the connection." % path)
+
+
+def _encode(data):
+    """Makes a result dictionary JSON compatible, NaN becomes None."""
+    encoded = dict()
+    for key, value in data.items():
+        if isinstance(value, np.ndarray):
+            value = [None if np.isnan(x) else float(x) for x in value]
+        elif isinstance(value, float) and np.isnan(value):
+            value = None
+        encoded[key] = value
+    return encoded
+
+
+if __name__ == "__main__":
+    pass
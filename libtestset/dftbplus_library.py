@@ -0,0 +1,251 @@
+from atexit import register
+from collections import OrderedDict
+from ctypes import CDLL, POINTER, Structure, byref, c_char_p, c_double
+from ctypes import c_void_p
+from libtestset import dftbplus_runner
+from libtestset.constants import UnitConversion as Units
+from libtestset.dftbplus_runner import DFTBPlusDriver
+from libtestset.hsd import HSDTemplate, is_single_point, load_template
+from os import remove
+from os.path import abspath, join
+from shutil import rmtree
+from tempfile import mkdtemp
+from threading import Lock
+
+import numpy as np
+
+MAX_INSTANCES = 8  # initialized DFTB+ instances kept per library
+# Decimals of the energy in detailed.out and of the coordinates in the
+# generated input, applied to library results to match the subprocess
+ENERGY_DECIMALS = 10
+COORD_DECIMALS = 10
+_libraries = dict()  # loaded libraries, keyed by path
+
+
+class DFTBPlusLibraryError(Exception):
+    """Error raised when libdftbplus cannot be loaded."""
+    pass
+
+
+class _DftbPlus(Structure):
+    _fields_ = [("instance", c_void_p)]
+
+
+class _DftbPlusInput(Structure):
+    _fields_ = [("pDftbPlusInput", c_void_p)]
+
+
+class DFTBPlusLibrary(object):
+    """DFTB+ loaded as shared library through its C API.
+
+    An instance of DFTB+ is set up (input parsed, Slater-Koster files read)
+    once per input and atom list and kept for the following calculations
+    of the same kind, which only pass new coordinates. The SCC of a kept
+    instance starts from the charges of its previous geometry, so results
+    agree with the executable within the SCC tolerance. At most
+    MAX_INSTANCES are kept, the least recently used one is finalized
+    first. Calls into the library are serialized, so one object can be
+    shared by all threads of a process.
+
+    Errors inside DFTB+ (e.g. a missing Slater-Koster file or an SCC that
+    does not converge with the default 'ConvergentSCCOnly = Yes') stop the
+    whole process and cannot be caught.
+
+    Inputs for instantiation:
+    @:param path: Path to libdftbplus.so.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        try:
+            self._lib = CDLL(path)
+        except OSError as exc:
+            raise DFTBPlusLibraryError("libdftbplus at %s could not be "
+                                       "loaded: %s" % (path, exc))
+        handle, data = POINTER(_DftbPlus), POINTER(c_double)
+        for name, args in (
+                ("dftbp_init", [handle, c_char_p]),
+                ("dftbp_final", [handle]),
+                ("dftbp_get_input_from_file",
+                 [handle, c_char_p, POINTER(_DftbPlusInput)]),
+                ("dftbp_process_input",
+                 [handle, POINTER(_DftbPlusInput)]),
+                ("dftbp_input_final", [POINTER(_DftbPlusInput)]),
+                ("dftbp_set_coords", [handle, data]),
+                ("dftbp_get_energy", [handle, data]),
+                ("dftbp_get_gradients", [handle, data])):
+            function = getattr(self._lib, name)
+            function.argtypes = args
+            function.restype = None
+        self._instances = OrderedDict()
+        self._lock = Lock()
+        self._log_dir = None
+        self._n_logs = 0
+
+    def accepts(self, template, overrides):
+        """Returns whether a calculation gives the same result in-process.
+
+        The C API neither runs the geometry driver nor reports the total
+        energy at finite electronic temperature (only the Mermin free
+        energy), so only single points without 'Filling' qualify. With
+        'ConvergentSCCOnly = No' DFTB+ would return unconverged energies
+        without an error the library could report, so these run with the
+        executable as well.
+        """
+        if not is_single_point(overrides):
+            return False
+        if template.settings(["Hamiltonian/Filling"], overrides):
+            return False
+        convergent = template.settings(["Hamiltonian/ConvergentSCCOnly"],
+                                       overrides)
+        return "no" not in convergent.split("=")[-1].lower()
+
+    def driver(self, template, xyz, exec_dir, overrides=None):
+        """Returns a DFTBPlusLibraryDriver using this library."""
+        return DFTBPlusLibraryDriver(self, template, xyz, exec_dir, overrides)
+
+    def evaluate(self, template, symbols, coords, overrides, hsd_file):
+        """Calculates the energy and gradients of one geometry.
+
+        Inputs:
+        @:param template: hsd.HSDTemplate object.
+        @:param symbols: Element symbols.
+        @:param coords: Nx3 coordinates in Angstrom.
+        @:param overrides: HSD overrides of the calculation.
+        @:param hsd_file: dftb_in.hsd written for this calculation, read if
+            no fitting instance is set up yet.
+
+        @:returns (energy in Hartree, Nx3 gradients in Hartree/Bohr, output
+            DFTB+ wrote during the calculation).
+        """
+        key = template.render(symbols, np.zeros((len(symbols), 3)),
+                              overrides)
+        coords = np.round(np.asarray(coords, dtype=np.float64),
+                          COORD_DECIMALS) * Units.aa2bohr
+        coords = np.ascontiguousarray(coords)
+        energy = c_double()
+        gradients = np.zeros_like(coords)
+        with self._lock:
+            instance, log = self._instance(key, hsd_file)
+            with open(log, "r") as infile:
+                infile.seek(0, 2)
+                handle = byref(instance)
+                self._lib.dftbp_set_coords(handle, _pointer(coords))
+                self._lib.dftbp_get_energy(handle, byref(energy))
+                self._lib.dftbp_get_gradients(handle, _pointer(gradients))
+                output = infile.read()
+        return energy.value, gradients, output
+
+    def close(self):
+        """Finalizes all kept DFTB+ instances."""
+        with self._lock:
+            while self._instances:
+                self._lib.dftbp_final(byref(self._instances.popitem()[1][0]))
+            if self._log_dir is not None:
+                rmtree(self._log_dir, ignore_errors=True)
+                self._log_dir = None
+
+    def _instance(self, key, hsd_file):
+        """Returns the instance set up for an input and its output file.
+
+        Instances are created if needed, the output of setting them up is
+        left in their output file.
+        """
+        if key in self._instances:
+            self._instances.move_to_end(key)
+            return self._instances[key]
+        if len(self._instances) >= MAX_INSTANCES:
+            oldest, log = self._instances.popitem(last=False)[1]
+            self._lib.dftbp_final(byref(oldest))
+            remove(log)
+        if self._log_dir is None:
+            self._log_dir = mkdtemp(prefix="dftbplus_library_")
+        self._n_logs += 1
+        log = join(self._log_dir, "%d.log" % self._n_logs)
+        open(log, "w").close()
+        instance = _DftbPlus()
+        dftb_input = _DftbPlusInput()
+        self._lib.dftbp_init(byref(instance), log.encode())
+        self._lib.dftbp_get_input_from_file(byref(instance),
+                                            hsd_file.encode(),
+                                            byref(dftb_input))
+        self._lib.dftbp_process_input(byref(instance), byref(dftb_input))
+        self._lib.dftbp_input_final(byref(dftb_input))
+        self._instances[key] = (instance, log)
+        return self._instances[key]
+
+
+class DFTBPlusLibraryDriver(DFTBPlusDriver):
+    """DFTB+ single point calculated by a DFTBPlusLibrary in-process.
+
+    Writes dftb_in.hsd to exec_dir like DFTBPlusDriver and offers the same
+    results, plus the gradients. The output DFTB+ writes during the
+    calculation is stored in dftbplus_output.log in exec_dir and checked
+    for errors like the output of the executable. Geometry steps are 0, the
+    SCC iterations are not reported by the library and stay None.
+
+    Inputs for instantiation:
+    @:param library: DFTBPlusLibrary object.
+    For the other parameters see DFTBPlusDriver.
+    """
+
+    def __init__(self, library, hsd_path, xyz, exec_dir, overrides=None,
+                 geometry=None):
+        super().__init__(library.path, hsd_path, xyz, exec_dir, overrides,
+                         geometry)
+        self.library = library
+        self.gradients = None
+
+    def _run(self):
+        """Evaluates the geometry with the library."""
+        template = self.hsd
+        if not isinstance(template, HSDTemplate):
+            template = load_template(template)
+        symbols, coords = self.geometry
+        energy, self.gradients, output = self.library.evaluate(
+            template, symbols, coords, self.overrides,
+            abspath(self._path("dftb_in.hsd")))
+        with open(self._path("dftbplus_output.log"), "w") as outfile:
+            outfile.write(output)
+        self._check_output()
+        self._energy = round(energy, ENERGY_DECIMALS) * Units.au2kcal
+        self._atoms = list(symbols)
+        self._coords = np.array(coords)
+        self.geometry_steps = 0
+
+
+def load(path):
+    """Returns the DFTBPlusLibrary of a file, loaded only once per process.
+
+    The kept instances of the library are finalized at exit.
+    """
+    if path not in _libraries:
+        _libraries[path] = DFTBPlusLibrary(path)
+        register(_libraries[path].close)
+    return _libraries[path]
+
+
+def run_jobs(jobs, hsd, executable, library, archive=None, retries=None,
+             charges=None, workdir=None):
+    """Runs a list of unique calculations, single points in-process.
+
+    Single points are calculated with libdftbplus, all other calculations
+    (geometry optimizations, staged or warm started runs) with the DFTB+
+    executable as by dftbplus_runner.run_jobs(), whose inputs are the same
+    apart from the library. With retries (FaultTolerance) all calculations
+    use the executable, as errors inside the library stop the process.
+
+    @:param library: Path to libdftbplus.so.
+
+    @:returns Dictionary of job keys and finished driver objects.
+    """
+    return dftbplus_runner.run_jobs(jobs, hsd, executable, archive, retries,
+                                    charges, workdir, load(library))
+
+
+def _pointer(array):
+    return array.ctypes.data_as(POINTER(c_double))
+
+
+if __name__ == "__main__":
+    pass
@@ -1,11 +1,16 @@
 from libtestset.constants import UnitConversion as Units
-from os import chdir, environ, getcwd, scandir
+from libtestset.geometry import XYZError, read_geometry
+from libtestset.hsd import HSDTemplate, is_single_point, load_template
+from libtestset.jobs import collect_jobs, distribute, run_with_retries
+from libtestset.stages import STAGE_DIR
+from os import environ
 from os.path import isfile, join
 from pathlib import Path
 from random import choice
-from shutil import copy2, rmtree
+from shutil import copyfile, rmtree
 from string import ascii_lowercase
 from subprocess import CalledProcessError
+from time import perf_counter
 
 import numpy as np
 import subprocess
@@ -24,11 +29,6 @@ class DFTBPlusRunnerError(Exception):
         super().__init__(msg)
 
 
-class XYZError(Exception):
-    """Error raised when the input XYZ file is corrupt."""
-    pass
-
-
 class DFTBPlusDriver(object):
     """Runs DFTB+ calculations.
 
@@ -37,34 +37,66 @@ class DFTBPlusDriver(object):
 
     Inputs for instantiation:
     @:param executable: Path to the executable DFTB+ binary.
-    @:param hsd_path: Path to the dftb_in.hsd template.
+    @:param hsd_path: Path to the dftb_in.hsd template or HSDTemplate object.
     @:param xyz: Path to xyz geometry file.
     @:param exec_dir: Directory to run the calculation in.
+    @:param overrides: Optional dictionary of HSD paths and values to change
+        in the template for this calculation (e.g. "Hamiltonian/Charge").
+    @:param geometry: Optional (element symbols, coordinates) tuple used
+        instead of the geometry in xyz, e.g. from an earlier stage.
     """
 
-    def __init__(self, executable, hsd_path, xyz, exec_dir):
+    def __init__(self, executable, hsd_path, xyz, exec_dir, overrides=None,
+                 geometry=None):
         self.exe = executable
         self.hsd = hsd_path
+        self.overrides = overrides
         self.xyz = xyz
+        self.geometry = geometry
         self.exec_dir = exec_dir
-        self.base_dir = getcwd()
         self._energy = None
         self._atoms = []
         self._coords = []
+        self.wall_time = None
+        self.scc_iterations = None
+        self.geometry_steps = None
+        self.stage_steps = None  # geometry steps per stage if staged
+        self.reference = None  # single stage result if checked
+        self.warm_start = False  # started from stored charges
+        self.cold_iterations = None  # SCC iterations without warm start
 
     def run(self):
-        """Sets up the directory and runs the DFTB+ calculation."""
+        """Sets up the directory and runs the DFTB+ calculation.
+
+        DFTB+ runs in exec_dir, the working directory of the calling process
+        is left untouched.
+        """
         Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
         self._write_inputs()
-        chdir(self.exec_dir)
-        with open("dftbplus_output.log", "w") as fid:
+        start = perf_counter()
+        self._run()
+        self.wall_time = perf_counter() - start
+
+    def _path(self, filename):
+        """Returns the path of a file in the calculation directory."""
+        return join(self.exec_dir, filename)
+
+    def _run(self):
+        """Runs DFTB+ in the calculation directory and checks its output."""
+        with open(self._path("dftbplus_output.log"), "w") as fid:
             try:
                 subprocess.run([self.exe], stdout=fid, stderr=fid, env=environ,
-                               cwd=getcwd(), check=True, shell=True)
+                               cwd=self.exec_dir, check=True, shell=True)
             except CalledProcessError:
                 msg = "DFTB+ crashed on runtime, please check your input file!"
                 raise DFTBPlusRunnerError(self.exec_dir, msg)
-        with open("dftbplus_output.log", "r") as fid:
+        self._check_output()
+        self._parse_log()
+        self._parse_iterations()
+
+    def _check_output(self):
+        """Raises DFTBPlusRunnerError for errors in dftbplus_output.log."""
+        with open(self._path("dftbplus_output.log"), "r") as fid:
             for line in fid:
                 if "Error" in line or "ERROR" in line:
                     raise DFTBPlusRunnerError(self.exec_dir)
@@ -77,8 +109,6 @@ class DFTBPlusDriver(object):
                     msg = ("Geometry did not converge, check your "
                            "geometry or convergence criteria!")
                     raise DFTBPlusRunnerError(self.exec_dir, msg)
-        self._parse_log()
-        chdir(self.base_dir)
 
     @property
     def energy(self):
@@ -162,24 +192,45 @@ class DFTBPlusDriver(object):
         return geom
 
     def _write_inputs(self):
-        """Writes input for DFTB+ calculation."""
-        copy2(self.hsd, self.exec_dir)
-        self.xyz2gen(self.xyz, join(self.exec_dir, "in.gen"))
+        """Writes dftb_in.hsd with embedded geometry for DFTB+ calculation."""
+        template = self.hsd
+        if not isinstance(template, HSDTemplate):
+            template = load_template(template)
+        if self.geometry is None:
+            self.geometry = read_geometry(self.xyz)
+        symbols, coords = self.geometry
+        template.write(join(self.exec_dir, "dftb_in.hsd"), symbols, coords,
+                       self.overrides)
 
     def _parse_log(self):
-        """Reads DFTB+ detailed.out and sets needed values in object."""
-        with open("detailed.out", "r") as log:
-            for line in log:
-                if "Total energy:" in line:
-                    splt = line.split()
-                    self._energy = float(splt[2]) * Units.au2kcal
-        if not isfile("geo_end.xyz"):
-            msg = ("DFTB+ calculations in %s did not produce a geometry output "
+        """Reads DFTB+ detailed.out and sets needed values in object.
+
+        Single point calculations keep the input geometry.
+        """
+        try:
+            with open(self._path("detailed.out"), "r") as log:
+                for line in log:
+                    if "Total energy:" in line:
+                        splt = line.split()
+                        self._energy = float(splt[2]) * Units.au2kcal
+        except (OSError, IndexError, ValueError) as exc:
+            msg = "DFTB+ output detailed.out could not be read: %s" % exc
+            raise DFTBPlusRunnerError(self.exec_dir, msg)
+        if self._energy is None:
+            msg = "DFTB+ output detailed.out contains no total energy."
+            raise DFTBPlusRunnerError(self.exec_dir, msg)
+        if is_single_point(self.overrides):
+            self._atoms = list(self.geometry[0])
+            self._coords = np.array(self.geometry[1])
+            return
+        if not isfile(self._path("geo_end.xyz")):
+            msg = ("DFTB+ calculation did not produce a geometry output "
                    "file. Use the 'Driver' option in the DFTB+ input file for "
-                   "geometry optimizations!")
-            raise DFTBPlusRunnerError(msg % self.exec_dir)
+                   "geometry optimizations or 'calculation: single_point' in "
+                   "the testset!")
+            raise DFTBPlusRunnerError(self.exec_dir, msg)
         vecs = []  # will be coordinates
-        with open("geo_end.xyz", "r") as xyz:
+        with open(self._path("geo_end.xyz"), "r") as xyz:
             for line in xyz:
                 splt = line.split()
                 if len(splt) != 5:
@@ -188,6 +239,26 @@ class DFTBPlusDriver(object):
                 self._atoms.append(splt[0])
         self._coords = np.asarray(vecs)
 
+    def _parse_iterations(self):
+        """Counts the geometry steps and SCC iterations in the log."""
+        iterations = 0
+        steps = 0
+        in_table = False
+        with open(self._path("dftbplus_output.log"), "r") as log:
+            for line in log:
+                splt = line.split()
+                if line.lstrip().startswith("Geometry step:"):
+                    steps += 1
+                    in_table = False
+                elif "iSCC" in splt:
+                    in_table = True
+                elif in_table and splt and splt[0].isdigit():
+                    iterations += 1
+                else:
+                    in_table = False
+        self.scc_iterations = iterations
+        self.geometry_steps = steps
+
 
 def run_testset(set_definition, hsd, executable):
     """Runs all systems in a given testset.
@@ -200,18 +271,144 @@ def run_testset(set_definition, hsd, executable):
 
     @:returns Dictionary of systems and their total energies in kcal/mol.
     """
-    set_path = join(getcwd(), set_definition["path"])
-    systems = dict()
-    for entry in scandir(set_path):
-        if entry.is_file() and entry.name.endswith(".xyz"):
-            sys_name = entry.name[:-4]
-            xyz = entry.path
-            exec_dir = get_random_folder(prefix="dftb+_run_")
-            driver = DFTBPlusDriver(executable, hsd, xyz, exec_dir)
+    jobs = collect_jobs({"testset": set_definition})
+    return distribute(jobs, run_jobs(jobs, hsd, executable))["testset"]
+
+
+def run_jobs(jobs, hsd, executable, archive=None, retries=None,
+             charges=None, workdir=None, library=None):
+    """Runs a list of unique calculations.
+
+    Inputs:
+    @:param jobs: List of jobs.Job objects.
+    @:param hsd: Path to dftb_in.hsd
+    @:param executable: Path to DFTB+ executable.
+    @:param archive: Optional archive.OutputArchive keeping output files of
+        every calculation before its directory is removed.
+    @:param retries: None to stop at the first failed calculation, otherwise
+        list of HSD override dictionaries to retry failed calculations with
+        (see jobs.run_with_retries()). Directories of failed calculations
+        are kept.
+    @:param charges: Optional charges.ChargeStore to start the SCC from the
+        charges of earlier calculations of the same systems.
+    @:param workdir: Directory for the calculation directories, defaults to
+        the current working directory.
+    @:param library: Optional dftbplus_library.DFTBPlusLibrary calculating
+        the single points it accepts in-process (not with retries or
+        charges, errors inside the library stop the process).
+
+    @:returns Dictionary of job keys and finished DFTBPlusDriver objects.
+    """
+    template = load_template(hsd)
+
+    def run_job(job, overrides):
+        exec_dir = join(workdir or "", get_random_folder(prefix="dftb+_run_"))
+        if (library is not None and retries is None and charges is None
+                and not job.staged and library.accepts(template, overrides)):
+            driver = library.driver(template, job.xyz, exec_dir, overrides)
             driver.run()
-            systems[sys_name] = driver
-            rmtree(exec_dir)
-    return systems
+        elif charges is None:
+            driver = run_staged(executable, template, job.xyz, exec_dir,
+                                overrides, job.staged)
+        else:
+            driver = run_warm(job, overrides, exec_dir)
+        if job.staged and job.staged["check"]:
+            driver.reference = run_reference(job, overrides)
+        if archive is not None:
+            archive.add(job.aliases, exec_dir, method="DFTB+",
+                        variants=job.variants)
+        rmtree(exec_dir)
+        return driver
+
+    def run_warm(job, overrides, exec_dir):
+        key = charges.key(job, template, overrides)
+        first_dir = join(exec_dir, STAGE_DIR) if job.staged else exec_dir
+        warm = charges.get(key, first_dir)
+        if warm:
+            try:
+                driver = run_staged(executable, template, job.xyz, exec_dir,
+                                    overrides, job.staged, warm=True)
+            except DFTBPlusRunnerError:
+                # Stored charges do not fit after all, start from scratch
+                charges.discard(key)
+                rmtree(exec_dir)
+                warm = False
+        if not warm:
+            driver = run_staged(executable, template, job.xyz, exec_dir,
+                                overrides, job.staged)
+        charges.put(key, exec_dir, driver.scc_iterations, warm)
+        driver.warm_start = warm
+        driver.cold_iterations = charges.cold_iterations(key)
+        return driver
+
+    def run_reference(job, overrides):
+        exec_dir = join(workdir or "", get_random_folder(prefix="dftb+_ref_"))
+        driver = DFTBPlusDriver(executable, template, job.xyz, exec_dir,
+                                overrides)
+        driver.run()
+        rmtree(exec_dir)
+        return {"energy": driver.energy,
+                "geometry_steps": driver.geometry_steps,
+                "wall_time": driver.wall_time}
+
+    return run_with_retries(jobs, run_job, DFTBPlusRunnerError, "DFTB+",
+                            retries)
+
+
+def run_staged(executable, template, xyz, exec_dir, overrides=None,
+               staged=None, warm=False):
+    """Runs one calculation, optionally as two stage geometry optimization.
+
+    If staged settings are given, the geometry is first relaxed with the
+    loose settings of staged["hsd"] in the subdirectory stage_1 of exec_dir.
+    The final optimization with the given overrides runs in exec_dir and
+    starts from the geometry and charges of the first stage.
+
+    Inputs:
+    @:param executable: Path to DFTB+ executable.
+    @:param template: hsd.HSDTemplate object or path to dftb_in.hsd.
+    @:param xyz: Path to xyz geometry file.
+    @:param exec_dir: Directory to run the calculation in.
+    @:param overrides: HSD overrides of the calculation.
+    @:param staged: None or the normalized 'staged' testset setting.
+    @:param warm: Start the first SCC from the charges.bin already present in
+        the directory of the first stage.
+
+    @:returns finished DFTBPlusDriver of the final stage, geometry steps,
+        SCC iterations and wall time include the first stage.
+    """
+    geometry = None
+    first = None
+    if staged:
+        loose = dict(overrides or dict())
+        loose.update(staged["hsd"])
+        stage_dir = join(exec_dir, STAGE_DIR)
+        first = _run_driver(executable, template, xyz, stage_dir, loose,
+                            warm)
+        geometry = (first.atoms, first.coordinates)
+        warm = isfile(join(stage_dir, "charges.bin"))
+        if warm:
+            copyfile(join(stage_dir, "charges.bin"),
+                     join(exec_dir, "charges.bin"))
+    driver = _run_driver(executable, template, xyz, exec_dir, overrides,
+                         warm, geometry)
+    if first is not None:
+        driver.stage_steps = [first.geometry_steps, driver.geometry_steps]
+        driver.geometry_steps += first.geometry_steps
+        driver.scc_iterations += first.scc_iterations
+        driver.wall_time += first.wall_time
+    return driver
+
+
+def _run_driver(executable, template, xyz, exec_dir, overrides, warm,
+                geometry=None):
+    if warm:
+        overrides = dict(overrides or dict())
+        overrides["Hamiltonian/ReadInitialCharges"] = True
+    driver = DFTBPlusDriver(executable, template, xyz, exec_dir, overrides,
+                            geometry)
+    driver.run()
+    return driver
 
 
 def get_random_folder(prefix="", length=8):
@@ -1,20 +1,27 @@
+from ase import Atoms
 from ase.calculators import dftb, mixing
-from ase.io import read
 from ase.optimize import BFGS
 from io import StringIO
 from libtestset.constants import UnitConversion as Units
-from os import chdir, environ, getcwd, scandir
+from libtestset.geometry import read_geometry
+from libtestset.hsd import is_single_point
+from libtestset.jobs import collect_jobs, distribute, run_with_retries
+from libtestset.stages import FMAX
+from os import environ
 from os.path import join
 from pathlib import Path
 from random import choice
 from schnetpack.interfaces.ase_interface import SpkCalculator
 from shutil import rmtree
 from string import ascii_lowercase
+from time import perf_counter
 
 import libtestset.constants as c
 import sys
 import torch
 
+_models = dict()  # loaded DTNN models, keyed by path
+
 
 class DTNNRunnerError(Exception):
     """Error raised when DTNN calculation goes wrong."""
@@ -96,32 +103,56 @@ class DTNNDriver(object):
     @:param exe: DFTB+ executable
     @:param skf: Path to Slater-Koster parameter files.
     @:param exec_dir: Directory to run the calculation in.
+    @:param fmax: Force thresholds in eV/Angstrom of the successive BFGS
+        optimization stages, each starting from the previous geometry. An
+        empty tuple only calculates the energy of the input geometry.
     """
 
-    def __init__(self, model, xyz, exe, skf, exec_dir):
+    def __init__(self, model, xyz, exe, skf, exec_dir, fmax=(FMAX,)):
         self._model_path = model
         self.xyz = xyz
-        self.ase_atoms = read(xyz)
+        symbols, coords = read_geometry(xyz)
+        self.ase_atoms = Atoms(symbols=symbols, positions=coords)
         self.exec_dir = exec_dir
-        self.base_dir = getcwd()
+        self.fmax = fmax
         self._energy = None
         self._coords = None
         self._atoms = None
         self._model = None
         self._schnet_calc = None
+        self.wall_time = None
+        self.geometry_steps = None
+        self.stage_steps = None  # geometry steps per stage if staged
+        self.reference = None  # single stage result if checked
         environ["DFTB_COMMAND"] = exe
         environ["DFTB_PREFIX"] = skf
 
     def run(self):
-        """Sets up the directory and runs the DTNN calculation."""
-        with CaptureSTDERR() as errors:
-            self._model = torch.load(self._model_path, map_location="cuda")
-            self._schnet_calc = SpkCalculator(self._model, device='cuda',
-                                              energy="ErepD3", forces="FOR3")
+        """Sets up the directory and runs the DTNN calculation.
+
+        Failures of ASE, SchNetPack or DFTB+ are raised as DTNNRunnerError.
+        """
         Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
-        chdir(self.exec_dir)
+        try:
+            with CaptureSTDERR() as errors:
+                self._model = load_model(self._model_path)
+                self._schnet_calc = SpkCalculator(self._model, device='cuda',
+                                                  energy="ErepD3",
+                                                  forces="FOR3")
+            start = perf_counter()
+            self._run(errors)
+        except DTNNRunnerError:
+            raise
+        except Exception as exc:
+            msg = "DTNN calculation failed: %s: %s" % (type(exc).__name__,
+                                                         exc)
+            raise DTNNRunnerError(self.exec_dir, msg)
+        self.wall_time = perf_counter() - start
+
+    def _run(self, errors):
+        """Runs the optimization in the calculation directory."""
         ase_dftb = dftb.Dftb(
-            label="dftb_calculator",
+            label=join(self.exec_dir, "dftb_calculator"),
             atoms=self.ase_atoms,
             run_manyDftb_steps=True,
             Hamiltonian_SCC="Yes",
@@ -137,22 +168,28 @@ class DTNNDriver(object):
             Analysis_CalculateForces="Yes")
         mix = mixing.SumCalculator([ase_dftb, self._schnet_calc])
         self.ase_atoms.set_calculator(mix)
-        opt = BFGS(self.ase_atoms, logfile="BFGS_optimization.log")
+        opt = BFGS(self.ase_atoms,
+                   logfile=join(self.exec_dir, "BFGS_optimization.log"))
         # Redirect opt.run() STDOUT and STERR prints to file
+        steps = []
         with CaptureSTDOUT() as outputs, CaptureSTDERR(errors) as errors:
-            opt.run(fmax=0.00005)
+            for fmax in self.fmax:
+                opt.run(fmax=fmax)
+                steps.append(opt.nsteps - sum(steps))
         opt.logfile.close()
+        self.geometry_steps = opt.nsteps
+        if len(steps) > 1:
+            self.stage_steps = steps
         ev2kcal = Units.ev2au * Units.au2kcal
         self._energy = self.ase_atoms.get_total_energy()[0] * ev2kcal
         self._coords = self.ase_atoms.get_positions()
         self._atoms = list(self.ase_atoms.symbols)
-        with open("BFGS_output.log", "w") as outfile:
+        with open(join(self.exec_dir, "BFGS_output.log"), "w") as outfile:
             for line in outputs:
                 outfile.write(line)
-        with open("BFGS_stderr.log", "w") as errfile:
+        with open(join(self.exec_dir, "BFGS_stderr.log"), "w") as errfile:
             for line in errors:
                 errfile.write(line)
-        chdir(self.base_dir)
 
     @property
     def energy(self):
@@ -188,18 +225,62 @@ def run_testset(set_definition, model, dftbplus, skf):
 
     @:returns Dictionary of systems and their total energies in kcal/mol.
     """
-    set_path = join(getcwd(), set_definition["path"])
-    systems = dict()
-    for entry in scandir(set_path):
-        if entry.is_file() and entry.name.endswith(".xyz"):
-            sys_name = entry.name[:-4]
-            xyz = entry.path
-            exec_dir = get_random_folder(prefix="dtnn_run_")
-            driver = DTNNDriver(model, xyz, dftbplus, skf, exec_dir)
-            driver.run()
-            systems[sys_name] = driver
-            rmtree(exec_dir)
-    return systems
+    jobs = collect_jobs({"testset": set_definition})
+    return distribute(jobs, run_jobs(jobs, model, dftbplus, skf))["testset"]
+
+
+def run_jobs(jobs, model, dftbplus, skf, archive=None,
+             fault_tolerant=False, workdir=None):
+    """Runs a list of unique calculations.
+
+    Inputs:
+    @:param jobs: List of jobs.Job objects.
+    @:param model: Path to the DTNN model file.
+    @:param executable: Path to DFTB+ executable.
+    @:param skf: Path to skf parameter files.
+    @:param archive: Optional archive.OutputArchive keeping output files of
+        every calculation before its directory is removed.
+    @:param fault_tolerant: Record failed calculations in Job.errors and go
+        on with the remaining ones instead of raising the error.
+    @:param workdir: Directory for the calculation directories, defaults to
+        the current working directory.
+
+    @:returns Dictionary of job keys and finished DTNNDriver objects.
+    """
+    def run_job(job, _overrides):
+        exec_dir = join(workdir or "", get_random_folder(prefix="dtnn_run_"))
+        fmax = (FMAX,)
+        if is_single_point(job.overrides):
+            fmax = ()
+        elif job.staged:
+            fmax = (job.staged["fmax"], FMAX)
+        driver = DTNNDriver(model, job.xyz, dftbplus, skf, exec_dir, fmax)
+        driver.run()
+        if job.staged and job.staged["check"]:
+            driver.reference = run_reference(job)
+        if archive is not None:
+            archive.add(job.aliases, exec_dir, method="DTNN")
+        rmtree(exec_dir)
+        return driver
+
+    def run_reference(job):
+        exec_dir = join(workdir or "", get_random_folder(prefix="dtnn_ref_"))
+        driver = DTNNDriver(model, job.xyz, dftbplus, skf, exec_dir)
+        driver.run()
+        rmtree(exec_dir)
+        return {"energy": driver.energy,
+                "geometry_steps": driver.geometry_steps,
+                "wall_time": driver.wall_time}
+
+    retries = [] if fault_tolerant else None
+    return run_with_retries(jobs, run_job, DTNNRunnerError, "DTNN", retries)
+
+
+def load_model(path):
+    """Returns the DTNN model of a file, loaded only once per process."""
+    if path not in _models:
+        _models[path] = torch.load(path, map_location="cuda")
+    return _models[path]
 
 
 def get_random_folder(prefix="", length=8):
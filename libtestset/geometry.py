@@ -0,0 +1,397 @@
+from hashlib import sha1
+from libtestset.constants import element_symbols
+from os import getpid, replace, scandir, stat
+from os.path import abspath, basename, dirname, isfile, join, splitext
+
+import numpy as np
+import re
+
+INDEX_FILE = ".geometry_index.npz"
+DATASET_SUFFIXES = (".xyz", ".h5", ".hdf5", ".db")
+CHUNK_SIZE = 10000  # frames of a dataset file held in lists while indexing
+_NAME = re.compile(r"""\bname=(?:"([^"]*)"|'([^']*)'|(\S+))""")
+_ATOMIC_NUMBERS = {sym.lower(): num for num, sym in enumerate(element_symbols)}
+_indices = dict()  # in-memory cache of loaded GeometryIndex objects
+
+
+class XYZError(Exception):
+    """Error raised when the input XYZ file is corrupt."""
+    pass
+
+
+class GeometryIndex(object):
+    """Parsed geometries of one testset directory or dataset file.
+
+    All geometries are held in flat NumPy arrays: atomic numbers as uint8
+    and coordinates as one contiguous (N, 3) float64 block. The atoms of
+    system i are found at offsets[i]:offsets[i + 1].
+
+    Inputs for instantiation:
+    @:param path: Directory or dataset file the geometries were read from.
+    @:param names: List of system names (xyz file names without suffix or
+        frame names of a dataset file).
+    @:param numbers: Atomic numbers of all atoms.
+    @:param coordinates: Coordinates of all atoms in Angstrom.
+    @:param offsets: Start offset of each system plus the total atom count.
+    @:param errors: Dictionary of corrupt systems and their error messages.
+    @:param fingerprint: Hash of the directory or file state the index
+        belongs to.
+    """
+
+    def __init__(self, path, names, numbers, coordinates, offsets, errors,
+                 fingerprint):
+        self.path = path
+        self.names = list(names)
+        self.numbers = numbers
+        self.coordinates = coordinates
+        self.offsets = offsets
+        self.errors = dict(errors)
+        self.fingerprint = fingerprint
+        self._lookup = {name: i for i, name in enumerate(self.names)}
+
+    def __contains__(self, name):
+        return name in self._lookup
+
+    def __len__(self):
+        return len(self.names)
+
+    def index(self, name):
+        """Returns the position of a system in the index."""
+        if name in self.errors:
+            raise XYZError(self.errors[name])
+        try:
+            return self._lookup[name]
+        except KeyError:
+            msg = "No geometry for system '%s' found in %s."
+            raise XYZError(msg % (name, self.path))
+
+    def get(self, name):
+        """Returns (atomic numbers, coordinates) views of a system."""
+        i = self.index(name)
+        start, end = self.offsets[i], self.offsets[i + 1]
+        return self.numbers[start:end], self.coordinates[start:end]
+
+    def order(self, names):
+        """Returns names sorted by their position, unknown ones last."""
+        return sorted(names, key=lambda x: (self._lookup.get(x, len(self)),
+                                            x))
+
+    def symbols(self, name):
+        """Returns the element symbols of a system as list of strings."""
+        return [element_symbols[x] for x in self.get(name)[0]]
+
+    def element_counts(self, name):
+        """Returns dictionary of lower case element symbols and amounts."""
+        numbers, counts = np.unique(self.get(name)[0], return_counts=True)
+        return {element_symbols[x].lower(): int(n)
+                for x, n in zip(numbers, counts)}
+
+
+def load_index(path):
+    """Returns the GeometryIndex of a directory or a dataset file.
+
+    The index is taken from memory or from the sidecar file next to the
+    geometries if it is still up to date, otherwise the geometries are parsed
+    once and the sidecar file is rewritten.
+
+    Dataset files hold all systems of a testset in one file: multi-frame XYZ
+    (.xyz), HDF5 (.h5, .hdf5, needs h5py) or ASE database (.db, needs ASE).
+    They are read frame by frame, see read_frames().
+
+    Inputs:
+    @:param path: Directory containing xyz files or dataset file.
+    """
+    path = abspath(path)
+    entries = _entries(path)
+    digest = fingerprint(path, entries)
+    index = _indices.get(path)
+    if index is None or index.fingerprint != digest:
+        index = _read_sidecar(path, digest)
+    if index is None:
+        if isfile(path):
+            frames = read_frames(path)
+        else:
+            frames = _directory_frames(path, [x[0] for x in entries])
+        index = _build_index(path, frames, digest)
+        _write_sidecar(index)
+    _indices[path] = index
+    return index
+
+
+def fingerprint(path, entries=None):
+    """Returns a hash of the geometry files of a directory or dataset file.
+
+    The hash covers names, sizes and modification times of the files.
+    """
+    if entries is None:
+        entries = _entries(abspath(path))
+    digest = sha1()
+    for name, info in entries:
+        digest.update(("%s %d %d\n" % (name, info.st_size, info.st_mtime_ns))
+                      .encode())
+    return digest.hexdigest()
+
+
+def is_dataset(path):
+    """Returns whether a path is a dataset file of a known format."""
+    return isfile(path) and splitext(path)[1].lower() in DATASET_SUFFIXES
+
+
+def read_frames(path):
+    """Reads the systems of a dataset file one after another.
+
+    System names are taken from 'name=' in the comment lines of XYZ frames,
+    a 'names' dataset of HDF5 files or the 'name' key of ASE database rows,
+    otherwise the position in the file (starting at 0) is used.
+
+    HDF5 files hold the flat datasets 'numbers' (atomic numbers of all
+    atoms), 'positions' (coordinates of all atoms in Angstrom, Nx3) and
+    'offsets' (start of each system plus the total atom count).
+
+    Inputs:
+    @:param path: Path to the dataset file.
+
+    @:returns generator of (name, atomic numbers, coordinates, error)
+        tuples, numbers and coordinates are None for corrupt frames.
+    """
+    suffix = splitext(path)[1].lower()
+    if suffix == ".xyz":
+        return _xyz_frames(path)
+    elif suffix in (".h5", ".hdf5"):
+        return _hdf5_frames(path)
+    elif suffix == ".db":
+        return _ase_frames(path)
+    raise XYZError("Unknown dataset format of %s, use one of %s."
+                   % (path, ", ".join(DATASET_SUFFIXES)))
+
+
+def read_geometry(xyz):
+    """Returns (element symbols, coordinates) of a single xyz file.
+
+    Uses the index of the file's directory, so the directory is parsed only
+    once no matter how many of its files are requested. Systems of dataset
+    files are addressed as '<dataset file>/<system name>.xyz'.
+    """
+    name = basename(xyz)
+    if not name.endswith(".xyz"):
+        numbers, coords = parse_xyz(xyz)
+        return [element_symbols[x] for x in numbers], coords
+    index = load_index(dirname(abspath(xyz)))
+    return index.symbols(name[:-4]), index.get(name[:-4])[1]
+
+
+def parse_xyz(xyz):
+    """Parses a xyz-file into atomic numbers and a coordinate array.
+
+    Inputs:
+    @:param xyz: Path to xyz file.
+
+    @:returns (uint8 array of atomic numbers, Nx3 float64 array).
+    """
+    with open(xyz, "r") as xyz_in:
+        lines = xyz_in.read().splitlines()
+    try:
+        n_atoms = int(lines[0])
+    except (IndexError, ValueError):
+        raise XYZError("XYZ geometry file %s has no atom count in line one!"
+                       % xyz)
+    return _parse_atoms(lines[2:2 + n_atoms], n_atoms, xyz)
+
+
+def _parse_atoms(lines, n_atoms, where):
+    """Parses the atom lines of one xyz geometry."""
+    numbers = []
+    coords = []
+    for line in lines:
+        splt = line.split()
+        if len(splt) < 4:
+            break
+        symbol = splt[0].rstrip("0123456789").lower()
+        if symbol not in _ATOMIC_NUMBERS:
+            raise XYZError("Unknown element '%s' in XYZ geometry file %s!"
+                           % (splt[0], where))
+        numbers.append(_ATOMIC_NUMBERS[symbol])
+        coords.append([float(x) for x in splt[1:4]])
+    if n_atoms != len(numbers):
+        msg = ("XYZ geometry file %s corrupt! Number of atoms in line one "
+               "does not match number of given coordinate vectors.")
+        raise XYZError(msg % where)
+    return (np.asarray(numbers, dtype=np.uint8),
+            np.asarray(coords, dtype=np.float64).reshape(-1, 3))
+
+
+def _entries(path):
+    """Returns names and stat results of the geometry files of a path."""
+    if isfile(path):
+        return [(basename(path), stat(path))]
+    return sorted((entry.name, entry.stat()) for entry in scandir(path)
+                  if entry.is_file() and entry.name.endswith(".xyz"))
+
+
+def _directory_frames(path, filenames):
+    for filename in filenames:
+        try:
+            numbers, coords = parse_xyz(join(path, filename))
+        except (XYZError, ValueError) as exc:
+            yield filename[:-4], None, None, str(exc)
+            continue
+        yield filename[:-4], numbers, coords, None
+
+
+def _xyz_frames(path):
+    with open(path, "r") as xyz_in:
+        frame = 0
+        for line in xyz_in:
+            if not line.strip():
+                continue  # blank lines between or after frames
+            try:
+                n_atoms = int(line)
+            except ValueError:
+                raise XYZError("Dataset %s corrupt! No atom count at frame "
+                               "%d." % (path, frame))
+            comment = xyz_in.readline()
+            lines = [xyz_in.readline() for _i in range(n_atoms)]
+            match = _NAME.search(comment)
+            name = str(frame)
+            if match:
+                name = next(x for x in match.groups() if x is not None)
+            where = "%s (frame %d)" % (path, frame)
+            frame += 1
+            try:
+                numbers, coords = _parse_atoms(lines, n_atoms, where)
+            except (XYZError, ValueError) as exc:
+                yield name, None, None, str(exc)
+                continue
+            yield name, numbers, coords, None
+
+
+def _hdf5_frames(path):
+    try:
+        import h5py
+    except ImportError:
+        raise XYZError("Reading the HDF5 dataset %s needs h5py." % path)
+    with h5py.File(path, "r") as data:
+        try:
+            offsets = data["offsets"][()]
+            numbers = data["numbers"]
+            positions = data["positions"]
+        except KeyError as exc:
+            raise XYZError("HDF5 dataset %s has no %s." % (path, exc))
+        names = data["names"] if "names" in data else None
+        n_systems = len(offsets) - 1
+        for first in range(0, n_systems, CHUNK_SIZE):
+            last = min(first + CHUNK_SIZE, n_systems)
+            start, end = offsets[first], offsets[last]
+            chunk_numbers = numbers[start:end].astype(np.uint8)
+            chunk_coords = positions[start:end].astype(np.float64)
+            chunk_names = names[first:last] if names is not None else None
+            for i in range(first, last):
+                name = str(i)
+                if chunk_names is not None:
+                    name = chunk_names[i - first]
+                    if isinstance(name, bytes):
+                        name = name.decode()
+                begin, stop = offsets[i] - start, offsets[i + 1] - start
+                yield (name, chunk_numbers[begin:stop],
+                       chunk_coords[begin:stop].reshape(-1, 3), None)
+
+
+def _ase_frames(path):
+    try:
+        from ase.db import connect
+    except ImportError:
+        raise XYZError("Reading the ASE database %s needs ASE." % path)
+    for row in connect(path).select():
+        yield (str(row.get("name", row.id)),
+               np.asarray(row.numbers, dtype=np.uint8),
+               np.asarray(row.positions, dtype=np.float64), None)
+
+
+def _build_index(path, frames, fingerprint):
+    """Collects frames into a GeometryIndex.
+
+    The frames are gathered in chunks of CHUNK_SIZE that are joined into
+    contiguous arrays right away, so memory stays close to the size of the
+    final index also for very large datasets.
+    """
+    names = []
+    numbers = []
+    coords = []
+    counts = []
+    errors = dict()
+    chunk = []
+
+    def flush():
+        if chunk:
+            numbers.append(np.concatenate([x[0] for x in chunk]))
+            coords.append(np.concatenate([x[1] for x in chunk]))
+            counts.extend(len(x[0]) for x in chunk)
+            del chunk[:]
+
+    for name, frame_numbers, frame_coords, error in frames:
+        if error is not None:
+            errors[name] = error
+            continue
+        names.append(name)
+        chunk.append((frame_numbers, frame_coords))
+        if len(chunk) == CHUNK_SIZE:
+            flush()
+    flush()
+    seen = set()
+    for name in names:
+        if name in seen:
+            errors[name] = "System name '%s' used twice in %s." % (name, path)
+        seen.add(name)
+    offsets = np.zeros(len(counts) + 1, dtype=np.int64)
+    np.cumsum(counts, out=offsets[1:])
+    if names:
+        numbers = np.concatenate(numbers).astype(np.uint8)
+        coords = np.ascontiguousarray(np.concatenate(coords))
+    else:
+        numbers = np.zeros(0, dtype=np.uint8)
+        coords = np.zeros((0, 3), dtype=np.float64)
+    return GeometryIndex(path, names, numbers, coords, offsets, errors,
+                         fingerprint)
+
+
+def _sidecar(path):
+    """Returns the path of the index file of a directory or dataset file."""
+    if isfile(path):
+        return join(dirname(path), ".%s%s" % (basename(path), INDEX_FILE))
+    return join(path, INDEX_FILE)
+
+
+def _read_sidecar(path, fingerprint):
+    try:
+        with np.load(_sidecar(path)) as data:
+            if str(data["fingerprint"]) != fingerprint:
+                return None
+            errors = zip(data["error_names"].tolist(),
+                         data["error_messages"].tolist())
+            return GeometryIndex(path, data["names"].tolist(),
+                                 data["numbers"], data["coordinates"],
+                                 data["offsets"], errors, fingerprint)
+    except (OSError, KeyError, ValueError):
+        return None
+
+
+def _write_sidecar(index):
+    """Writes the index next to the geometries, skipped if not writable."""
+    target = _sidecar(index.path)
+    tmp = "%s.%d.tmp.npz" % (target, getpid())
+    try:
+        np.savez(tmp, fingerprint=np.str_(index.fingerprint),
+                 names=np.asarray(index.names, dtype=np.str_),
+                 numbers=index.numbers, coordinates=index.coordinates,
+                 offsets=index.offsets,
+                 error_names=np.asarray(list(index.errors.keys()),
+                                        dtype=np.str_),
+                 error_messages=np.asarray(list(index.errors.values()),
+                                           dtype=np.str_))
+        replace(tmp, target)
+    except OSError:
+        pass
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,325 @@
+from copy import deepcopy
+from os import stat
+from os.path import abspath
+
+import re
+
+_TOKENS = re.compile(r'"[^"]*"|\'[^\']*\'|#[^\n]*|\n|[{}=]|\[[^\]\n]*\]'
+                     r'|[^\s{}="\'#]+')
+_NAME = re.compile(r'^\s*([^\s\[]+)\s*(?:\[([^\]]*)\])?\s*$')
+_templates = dict()  # parsed templates, keyed by path and modification time
+
+
+class HSDError(Exception):
+    """Error raised when a HSD input cannot be parsed or modified."""
+    pass
+
+
+class HSDNode(object):
+    """Node of a HSD input tree.
+
+    Scalars have a value and no children, blocks have a list of children and
+    optionally a method (as in 'Driver = ConjugateGradient { ... }'). Nodes
+    without name hold raw data lines, e.g. the content of a GenFormat block.
+    A unit modifier (as in 'Temperature [K] = 300') is kept apart from the
+    name, so names are matched without it.
+
+    Inputs for instantiation:
+    @:param name: Node name (None for raw data lines).
+    @:param value: Scalar value or raw data as string.
+    @:param method: Method name of the block.
+    @:param children: List of child nodes for blocks.
+    @:param unit: Unit modifier of the node.
+    """
+
+    def __init__(self, name, value=None, method=None, children=None,
+                 unit=None):
+        self.name = name
+        self.value = value
+        self.method = method
+        self.children = children
+        self.unit = unit
+
+    def child(self, name):
+        """Returns the child with the given (case-insensitive) name.
+
+        A unit modifier given with the name is ignored.
+        """
+        name = _split_name(name)[0]
+        for node in self.children or []:
+            if node.name and node.name.lower() == name.lower():
+                return node
+        return None
+
+    def find(self, path):
+        """Returns the node at a '/'-separated path or None."""
+        node = self
+        for name in path.split("/"):
+            node = node.child(name)
+            if node is None:
+                return None
+        return node
+
+    def set(self, path, value):
+        """Sets, replaces or removes the node at a '/'-separated path.
+
+        Missing parent blocks are created. A value of None removes the node,
+        a value containing a '{' is parsed as block (e.g.
+        "Colinear { UnpairedElectrons = 2 }"), anything else is set as
+        scalar. Booleans are converted to 'Yes' and 'No'. The last name may
+        carry a unit modifier (e.g. 'Filling/Temperature [K]'), the node is
+        replaced including the unit of the old node.
+        """
+        names = path.split("/")
+        parent = self
+        for name in names[:-1]:
+            node = parent.child(name)
+            if node is None:
+                if value is None:
+                    return
+                node = HSDNode(_split_name(name)[0], children=[])
+                parent.children.append(node)
+            elif node.children is None:
+                msg = "Cannot set '%s', '%s' is not a block."
+                raise HSDError(msg % (path, name))
+            parent = node
+        old = parent.child(names[-1])
+        if value is None:
+            if old is not None:
+                parent.children.remove(old)
+            return
+        if isinstance(value, bool):
+            value = "Yes" if value else "No"
+        value = str(value)
+        if "{" in value:
+            new = parse("%s = %s" % (names[-1], value)).children[0]
+        else:
+            name, unit = _split_name(names[-1])
+            new = HSDNode(name, value=value, unit=unit)
+        if old is None:
+            parent.children.append(new)
+        else:
+            parent.children[parent.children.index(old)] = new
+
+    def render(self, indent=""):
+        """Returns the node (and all its children) as HSD string."""
+        if self.name is None and self.children is None:
+            return indent + self.value
+        label = self.name
+        if self.unit is not None:
+            label = "%s [%s]" % (self.name, self.unit)
+        if self.children is None:
+            return "%s%s = %s" % (indent, label, self.value)
+        lines = []
+        if self.name is not None:
+            method = self.method + " " if self.method else ""
+            lines.append("%s%s = %s{" % (indent, label, method))
+            child_indent = indent + " "
+        else:
+            child_indent = indent
+        for node in self.children:
+            lines.append(node.render(child_indent))
+        if self.name is not None:
+            lines.append(indent + "}")
+        return "\n".join(lines)
+
+
+class HSDTemplate(object):
+    """DFTB+ input template that is parsed once and rendered per job.
+
+    The geometry is embedded into the rendered input as GenFormat block, so
+    a single dftb_in.hsd has to be written per calculation.
+
+    Inputs for instantiation:
+    @:param hsd_path: Path to the dftb_in.hsd template.
+    """
+
+    def __init__(self, hsd_path):
+        self.path = hsd_path
+        with open(hsd_path, "r") as hsd_in:
+            self.tree = parse(hsd_in.read())
+
+    def render(self, symbols, coords, overrides=None):
+        """Returns the input with embedded geometry and overrides applied.
+
+        Inputs:
+        @:param symbols: List of element symbols.
+        @:param coords: Nx3 array of coordinates in Angstrom.
+        @:param overrides: Dictionary of HSD paths and values, see
+            apply_overrides().
+        """
+        tree = deepcopy(self.tree)
+        apply_overrides(tree, overrides)
+        geometry = HSDNode("Geometry", method="GenFormat",
+                           children=[HSDNode(None, value=x)
+                                     for x in gen_lines(symbols, coords)])
+        old = tree.child("Geometry")
+        if old is None:
+            tree.children.insert(0, geometry)
+        else:
+            tree.children[tree.children.index(old)] = geometry
+        return tree.render() + "\n"
+
+    def settings(self, paths, overrides=None):
+        """Returns the nodes at the given paths as HSD string.
+
+        Inputs:
+        @:param paths: List of '/'-separated paths, missing ones are skipped.
+        @:param overrides: Dictionary of HSD paths and values applied first.
+        """
+        tree = self.tree
+        if overrides:
+            tree = deepcopy(tree)
+            apply_overrides(tree, overrides)
+        nodes = [tree.find(x) for x in paths]
+        return "\n".join(x.render() for x in nodes if x is not None)
+
+    def write(self, target, symbols, coords, overrides=None):
+        """Writes the rendered input to target."""
+        with open(target, "w") as out:
+            out.write(self.render(symbols, coords, overrides))
+
+
+def load_template(hsd_path):
+    """Returns the parsed HSDTemplate of a file, parsing it only once."""
+    key = (abspath(hsd_path), stat(hsd_path).st_mtime_ns)
+    if key not in _templates:
+        _templates[key] = HSDTemplate(hsd_path)
+    return _templates[key]
+
+
+def apply_overrides(tree, overrides):
+    """Applies a dictionary of HSD paths and values in order.
+
+    See HSDNode.set(). Paths below a block that an earlier override removed
+    are skipped, e.g. the 'Driver/MaxForceComponent' of a fallback setting
+    for a single point without 'Driver'.
+    """
+    removed = []
+    for path, value in (overrides or dict()).items():
+        if any(path.lower().startswith(x) for x in removed):
+            continue
+        tree.set(path, value)
+        if value is None:
+            removed.append(path.lower() + "/")
+
+
+def parse(text):
+    """Parses a HSD string into a tree of HSDNode objects.
+
+    @:returns unnamed root HSDNode.
+    """
+    tokens = [x for x in _TOKENS.findall(text) if not x.startswith("#")]
+    children, pos = _parse_block(tokens, 0)
+    if pos < len(tokens):
+        raise HSDError("Unmatched '}' in HSD input.")
+    return HSDNode(None, children=children)
+
+
+def gen_lines(symbols, coords):
+    """Returns the lines of a gen-format geometry as list of strings."""
+    species = list(dict.fromkeys(symbols))
+    type_idx = {at: idx + 1 for idx, at in enumerate(species)}
+    lines = ["%d C" % len(symbols), " ".join(species)]
+    for idx, (at, vec) in enumerate(zip(symbols, coords)):
+        lines.append("%d %d   %.10f   %.10f   %.10f"
+                     % (idx + 1, type_idx[at], vec[0], vec[1], vec[2]))
+    return lines
+
+
+def system_overrides(set_definition, sys_name):
+    """Returns the HSD overrides for one system of a testset.
+
+    Testset wide overrides are given as 'hsd' dictionary of HSD paths and
+    values in the testset definition, per-system settings in the 'systems'
+    dictionary. Supported per-system keys are 'charge', 'unpaired_electrons'
+    and 'hsd'. Single point testsets remove the 'Driver' block.
+    """
+    overrides = dict()
+    if set_definition.get("calculation") == "single_point":
+        overrides["Driver"] = None
+    overrides.update(set_definition.get("hsd") or dict())
+    system = (set_definition.get("systems") or dict()).get(sys_name)
+    if not system:
+        return overrides
+    if "charge" in system:
+        overrides["Hamiltonian/Charge"] = system["charge"]
+    if system.get("unpaired_electrons"):
+        overrides["Hamiltonian/SpinPolarisation"] = (
+            "Colinear { UnpairedElectrons = %s }"
+            % system["unpaired_electrons"])
+    overrides.update(system.get("hsd") or dict())
+    return overrides
+
+
+def is_single_point(overrides):
+    """Returns whether the overrides remove the geometry 'Driver'."""
+    return "Driver" in (overrides or dict()) and overrides["Driver"] is None
+
+
+def _parse_block(tokens, pos):
+    """Parses tokens into nodes until the closing brace of the block."""
+    nodes = []
+    while pos < len(tokens):
+        token = tokens[pos]
+        if token == "\n":
+            pos += 1
+            continue
+        if token == "}":
+            return nodes, pos
+        unit = _peek(tokens, pos + 1) or ""
+        unit = unit[1:-1].strip() if unit.startswith("[") else None
+        following = pos + 1 + (unit is not None)
+        if _peek(tokens, following) == "=":
+            node, pos = _parse_assignment(tokens, following + 1, token)
+            node.unit = unit
+            nodes.append(node)
+        elif _peek(tokens, following) == "{":
+            children, pos = _parse_block(tokens, following + 1)
+            nodes.append(HSDNode(token, children=children, unit=unit))
+            pos = _expect_close(tokens, pos)
+        else:  # raw data line
+            start = pos
+            while pos < len(tokens) and tokens[pos] not in ("\n", "}"):
+                pos += 1
+            nodes.append(HSDNode(None, value=" ".join(tokens[start:pos])))
+    return nodes, pos
+
+
+def _parse_assignment(tokens, pos, name):
+    if _peek(tokens, pos) == "{":
+        children, pos = _parse_block(tokens, pos + 1)
+        return HSDNode(name, children=children), _expect_close(tokens, pos)
+    if _peek(tokens, pos + 1) == "{":
+        method = tokens[pos]
+        children, pos = _parse_block(tokens, pos + 2)
+        node = HSDNode(name, method=method, children=children)
+        return node, _expect_close(tokens, pos)
+    start = pos
+    while pos < len(tokens) and tokens[pos] not in ("\n", "}"):
+        pos += 1
+    if pos == start:
+        raise HSDError("Missing value for '%s' in HSD input." % name)
+    return HSDNode(name, value=" ".join(tokens[start:pos])), pos
+
+
+def _split_name(name):
+    """Splits 'Name [unit]' into the name and the unit (or None)."""
+    match = _NAME.match(name)
+    if match is None:
+        raise HSDError("Invalid HSD name '%s'." % name)
+    return match.group(1), match.group(2)
+
+
+def _expect_close(tokens, pos):
+    if _peek(tokens, pos) != "}":
+        raise HSDError("Missing '}' in HSD input.")
+    return pos + 1
+
+
+def _peek(tokens, pos):
+    return tokens[pos] if pos < len(tokens) else None
+
+
+if __name__ == "__main__":
+    pass
@@ -1,11 +1,27 @@
+from hashlib import sha256
 from inspect import currentframe, getfile
-from os import access, environ, pathsep, X_OK
-from os.path import dirname, exists, isfile, isdir, join
-from shutil import copy2
+from libtestset import atomic, charges, stages, statistics
+from libtestset.store import N_ATOMS
+from libtestset.archive import COMPRESSION, DEFAULT_FILES, DEFAULT_PATH
+from libtestset.geometry import DATASET_SUFFIXES, XYZError, fingerprint
+from libtestset.geometry import is_dataset, load_index
+from libtestset.hsd import HSDError, load_template, system_overrides
+from libtestset.results import ReactionError, parse_equation
+from os import getpid, replace, stat
+from os.path import abspath, basename, dirname, exists, isfile, isdir, join
+from shutil import copy2, which
 from sys import exit
 
+import pickle
 import yaml
 
+# C implementation of the YAML loader if libyaml is available
+Loader = getattr(yaml, "CSafeLoader", yaml.SafeLoader)
+CACHE_VERSION = 7
+SET_TYPES = ("reaction", "atomization", "distance", "angle", "dihedral")
+CALCULATIONS = ("optimize", "single_point")
+SYSTEM_KEYS = ("charge", "unpaired_electrons", "hsd")
+
 
 class InputError(Exception):
     """Default exception for input parsing errors."""
@@ -13,33 +29,68 @@ class InputError(Exception):
 
 
 def load(filename):
-    """Main driver function to load the input."""
+    """Main driver function to load the input.
+
+    The validated and normalized settings are cached in a sidecar file next
+    to the input file and reused as long as neither the input file, the
+    referenced files and geometries nor the DFTB+ executable found on the
+    PATH change.
+
+    Normalization resolves all paths to absolute paths, converts references
+    to floats, adds the parsed 'stoichiometry' to every reaction and the
+    sorted list of 'required_systems' to every testset.
+    """
     if not exists(filename):
         write_template(filename)
         exit()
-    with open(filename, "r") as infile:
-        settings = yaml.safe_load(infile)
-    if not exists(settings["Options"]["DFTBPlusHSD"]):
-        msg = "DFTBPlusHSD file at %s does not exist."
-        raise InputError(msg % settings["Options"]["DFTBPlusHSD"])
-    # Check for DFTB+ executable in OS environment
-    exe_name = settings["Options"]["DFTBPlusPath"]
-    exe_path = False
-    for path in environ["PATH"].split(pathsep):
-        probe_path = join(path, exe_name)
-        if isfile(probe_path) and access(probe_path, X_OK):
-            exe_path = probe_path
-    if not exe_path:
-        msg = "DFTBPlusPath executable at %s does not exist."
-        raise InputError(msg % settings["Options"]["DFTBPlusPath"])
-    if "DTNN" in settings["Options"]:
-        dtnn_settings = settings["Options"]["DTNN"]
-        if not isdir(dtnn_settings["DTNNSkfPath"]):
-            msg = "DTNNSkfPath at %s does not exist or is no directory!"
-            raise InputError(msg % dtnn_settings["DTNNSkfPath"])
-        if not exists(dtnn_settings["DTNNModel"]):
-            msg = "DTNNModel file at %s could not be found."
-            raise InputError(msg % dtnn_settings["DTNNModel"])
+    with open(filename, "rb") as infile:
+        raw = infile.read()
+    digest = sha256(abspath(filename).encode() + b"\0" + raw).hexdigest()
+    cache_file = join(dirname(abspath(filename)),
+                      ".%s.cache" % basename(filename))
+    settings = _read_cache(cache_file, digest)
+    if settings is not None:
+        return settings
+    try:
+        settings = yaml.load(raw, Loader=Loader)
+    except yaml.YAMLError as exc:
+        raise InputError("Input file %s is no valid YAML:\n%s"
+                         % (filename, exc))
+    options = settings.get("Options") if isinstance(settings, dict) else None
+    if not isinstance(options, dict):
+        options = dict()
+    executable = str(options.get("DFTBPlusPath"))
+    settings = validate(settings, dirname(abspath(filename)))
+    _write_cache(cache_file, digest, settings, executable)
+    return settings
+
+
+def validate(settings, base_dir):
+    """Checks and normalizes the complete settings dictionary.
+
+    All errors found are collected and raised together as one InputError.
+
+    Inputs:
+    @:param settings: Settings dictionary as read from the input file.
+    @:param base_dir: Directory relative paths are resolved against.
+
+    @:returns normalized settings dictionary.
+    """
+    errors = []
+    if not isinstance(settings, dict) or "Options" not in settings:
+        raise InputError("Input file needs an 'Options' section.")
+    if not isinstance(settings.get("Testsets"), dict):
+        raise InputError("Input file needs a 'Testsets' section.")
+    _validate_options(settings["Options"], base_dir, errors)
+    for set_name, set_definition in settings["Testsets"].items():
+        if not isinstance(set_definition, dict):
+            errors.append("Testset '%s' has no definition." % set_name)
+            continue
+        _validate_testset(set_name, set_definition, base_dir, errors)
+    if not errors:
+        _validate_spin(settings, errors)
+    if errors:
+        raise InputError("\n".join(errors))
     return settings
 
 
@@ -55,5 +106,419 @@ def write_template(filename):
         pass
 
 
+def _validate_options(options, base_dir, errors):
+    hsd = join(base_dir, str(options.get("DFTBPlusHSD")))
+    if not isfile(hsd):
+        msg = "DFTBPlusHSD file at %s does not exist."
+        errors.append(msg % options.get("DFTBPlusHSD"))
+    else:
+        options["DFTBPlusHSD"] = hsd
+    # Check for DFTB+ executable in OS environment
+    exe_path = which(str(options.get("DFTBPlusPath")))
+    if not exe_path:
+        msg = "DFTBPlusPath executable at %s does not exist."
+        errors.append(msg % options.get("DFTBPlusPath"))
+    else:
+        options["DFTBPlusPath"] = abspath(exe_path)
+    if "DFTBPlusLibrary" in options:
+        library = join(base_dir, str(options["DFTBPlusLibrary"]))
+        if not isfile(library):
+            msg = "DFTBPlusLibrary file at %s does not exist."
+            errors.append(msg % options["DFTBPlusLibrary"])
+        else:
+            options["DFTBPlusLibrary"] = library
+    if "DTNN" in options:
+        dtnn_settings = options["DTNN"]
+        skf = join(base_dir, str(dtnn_settings.get("DTNNSkfPath")))
+        model = join(base_dir, str(dtnn_settings.get("DTNNModel")))
+        if not isdir(skf):
+            msg = "DTNNSkfPath at %s does not exist or is no directory!"
+            errors.append(msg % dtnn_settings.get("DTNNSkfPath"))
+        else:
+            dtnn_settings["DTNNSkfPath"] = join(skf, "")
+        if not exists(model):
+            msg = "DTNNModel file at %s could not be found."
+            errors.append(msg % dtnn_settings.get("DTNNModel"))
+        else:
+            dtnn_settings["DTNNModel"] = model
+    if options.get("KeepOutputs"):
+        _validate_keep_outputs(options, base_dir, errors)
+    if options.get("FaultTolerance"):
+        _validate_fault_tolerance(options, errors)
+    if options.get("WarmStart"):
+        _validate_warm_start(options, base_dir, errors)
+    if "AtomicEnergies" in options:
+        _validate_atomic_energies(options, errors)
+    if options.get("Bootstrap"):
+        _validate_bootstrap(options, errors)
+    else:
+        options.pop("Bootstrap", None)
+    if options.get("Sweep"):
+        _validate_sweep(options, errors)
+    else:
+        options.pop("Sweep", None)
+
+
+def _validate_keep_outputs(options, base_dir, errors):
+    """Fills in defaults of the 'KeepOutputs' option and checks it."""
+    keep = options["KeepOutputs"]
+    if keep is True:
+        keep = dict()
+    if not isinstance(keep, dict):
+        errors.append("KeepOutputs needs to be 'true' or a dictionary.")
+        return
+    files = keep.get("files", list(DEFAULT_FILES))
+    if isinstance(files, str):
+        files = [files]
+    if not isinstance(files, list) or not files:
+        errors.append("KeepOutputs: 'files' needs to be a list of names.")
+        return
+    compression = keep.get("compression", "deflated")
+    if compression not in COMPRESSION:
+        msg = "KeepOutputs: unknown compression '%s', use one of %s."
+        errors.append(msg % (compression, ", ".join(COMPRESSION)))
+        return
+    options["KeepOutputs"] = {
+        "path": join(base_dir, str(keep.get("path", DEFAULT_PATH))),
+        "files": [str(x) for x in files],
+        "compression": compression}
+
+
+def _validate_fault_tolerance(options, errors):
+    """Checks the fallback overrides of the 'FaultTolerance' option."""
+    settings = options["FaultTolerance"]
+    if settings is True:
+        settings = dict()
+    if not isinstance(settings, dict):
+        errors.append("FaultTolerance needs to be 'true' or a dictionary.")
+        return
+    retries = settings.get("retries") or []
+    if not isinstance(retries, list) or not all(
+            isinstance(x, dict) for x in retries):
+        errors.append("FaultTolerance: 'retries' needs to be a list of "
+                      "dictionaries of HSD settings.")
+        return
+    options["FaultTolerance"] = {"retries": retries}
+
+
+def _validate_warm_start(options, base_dir, errors):
+    """Resolves the charge store directory of the 'WarmStart' option."""
+    settings = options["WarmStart"]
+    if settings is True:
+        settings = dict()
+    if not isinstance(settings, dict):
+        errors.append("WarmStart needs to be 'true' or a dictionary.")
+        return
+    path = str(settings.get("path", charges.DEFAULT_PATH))
+    options["WarmStart"] = {"path": join(base_dir, path)}
+
+
+def _validate_atomic_energies(options, errors):
+    """Checks the 'AtomicEnergies' option."""
+    mode = str(options["AtomicEnergies"]).lower()
+    if mode not in atomic.MODES:
+        errors.append("AtomicEnergies needs to be one of %s."
+                      % ", ".join(atomic.MODES))
+        return
+    options["AtomicEnergies"] = mode
+
+
+def _validate_bootstrap(options, errors):
+    """Checks and completes the 'Bootstrap' option."""
+    settings = options["Bootstrap"]
+    if settings is True:
+        settings = dict()
+    if not isinstance(settings, dict):
+        errors.append("Bootstrap needs to be 'true' or a dictionary.")
+        return
+    try:
+        samples = int(settings.get("samples", statistics.DEFAULT_SAMPLES))
+        confidence = float(settings.get("confidence",
+                                        statistics.DEFAULT_CONFIDENCE))
+        seed = settings.get("seed", 0)
+        seed = None if seed is None else int(seed)
+    except (TypeError, ValueError):
+        errors.append("Bootstrap: 'samples', 'confidence' and 'seed' need to "
+                      "be numbers.")
+        return
+    if samples < 1 or not 0.0 < confidence < 1.0:
+        errors.append("Bootstrap needs at least one sample and a confidence "
+                      "between 0 and 1.")
+        return
+    options["Bootstrap"] = {"samples": samples, "confidence": confidence,
+                            "seed": seed}
+
+
+def _validate_sweep(options, errors):
+    """Checks the 'variants' and 'grid' of the 'Sweep' option."""
+    settings = options["Sweep"]
+    if not isinstance(settings, dict):
+        errors.append("Sweep needs to be a dictionary with 'variants' "
+                      "and/or 'grid'.")
+        return
+    variants = settings.get("variants") or dict()
+    grid = settings.get("grid") or dict()
+    if not isinstance(variants, dict) or not all(
+            isinstance(x, dict) for x in variants.values()):
+        errors.append("Sweep: 'variants' needs to be a dictionary of names "
+                      "and dictionaries of HSD paths and values.")
+        return
+    if not isinstance(grid, dict) or not all(
+            isinstance(x, list) and x for x in grid.values()):
+        errors.append("Sweep: 'grid' needs to be a dictionary of HSD paths "
+                      "and lists of values.")
+        return
+    if not variants and not grid:
+        errors.append("Sweep needs 'variants' and/or 'grid'.")
+        return
+    options["Sweep"] = {"variants": {str(x): y for x, y in variants.items()},
+                        "grid": grid}
+
+
+def _validate_testset(set_name, set_definition, base_dir, errors):
+    n_errors = len(errors)
+    set_type = set_definition.get("type")
+    if set_type not in SET_TYPES:
+        msg = "Testset '%s': unknown type '%s', use one of %s."
+        errors.append(msg % (set_name, set_type, ", ".join(SET_TYPES)))
+    if "path" not in set_definition:
+        errors.append("Testset '%s': no 'path' given." % set_name)
+        return
+    set_path = join(base_dir, str(set_definition["path"]))
+    if not isdir(set_path) and not is_dataset(set_path):
+        msg = ("Testset '%s': path %s does not exist or is neither a "
+               "directory nor a dataset file (%s).")
+        errors.append(msg % (set_name, set_definition["path"],
+                             ", ".join(DATASET_SUFFIXES)))
+        return
+    set_definition["path"] = set_path
+    try:
+        index = load_index(set_path)
+    except (OSError, XYZError) as exc:
+        errors.append("Testset '%s': %s" % (set_name, exc))
+        return
+    required = set()
+    if set_type == "reaction":
+        required = _validate_reactions(set_name, set_definition, errors)
+    elif set_type == "atomization" or set_type in N_ATOMS:
+        required = _validate_references(set_name, set_definition, index,
+                                        errors)
+    for sys_name in sorted(required):
+        if sys_name not in index:
+            msg = "Testset '%s': no valid geometry for system '%s' in %s."
+            msg = msg % (set_name, sys_name, set_path)
+            if sys_name in index.errors:
+                msg += " (%s)" % index.errors[sys_name]
+            errors.append(msg)
+    systems = set_definition.get("systems") or dict()
+    for sys_name, sys_settings in systems.items():
+        unknown = set(sys_settings or dict()) - set(SYSTEM_KEYS)
+        if unknown:
+            msg = "Testset '%s': unknown settings %s for system '%s'."
+            errors.append(msg % (set_name, ", ".join(sorted(unknown)),
+                                 sys_name))
+    if not isinstance(set_definition.get("collection", ""), str):
+        errors.append("Testset '%s': collection needs to be a name."
+                      % set_name)
+    calculation = set_definition.setdefault("calculation", "optimize")
+    if calculation not in CALCULATIONS:
+        msg = "Testset '%s': unknown calculation '%s', use one of %s."
+        errors.append(msg % (set_name, calculation, ", ".join(CALCULATIONS)))
+    elif calculation == "single_point" and set_type in N_ATOMS:
+        errors.append("Testset '%s': %s testsets need optimized "
+                      "geometries, not 'single_point'." % (set_name,
+                                                           set_type))
+    elif calculation == "single_point" and set_definition.get("staged"):
+        errors.append("Testset '%s': 'staged' needs 'calculation: optimize'."
+                      % set_name)
+    if set_definition.get("staged"):
+        _validate_staged(set_name, set_definition, errors)
+    else:
+        set_definition.pop("staged", None)
+    if len(errors) == n_errors:
+        if is_dataset(set_path):
+            # Run and write the systems of large datasets in file order
+            set_definition["required_systems"] = index.order(required)
+            if set_type == "atomization" or set_type in N_ATOMS:
+                references = set_definition["references"]
+                set_definition["references"] = {
+                    x: references[x] for x in index.order(references)}
+        else:
+            set_definition["required_systems"] = sorted(required)
+
+
+def _validate_spin(settings, errors):
+    """Checks that open shell systems have SpinConstants in their input."""
+    try:
+        template = load_template(settings["Options"]["DFTBPlusHSD"])
+    except (OSError, HSDError) as exc:
+        errors.append("DFTBPlusHSD file could not be parsed: %s" % exc)
+        return
+    for set_name, set_definition in settings["Testsets"].items():
+        systems = set_definition.get("systems") or dict()
+        for sys_name, sys_settings in systems.items():
+            if not (sys_settings or dict()).get("unpaired_electrons"):
+                continue
+            overrides = system_overrides(set_definition, sys_name)
+            if not template.settings(["Hamiltonian/SpinConstants"],
+                                     overrides):
+                msg = ("Testset '%s': system '%s' has unpaired electrons, "
+                       "but the input has no Hamiltonian/SpinConstants.")
+                errors.append(msg % (set_name, sys_name))
+
+
+def _validate_staged(set_name, set_definition, errors):
+    """Checks and completes the 'staged' optimization setting."""
+    settings = set_definition["staged"]
+    if settings is True:
+        settings = dict()
+    if not isinstance(settings, dict):
+        errors.append("Testset '%s': staged needs to be 'true' or a "
+                      "dictionary." % set_name)
+        return
+    hsd = settings.get("hsd", stages.DEFAULT_HSD)
+    if not isinstance(hsd, dict):
+        errors.append("Testset '%s': staged 'hsd' needs to be a dictionary "
+                      "of HSD settings." % set_name)
+        return
+    try:
+        fmax = float(settings.get("fmax", stages.DEFAULT_FMAX))
+    except (TypeError, ValueError):
+        errors.append("Testset '%s': staged 'fmax' '%s' is not a number."
+                      % (set_name, settings.get("fmax")))
+        return
+    set_definition["staged"] = {"hsd": dict(hsd), "fmax": fmax,
+                                "check": bool(settings.get("check", False))}
+
+
+def _validate_reactions(set_name, set_definition, errors):
+    required = set()
+    reactions = set_definition.get("reactions")
+    if not isinstance(reactions, list) or not reactions:
+        errors.append("Testset '%s': no 'reactions' given." % set_name)
+        return required
+    for i, reaction in enumerate(reactions):
+        where = "Testset '%s', reaction %d" % (set_name, i + 1)
+        if not isinstance(reaction, dict) or "equation" not in reaction:
+            errors.append("%s: no 'equation' given." % where)
+            continue
+        try:
+            reaction["stoichiometry"] = parse_equation(
+                str(reaction["equation"]))
+        except ReactionError as exc:
+            errors.append("%s: %s" % (where, exc))
+            continue
+        required.update(reaction["stoichiometry"])
+        try:
+            reaction["reference"] = float(reaction.get("reference"))
+        except (TypeError, ValueError):
+            msg = "%s: reference '%s' is not a number."
+            errors.append(msg % (where, reaction.get("reference")))
+    return required
+
+
+def _validate_references(set_name, set_definition, index, errors):
+    references = set_definition.get("references")
+    if not isinstance(references, dict) or not references:
+        errors.append("Testset '%s': no 'references' given." % set_name)
+        return set()
+    for sys_name, ref in references.items():
+        where = "Testset '%s', system '%s'" % (set_name, sys_name)
+        if set_definition["type"] in N_ATOMS:
+            if not isinstance(ref, dict):
+                errors.append("%s: needs 'atoms' and 'reference'." % where)
+                continue
+            _validate_atoms(where, ref, index, sys_name,
+                            N_ATOMS[set_definition["type"]], errors)
+            ref = ref.get("reference")
+        try:
+            ref = float(ref)
+        except (TypeError, ValueError):
+            errors.append("%s: reference '%s' is not a number."
+                          % (where, ref))
+            continue
+        if set_definition["type"] in N_ATOMS:
+            references[sys_name]["reference"] = ref
+        else:
+            references[sys_name] = ref
+    return set(references)
+
+
+def _validate_atoms(where, ref, index, sys_name, n_atoms_needed, errors):
+    """Checks the comma separated atom numbers of a geometry testset."""
+    try:
+        atoms = [int(x) for x in str(ref.get("atoms")).split(",")]
+    except ValueError:
+        errors.append("%s: atoms '%s' are not comma separated numbers."
+                      % (where, ref.get("atoms")))
+        return
+    if len(atoms) != n_atoms_needed or len(set(atoms)) != len(atoms):
+        errors.append("%s: atoms '%s' need to be %d different atoms."
+                      % (where, ref.get("atoms"), n_atoms_needed))
+        return
+    try:
+        n_atoms = len(index.get(sys_name)[0])
+    except XYZError:
+        return  # reported as missing geometry
+    if min(atoms) < 1 or max(atoms) > n_atoms:
+        msg = "%s: atoms '%s' out of range (system has %d atoms)."
+        errors.append(msg % (where, ref.get("atoms"), n_atoms))
+
+
+def _stamps(settings):
+    """Modification times of all files and directories the settings use."""
+    paths = [settings["Options"]["DFTBPlusHSD"]]
+    paths.extend(x["path"] for x in settings["Testsets"].values())
+    return [(x, stat(x).st_mtime_ns) for x in paths]
+
+
+def _fingerprints(settings):
+    """Fingerprints of the geometry files of all testsets."""
+    return [(x["path"], fingerprint(x["path"]))
+            for x in settings["Testsets"].values()]
+
+
+def _read_cache(cache_file, digest):
+    try:
+        with open(cache_file, "rb") as infile:
+            cache = pickle.load(infile)
+        if cache["version"] != CACHE_VERSION or cache["digest"] != digest:
+            return None
+        for path, mtime in cache["stamps"]:
+            if stat(path).st_mtime_ns != mtime:
+                return None
+        if _fingerprints(cache["settings"]) != cache["fingerprints"]:
+            return None
+        # The executable is looked up again, PATH may have changed
+        exe = which(cache["executable"])
+        resolved = cache["settings"]["Options"]["DFTBPlusPath"]
+        if exe is None or abspath(exe) != resolved:
+            return None
+    except (OSError, EOFError, KeyError, pickle.UnpicklingError):
+        return None
+    return cache["settings"]
+
+
+def _write_cache(cache_file, digest, settings, executable):
+    """Writes the settings cache, skipped if the directory is read-only.
+
+    @:param executable: DFTBPlusPath as given in the input file.
+    """
+    try:
+        fingerprints = _fingerprints(settings)
+    except OSError:
+        return
+    cache = {"version": CACHE_VERSION, "digest": digest,
+             "stamps": _stamps(settings), "fingerprints": fingerprints,
+             "executable": executable, "settings": settings}
+    tmp = "%s.%d.tmp" % (cache_file, getpid())
+    try:
+        with open(tmp, "wb") as outfile:
+            pickle.dump(cache, outfile, protocol=pickle.HIGHEST_PROTOCOL)
+        replace(tmp, cache_file)
+    except OSError:
+        pass
+
+
 if __name__ == "__main__":
     pass
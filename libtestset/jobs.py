@@ -0,0 +1,284 @@
+from collections import deque
+from hashlib import sha1
+from itertools import chain
+from libtestset.geometry import load_index
+from libtestset.hsd import system_overrides
+from os import getcwd
+from os.path import join
+
+import json
+import numpy as np
+
+DEFAULT_TOLERANCE = 1e-4  # Angstrom
+
+
+class Job(object):
+    """A unique calculation shared by all testset systems it stands for.
+
+    Systems of all testsets that have the same elements, the same
+    coordinates (within a tolerance, after sorting and centering) and the
+    same HSD overrides are calculated only once. The calculation uses the
+    atom order of the first system, the atom order of every other system is
+    kept in permutations, see distribute().
+
+    Inputs for instantiation:
+    @:param key: Unique job identifier.
+    @:param xyz: Path to the xyz file used for the calculation, see
+        geometry.read_geometry().
+    @:param n_atoms: Number of atoms.
+    @:param overrides: Dictionary of HSD overrides for the calculation.
+    @:param staged: None or the 'staged' setting of the testset for a two
+        stage geometry optimization.
+    """
+
+    def __init__(self, key, xyz, n_atoms, overrides, staged=None):
+        self.key = key
+        # key of the job before extra overrides, e.g. of sweep variants
+        self.base_key = key
+        self.xyz = xyz
+        self.n_atoms = n_atoms
+        self.overrides = overrides
+        self.staged = staged
+        self.aliases = []  # list of (testset, system) tuples
+        self.variants = []  # names of the sweep variants the job belongs to
+        # (testset, system): indices of the job's atoms in the system's atom
+        # order, only for systems whose order differs from the job's
+        self.permutations = dict()
+        self.errors = dict()  # method name: error messages of failed runs
+
+    @property
+    def name(self):
+        """Returns the system name of the first alias."""
+        return self.aliases[0][1]
+
+
+class PermutedResult(object):
+    """Finished driver of a job seen in the atom order of one system.
+
+    Offers atoms and coordinates reordered, all other attributes are taken
+    from the driver.
+
+    Inputs for instantiation:
+    @:param driver: Finished driver object of the job.
+    @:param permutation: Indices of the job's atoms in the system's order.
+    """
+
+    def __init__(self, driver, permutation):
+        self.driver = driver
+        self.permutation = permutation
+
+    @property
+    def atoms(self):
+        return [self.driver.atoms[x] for x in self.permutation]
+
+    @property
+    def coordinates(self):
+        return np.asarray(self.driver.coordinates)[self.permutation]
+
+    def __getattr__(self, name):
+        if name == "driver":  # not set yet, e.g. while unpickling
+            raise AttributeError(name)
+        return getattr(self.driver, name)
+
+
+class StoredResult(object):
+    """Result of a calculation that ran in another process or on another host.
+
+    Offers the attributes of a finished driver used for the analysis and
+    converts to and from a compact JSON compatible dictionary.
+
+    Inputs for instantiation:
+    @:param data: Dictionary as returned by to_dict().
+    """
+
+    def __init__(self, data):
+        self.energy = data["energy"]
+        self.atoms = data["atoms"]
+        self.coordinates = np.array(data["coordinates"]).reshape(-1, 3)
+        self.wall_time = data["wall_time"]
+        self.worker = data.get("worker")
+
+    @classmethod
+    def from_driver(cls, driver, worker=None):
+        """Stores the result of a finished driver."""
+        return cls({"energy": driver.energy, "atoms": list(driver.atoms),
+                    "coordinates": np.asarray(driver.coordinates).tolist(),
+                    "wall_time": driver.wall_time, "worker": worker})
+
+    def to_dict(self):
+        return {"energy": self.energy, "atoms": self.atoms,
+                "coordinates": self.coordinates.tolist(),
+                "wall_time": self.wall_time, "worker": self.worker}
+
+
+def canonicalize(numbers, coords, tolerance=DEFAULT_TOLERANCE):
+    """Returns atoms sorted by element and position and centered coordinates.
+
+    @:returns (sorted atomic numbers, sorted and centered Nx3 coordinates,
+        indices of the sorted atoms in the given order).
+    """
+    centered = coords - coords.mean(axis=0)
+    grid = np.round(centered / tolerance)
+    order = np.lexsort((grid[:, 2], grid[:, 1], grid[:, 0], numbers))
+    return numbers[order], centered[order], order
+
+
+def collect_jobs(testsets, tolerance=DEFAULT_TOLERANCE):
+    """Collects the unique calculations needed for all testsets.
+
+    Inputs:
+    @:param testsets: Dictionary of testset names and definitions.
+    @:param tolerance: Maximum coordinate difference in Angstrom for two
+        structures to count as identical, None switches deduplication off.
+
+    @:returns list of Job objects.
+    """
+    jobs = []
+    buckets = dict()
+    keys = set()
+    for set_name, set_definition in testsets.items():
+        set_path = join(getcwd(), set_definition["path"])
+        index = load_index(set_path)
+        staged = set_definition.get("staged") or None
+        for sys_name in set_definition.get("required_systems", index.names):
+            numbers, coords = index.get(sys_name)
+            overrides = system_overrides(set_definition, sys_name)
+            settings = json.dumps(overrides, sort_keys=True)
+            if staged:
+                settings += json.dumps(staged, sort_keys=True)
+            job = None
+            order = None
+            if tolerance is not None:
+                numbers, coords, order = canonicalize(numbers, coords,
+                                                      tolerance)
+                bucket = buckets.setdefault((numbers.tobytes(), settings), [])
+                for ref_coords, ref_order, candidate in bucket:
+                    if np.allclose(ref_coords, coords, rtol=0.0,
+                                   atol=tolerance):
+                        job = candidate
+                        if not np.array_equal(ref_order, order):
+                            permutation = np.empty_like(order)
+                            permutation[order] = ref_order
+                            job.permutations[(set_name, sys_name)] = (
+                                permutation)
+                        break
+            if job is None:
+                digest = sha1(numbers.tobytes())
+                digest.update(np.round(coords, 4).tobytes())
+                digest.update(settings.encode())
+                if order is not None:
+                    # Results are stored in the atom order of the job
+                    digest.update(order.tobytes())
+                if tolerance is None:
+                    digest.update(("%s/%s" % (set_name, sys_name)).encode())
+                key = digest.hexdigest()[:16]
+                while key in keys:  # structures differing below rounding
+                    key = sha1(key.encode()).hexdigest()[:16]
+                keys.add(key)
+                xyz = join(set_path, "%s.xyz" % sys_name)
+                job = Job(key, xyz, len(numbers), overrides, staged)
+                jobs.append(job)
+                if tolerance is not None:
+                    bucket.append((coords, order, job))
+            job.aliases.append((set_name, sys_name))
+    return jobs
+
+
+def run_with_retries(jobs, run_job, error, method, retries=None):
+    """Runs jobs one after another, optionally tolerating failures.
+
+    Failed jobs are put at the end of the queue and run again with the next
+    set of fallback overrides, so the remaining jobs are not held up by
+    retries. Error messages of all failed runs are stored in Job.errors.
+    Jobs are taken from the iterable one at a time, so it can be fed while
+    the calculations run (see pipeline.run()).
+
+    Inputs:
+    @:param jobs: List or other iterable of Job objects.
+    @:param run_job: Function (job, overrides) returning a finished driver.
+    @:param error: Exception class(es) of a failed calculation.
+    @:param method: Method name the errors are recorded under.
+    @:param retries: None to raise the first error, otherwise a (possibly
+        empty) list of dictionaries of HSD overrides tried one after another
+        on top of the job's own overrides.
+
+    @:returns dictionary of job keys and finished driver objects, jobs that
+        failed in every attempt are missing.
+    """
+    drivers = dict()
+    queue = deque()
+    for job, attempt in chain(((x, 0) for x in jobs), _drain(queue)):
+        overrides = job.overrides
+        if attempt > 0:
+            overrides = dict(job.overrides or dict())
+            overrides.update(retries[attempt - 1])
+        try:
+            drivers[job.key] = run_job(job, overrides)
+        except error as exc:
+            if retries is None:
+                raise
+            job.errors.setdefault(method, []).append(str(exc))
+            if attempt < len(retries):
+                queue.append((job, attempt + 1))
+        else:
+            job.errors.pop(method, None)
+    return drivers
+
+
+def _drain(queue):
+    """Yields the items of a deque until it is empty, including new ones."""
+    while queue:
+        yield queue.popleft()
+
+
+def distribute(jobs, drivers):
+    """Maps the results of unique jobs back to every testset system.
+
+    Systems of failed jobs (missing in drivers) are left out. Systems with
+    another atom order than their job get a PermutedResult.
+
+    Inputs:
+    @:param jobs: List of Job objects.
+    @:param drivers: Dictionary of job keys and finished driver objects.
+
+    @:returns dictionary of testsets with dictionaries of systems and driver
+        objects, as used by results.write_results().
+    """
+    calcs = dict()
+    for job in jobs:
+        for set_name, sys_name in job.aliases:
+            systems = calcs.setdefault(set_name, dict())
+            if job.key not in drivers:
+                continue
+            driver = drivers[job.key]
+            permutation = job.permutations.get((set_name, sys_name))
+            if permutation is not None:
+                driver = PermutedResult(driver, permutation)
+            systems[sys_name] = driver
+    return calcs
+
+
+def report(jobs):
+    """Returns a one line summary of the deduplication."""
+    n_systems = sum(len(x.aliases) for x in jobs)
+    return ("%d systems in all testsets, %d unique calculations "
+            "(%d saved by deduplication)"
+            % (n_systems, len(jobs), n_systems - len(jobs)))
+
+
+def failure_report(jobs):
+    """Returns a summary of all failed calculations, None if none failed."""
+    lines = []
+    for job in jobs:
+        for method, errors in sorted(job.errors.items()):
+            systems = ", ".join("%s/%s" % x for x in job.aliases)
+            lines.append("%s failed for %s after %d attempt(s):\n    %s"
+                         % (method, systems, len(errors),
+                            errors[-1].replace("\n", "\n    ")))
+    if not lines:
+        return None
+    return "%d calculation(s) failed:\n%s" % (len(lines), "\n".join(lines))
+
+
+if __name__ == "__main__":
+    pass
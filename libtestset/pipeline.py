@@ -0,0 +1,117 @@
+from queue import Queue
+from threading import Event, Thread
+
+DEFAULT_DEPTH = 16  # jobs a stage may be ahead of the slowest stage
+
+
+class Stage(object):
+    """Runs the jobs of one method backend in a background thread.
+
+    Jobs are handed over one at a time through a bounded queue, so the
+    backend starts with the first job as soon as it is queued and the
+    feeding thread blocks while the stage is depth jobs behind. Several
+    stages of one backend can share a queue, each job then runs in the
+    stage that is free first.
+
+    Inputs for instantiation:
+    @:param backend: backends.Backend object.
+    @:param queue: Bounded queue.Queue of jobs, None ends the stage.
+    """
+
+    def __init__(self, backend, queue):
+        self.backend = backend
+        self.queue = queue
+        self.drivers = None
+        self.error = None
+        self._thread = None
+
+    def start(self, options, archive=None, workdir=None, failed=None):
+        """Starts the backend, which then waits for queued jobs.
+
+        @:param failed: Optional threading.Event set if the backend fails.
+        """
+        self._thread = Thread(target=self._run, daemon=True,
+                              args=(options, archive, workdir, failed))
+        self._thread.start()
+
+    def join(self):
+        """Waits until the backend finished all queued jobs."""
+        self._thread.join()
+
+    def _jobs(self):
+        """Yields queued jobs until None is received."""
+        while True:
+            job = self.queue.get()
+            if job is None:
+                return
+            yield job
+
+    def _run(self, options, archive, workdir, failed):
+        try:
+            self.drivers = self.backend.run_jobs(self._jobs(), options,
+                                                 archive, workdir)
+        except Exception as exc:
+            self.error = exc
+            if failed is not None:
+                failed.set()
+            for _job in self._jobs():
+                pass  # only drain the queue to unblock the feeding thread
+
+
+def run(backends, jobs, options, archive=None, workdir=None,
+        depth=DEFAULT_DEPTH, workers=1):
+    """Runs all jobs with several backends at the same time.
+
+    Every backend runs in its own stage and gets each job as soon as it is
+    read, so e.g. DTNN inference runs while DFTB+ calculations of other
+    systems are still going on, instead of waiting for all of them. The
+    queues between the jobs and the stages hold at most depth jobs, so a
+    fast stage is never more than depth jobs ahead of the slowest one.
+    With several workers, each backend runs that many stages taking jobs
+    from the same queue, so jobs are balanced over the workers in the
+    order given (backends that cannot run concurrently get one stage).
+    After the first failure of a backend no more jobs are queued and the
+    error is raised once all stages stopped.
+
+    Inputs:
+    @:param backends: List of backends.Backend objects.
+    @:param jobs: List or other iterable of jobs.Job objects.
+    @:param options: 'Options' section of the settings.
+    @:param archive: Optional archive.OutputArchive for output files.
+    @:param workdir: Directory for the calculation directories, defaults to
+        the current working directory.
+    @:param depth: Maximum number of queued jobs per backend.
+    @:param workers: Number of parallel stages per backend.
+
+    @:returns dictionary of backend names and dictionaries of job keys and
+        drivers.
+    """
+    for backend in backends:
+        backend.load()  # import errors before the first calculation
+    queues = [Queue(maxsize=depth) for _backend in backends]
+    stages = [Stage(x, y) for x, y in zip(backends, queues)
+              for _i in range(max(int(workers), 1) if x.concurrent else 1)]
+    failed = Event()
+    for stage in stages:
+        stage.start(options, archive, workdir, failed)
+    try:
+        for job in jobs:
+            if failed.is_set():
+                break
+            for queue in queues:
+                queue.put(job)
+    finally:
+        for stage in stages:
+            stage.queue.put(None)
+    for stage in stages:
+        stage.join()
+    drivers = {x.name: dict() for x in backends}
+    for stage in stages:
+        if stage.error is not None:
+            raise stage.error
+        drivers[stage.backend.name].update(stage.drivers)
+    return drivers
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,184 @@
+from heapq import heapify, heapreplace
+from libtestset.hsd import is_single_point
+from os import getpid, replace
+
+import json
+import numpy as np
+
+HISTORY_FILE = ".testset_timings.json"
+# Fallback cost model seconds = A * n_atoms**B without timing history
+DEFAULT_MODEL = (0.02, 2.0)
+
+
+class PlannerError(Exception):
+    """Error raised when the timing history cannot be used."""
+    pass
+
+
+class TimingHistory(object):
+    """Wall times of earlier calculations used to estimate job costs.
+
+    The history is a JSON file with the number of atoms and the wall time
+    of every finished job, stored per method and job key. Jobs without
+    recorded time are estimated with a power law in the number of atoms,
+    fitted to the recorded times of the same method. Single point
+    calculations are kept apart from optimizations.
+
+    Inputs for instantiation:
+    @:param path: Path to the history file, which does not need to exist.
+    """
+
+    def __init__(self, path=HISTORY_FILE):
+        self.path = path
+        self._timings = dict()
+        self._models = dict()
+        try:
+            with open(path, "r") as infile:
+                self._timings = json.load(infile)
+        except FileNotFoundError:
+            pass
+        except (OSError, ValueError) as exc:
+            raise PlannerError("Timing history %s is unreadable: %s"
+                               % (path, exc))
+
+    def __len__(self):
+        return sum(len(x) for x in self._timings.values())
+
+    def record(self, method, jobs, drivers):
+        """Adds the wall times of finished drivers to the history.
+
+        Inputs:
+        @:param method: Method name (e.g. "DFTB+").
+        @:param jobs: List of jobs.Job objects.
+        @:param drivers: Dictionary of job keys and finished drivers.
+        """
+        for job in jobs:
+            wall_time = getattr(drivers.get(job.key), "wall_time", None)
+            if wall_time is not None:
+                category = _category(method, job)
+                timings = self._timings.setdefault(category, dict())
+                timings[job.key] = [job.n_atoms, wall_time]
+                self._models.pop(category, None)
+
+    def save(self):
+        """Writes the history file, skipped if the directory is read-only."""
+        tmp = "%s.%d.tmp" % (self.path, getpid())
+        try:
+            with open(tmp, "w") as outfile:
+                json.dump(self._timings, outfile)
+            replace(tmp, self.path)
+        except OSError:
+            pass
+
+    def estimate(self, method, job):
+        """Returns the estimated wall time of a job in seconds.
+
+        @:returns (seconds, True if the time was recorded before).
+        """
+        method = _category(method, job)
+        recorded = self._timings.get(method, dict()).get(job.key)
+        if recorded is not None:
+            return recorded[1], True
+        prefactor, exponent = self.model(method)
+        return prefactor * job.n_atoms**exponent, False
+
+    def model(self, method):
+        """Returns the fitted (A, B) of seconds = A * n_atoms**B."""
+        if method not in self._models:
+            self._models[method] = self._fit(method)
+        return self._models[method]
+
+    def _fit(self, method):
+        timings = self._timings.get(method)
+        if not timings:
+            return DEFAULT_MODEL
+        data = np.array(list(timings.values()), dtype=float)
+        data = data[(data[:, 0] > 0) & (data[:, 1] > 0)]
+        if len(data) == 0:
+            return DEFAULT_MODEL
+        log_n = np.log(data[:, 0])
+        log_t = np.log(data[:, 1])
+        if len(np.unique(log_n)) < 2:  # only scale the default model
+            exponent = DEFAULT_MODEL[1]
+        else:
+            exponent = np.polyfit(log_n, log_t, 1)[0]
+        prefactor = np.exp(np.mean(log_t - exponent * log_n))
+        return prefactor, exponent
+
+
+def _category(method, job):
+    """Returns the history category of a job run with a method."""
+    if is_single_point(job.overrides):
+        return "%s single point" % method
+    return method
+
+
+def makespan(costs, workers):
+    """Longest processing time first schedule of independent jobs.
+
+    Inputs:
+    @:param costs: Iterable of job costs.
+    @:param workers: Number of parallel workers.
+
+    @:returns time until the last worker finishes.
+    """
+    loads = [0.0] * max(int(workers), 1)
+    heapify(loads)
+    for cost in sorted(costs, reverse=True):
+        heapreplace(loads, loads[0] + cost)
+    return max(loads)
+
+
+def plan(testsets, jobs, methods, workers, history):
+    """Estimates the cost of a run without starting any calculation.
+
+    Inputs:
+    @:param testsets: Dictionary of testset names and definitions.
+    @:param jobs: List of jobs.Job objects of all testsets.
+    @:param methods: Names of the enabled method backends.
+    @:param workers: Number of parallel workers for the makespan.
+    @:param history: TimingHistory object.
+
+    @:returns report as string.
+    """
+    set_costs = {x: 0.0 for x in testsets}
+    set_systems = {x: 0 for x in testsets}
+    costs = []
+    n_recorded = 0
+    for job in jobs:
+        cost = 0.0
+        for method in methods:
+            seconds, recorded = history.estimate(method, job)
+            cost += seconds
+            n_recorded += recorded
+        costs.append(cost)
+        # Split shared jobs evenly so that the testset costs add up
+        for set_name, _sys_name in job.aliases:
+            set_costs[set_name] += cost / len(job.aliases)
+            set_systems[set_name] += 1
+    total = sum(costs)
+    width = max([len(x) for x in testsets] + [7])
+    lines = ["%-*s %8s %12s" % (width, "Testset", "Systems", "Core-hours")]
+    for set_name in testsets:
+        lines.append("%-*s %8d %12.3f" % (width, set_name,
+                                           set_systems[set_name],
+                                           set_costs[set_name] / 3600.0))
+    n_systems = sum(set_systems.values())
+    n_estimates = len(jobs) * len(methods)
+    lines.append("")
+    lines.append("%d systems in all testsets, %d unique calculations "
+                 "(%d saved by deduplication)"
+                 % (n_systems, len(jobs), n_systems - len(jobs)))
+    lines.append("Methods: %s" % ", ".join(methods))
+    lines.append("Estimated cost: %.3f core-hours (%d of %d job times from "
+                 "the timing history)"
+                 % (total / 3600.0, n_recorded, n_estimates))
+    lines.append("Expected makespan with %d worker(s): %.3f h "
+                 "(longest job %.3f h)"
+                 % (workers, makespan(costs, workers) / 3600.0,
+                    max(costs, default=0.0) / 3600.0))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    pass
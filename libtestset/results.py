@@ -1,11 +1,17 @@
-from os.path import exists, join, basename
+from os.path import abspath, basename, dirname, exists, join
 from libtestset.constants import atomic_energies, Hydrogen
+from libtestset.geometry import is_dataset, load_index, XYZError
+from libtestset.store import measure, N_ATOMS
+from libtestset import statistics
 
 
 import csv
 import numpy as np
 
 
+MISSING = "missing"  # written instead of values of failed calculations
+
+
 class ReactionError(Exception):
     pass
 
@@ -25,17 +31,22 @@ class Reaction(object):
     to calculate the reaction energy.
     """
 
-    def __init__(self, reaction, systems, reference):
+    def __init__(self, reaction, systems, reference, stoichiometry=None):
         """Instantiation method.
 
         Inputs:
         @:param reaction: Reaction string as in the input file.
         @:param systems: Testset systems dictionary with driver objects.
         @:param reference: reaction's reference energy.
+        @:param stoichiometry: Optional, already parsed reaction dictionary
+            (see parse_equation()).
         """
         self.reaction = reaction
         self.ref = reference
-        self._parse_reaction()
+        if stoichiometry is None:
+            self._parse_reaction()
+        else:
+            self.reaction_dictionary = dict(stoichiometry)
         self._energy = self._calculate_energy(systems)
 
     @property
@@ -49,42 +60,8 @@ class Reaction(object):
         return self.ref - self.energy
 
     def _parse_reaction(self):
-        """Parses a reaction string.
-
-        @:returns dict with system name and stochiometric factor pairs.
-        """
-        found_arrow = False
-        reac_split = self.reaction.split()
-        reac_dict = dict()
-        amount = None
-        system = None
-        i = 0
-        while i < len(reac_split):
-            if reac_split[i] == "+" or reac_split[i] == "->":
-                # Add entry to react_dict with correct stochiometric sign
-                if found_arrow:
-                    reac_dict[system] = amount
-                else:
-                    reac_dict[system] = -amount
-                # Reset factor and molecule pair
-                amount = None
-                system = None
-                if reac_split[i] == "->":
-                    found_arrow = True
-            elif not amount:  # found unsigned stochiometric factor
-                try:
-                    amount = int(reac_split[i])
-                except ValueError:
-                    amount = 1
-                    system = reac_split[i]
-            elif not system:  # found molecule name
-                system = reac_split[i]
-            else:  # error catcher
-                msg = "Invalid reaction entry '%s' of reaction '%s' found!"
-                raise ReactionError(msg % (reac_split[i], self.reaction))
-            i += 1
-        reac_dict[system] = amount  # add last entry
-        self.reaction_dictionary = reac_dict.copy()
+        """Parses the object's reaction string into reaction_dictionary."""
+        self.reaction_dictionary = parse_equation(self.reaction)
 
     def _calculate_energy(self, systems):
         energy = 0.0
@@ -100,18 +77,74 @@ class Reaction(object):
         return energy
 
 
+def parse_equation(equation):
+    """Parses a reaction string.
+
+    Inputs:
+    @:param equation: Reaction string as in the input file.
+
+    @:returns dict with system name and stochiometric factor pairs (negative
+        factors for educts).
+    """
+    found_arrow = False
+    reac_split = equation.split()
+    reac_dict = dict()
+    amount = None
+    system = None
+    i = 0
+    while i < len(reac_split):
+        if reac_split[i] == "+" or reac_split[i] == "->":
+            if system is None:
+                msg = "Missing system before '%s' in reaction '%s'!"
+                raise ReactionError(msg % (reac_split[i], equation))
+            # Add entry to react_dict with correct stochiometric sign
+            if found_arrow:
+                reac_dict[system] = amount
+            else:
+                reac_dict[system] = -amount
+            # Reset factor and molecule pair
+            amount = None
+            system = None
+            if reac_split[i] == "->":
+                if found_arrow:
+                    msg = "More than one '->' found in reaction '%s'!"
+                    raise ReactionError(msg % equation)
+                found_arrow = True
+        elif not amount:  # found unsigned stochiometric factor
+            try:
+                amount = int(reac_split[i])
+            except ValueError:
+                amount = 1
+                system = reac_split[i]
+        elif not system:  # found molecule name
+            system = reac_split[i]
+        else:  # error catcher
+            msg = "Invalid reaction entry '%s' of reaction '%s' found!"
+            raise ReactionError(msg % (reac_split[i], equation))
+        i += 1
+    if system is None:
+        msg = "Reaction '%s' does not end with a system!"
+        raise ReactionError(msg % equation)
+    reac_dict[system] = amount  # add last entry
+    return reac_dict
+
+
 class AtomizationEnergy(object):
     """Calculates atomization energies from testset data."""
 
-    def __init__(self, xyz, total_energy, reference):
+    def __init__(self, xyz, total_energy, reference, atomics=None):
         """Instantiation of AtomizationEnergy object.
 
         Inputs:
         @:param xyz: path to xyz-file of system.
         @:param total_energy: system's total electronic energy in kcal/mol.
         @:param reference: system's reference energy from testset.
+        @:param atomics: Optional dictionary of lower case element symbols
+            and free atom energies in kcal/mol, defaults to the builtin
+            energies of constants.atomic_energies.
         """
-        self.atomics = atomic_energies
+        self.builtin = atomics is None
+        self.atomics = atomic_energies if atomics is None else atomics
         self.total_energy = total_energy
         self.xyz = xyz
         self.ref = reference
@@ -131,12 +164,17 @@ class AtomizationEnergy(object):
         """Calculates the atomization energy.
 
         In case of the hydrogen molecule (H2) it uses the corrected
-        DFTB3 energy.
+        DFTB3 energy together with the builtin atomic energies.
         """
-        if basename(self.xyz) == "h2.xyz":
+        if self.builtin and basename(self.xyz) == "h2.xyz":
             energy = Hydrogen.eat
         else:
             atoms = self._parse_xyz(self.xyz)
+            unknown = sorted(set(atoms) - set(self.atomics))
+            if unknown:
+                msg = "No atomic energies of %s for %s."
+                raise AtomizationEnergyError(msg % (", ".join(unknown),
+                                                    self.xyz))
             energy = self.total_energy
             for at, amount in atoms.items():
                 energy -= self.atomics[at] * amount
@@ -151,54 +189,74 @@ class AtomizationEnergy(object):
 
         @:returns dictionary with atoms and their occurences in the geometry.
         """
-        if not exists(xyz):
+        directory = dirname(abspath(xyz))
+        if not exists(xyz) and not is_dataset(directory):
             msg = "XYZ file at %s not found!"
-            from os import getcwd
-            print(getcwd())
             raise AtomizationEnergyError(msg % xyz)
-        with open(xyz, "r") as geom_file:
-            geom = geom_file.readlines()[2:]
-        atoms = dict()
-        for line in geom:
-            splt = line.split()
-            if len(splt) < 4:
-                continue
-            atom = splt[0].lower()
-            if atom not in atoms.keys():
-                atoms[atom] = 1
-            else:
-                atoms[atom] += 1
-        return atoms
+        index = load_index(directory)
+        try:
+            return index.element_counts(basename(xyz)[:-4])
+        except XYZError as exc:
+            raise AtomizationEnergyError(str(exc))
 
 
-class Distance(object):
-    """Calculates distance between two atoms in Angstrom."""
+class Measurement(object):
+    """Calculated distance, angle or dihedral angle of one system."""
 
-    def __init__(self, system, atoms, reference):
-        """Instantiation of AtomizationEnergy object.
+    def __init__(self, sys_name, set_type, atoms, reference, value):
+        """Instantiation of Measurement object.
 
         Inputs:
-        @:param system: driver object.
+        @:param sys_name: System name.
+        @:param set_type: 'distance', 'angle' or 'dihedral'.
         @:param atoms: Atoms string for the system from input file.
-        @:param reference: Reference distance for deviation.
+        @:param reference: Reference value for deviation.
+        @:param value: Value calculated by store.measure() in Angstrom or
+            degrees.
         """
-        self._coords = system.coordinates
-        # Subtract 1 from atoms because python indices start with 0, not 1.
-        self.atoms = [int(x)-1 for x in atoms.split(",")]
+        self.sys_name = sys_name
+        self.set_type = set_type
+        self.atoms = atoms
         self.ref = reference
-        self.sys_name = basename(system.xyz)[:-4]
-        vec = self._coords[self.atoms[1]] - self._coords[self.atoms[0]]
-        self._dist = np.linalg.norm(vec)
-
-    @property
-    def distance(self):
-        """Returns the distance between given atoms in Angstrom."""
-        return self._dist
+        self.value = float(value)
 
     @property
     def deviation(self):
-        """Returns the distance deviation to reference."""
-        return self.ref - self._dist
+        """Returns the deviation to reference.
+
+        Dihedral deviations are wrapped into [-180, 180) degrees.
+        """
+        deviation = self.ref - self.value
+        if self.set_type == "dihedral":
+            deviation = (deviation + 180.0) % 360.0 - 180.0
+        return deviation
+
+
+class Missing(object):
+    """Placeholder for a result that is missing because calculations failed.
+
+    Has the attributes of Reaction, AtomizationEnergy and Measurement objects
+    used for writing results, with None for all calculated values.
+    """
+
+    def __init__(self, name, reference, systems, xyz=None):
+        """Instantiation method.
+
+        Inputs:
+        @:param name: Reaction equation or system name.
+        @:param reference: Reference value.
+        @:param systems: List of the systems without result.
+        @:param xyz: Path to the system's xyz file (atomization energies).
+        """
+        self.reaction = name
+        self.sys_name = name
+        self.xyz = xyz
+        self.ref = reference
+        self.missing_systems = systems
+        self.energy = None
+        self.eat = None
+        self.value = None
+        self.deviation = None
 
 
 class Deviations(object):
@@ -207,7 +265,8 @@ class Deviations(object):
     Uses lists of Reaction objects or AtomizationEnergy objects of a test set as
     inputs and calculates Mean Signed Deviation (MSD), Mean Absolute Deviation
     (MAD), Root Mean Square Deviation (RMSD), and the maximum absolute deviation
-    (MAX) of the test set.
+    (MAX) of the test set. Missing objects are counted, but not included in the
+    statistics.
     """
 
     def __init__(self, obj_list):
@@ -219,17 +278,26 @@ class Deviations(object):
         signed_deviations = []
         abs_deviations = []
         square_sum = 0.0
+        self.n_missing = 0
         for entry in obj_list:
+            if isinstance(entry, Missing):
+                self.n_missing += 1
+                continue
             # sanity check
-            if not isinstance(entry, (AtomizationEnergy, Reaction, Distance)):
-                msg = ("Each entry in the list has to be a AtomizationEnergy "
-                       "or Reaction object, instead received: %s")
+            if not isinstance(entry, (AtomizationEnergy, Reaction,
+                                      Measurement)):
+                msg = ("Each entry in the list has to be a AtomizationEnergy, "
+                       "Reaction or Measurement object, instead received: %s")
                 raise DeviationError(msg % type(entry))
             # deviation sums
             signed_deviations.append(entry.deviation)
             abs_deviations.append(abs(entry.deviation))
             square_sum += entry.deviation**2
+        self.deviations = np.array(signed_deviations, dtype=float)
         n_entries = len(signed_deviations)  # number of entries
+        if n_entries == 0:  # all entries missing
+            self._msd = self._mad = self._rmsd = self._max = np.nan
+            return
         # Calculate error values
         self._msd = np.sum(signed_deviations) / n_entries
         self._mad = np.sum(abs_deviations) / n_entries
@@ -257,48 +325,118 @@ class Deviations(object):
         return self._max
 
 
-def write_results(testsets, dftb_calcs, dtnn_calcs=None):
+def get_entries(set_definition, systems, atomics=None):
+    """Evaluates one testset from its calculated systems.
+
+    Inputs:
+    @:param set_definition: Dictionary describing the testset as given in
+        the input file.
+    @:param systems: Dictionary of system names and finished drivers.
+    @:param atomics: Optional free atom energies for atomization energies,
+        see AtomizationEnergy.
+
+    @:returns list of Reaction, AtomizationEnergy or Measurement objects in
+        input order, Missing objects where calculations failed.
+    """
+    set_type = set_definition["type"]
+    if set_type == "reaction":
+        return _get_reactions(systems, set_definition["reactions"])
+    elif set_type == "atomization":
+        return _get_atomizations(systems, set_definition["references"],
+                                 set_definition["path"], atomics)
+    elif set_type in N_ATOMS:
+        return _get_measurements(systems, set_definition["references"],
+                                 set_type)
+    raise DeviationError("Unknown testset type '%s'." % set_type)
+
+
+def write_results(testsets, dftb_calcs, dtnn_calcs=None, atomics=None,
+                  bootstrap=None):
+    """Writes the results of all testsets and their deviations.
+
+    WTMAD-1 and WTMAD-2 of the testsets of the GMTKN55 collection are
+    written to <method>_WTMAD.csv.
+
+    Inputs:
+    @:param testsets: Dictionary of testset names and definitions.
+    @:param dftb_calcs: Dictionary of testset names and dictionaries of
+        system names and DFTB+ drivers.
+    @:param dtnn_calcs: Same as dftb_calcs for DTNN.
+    @:param atomics: Optional free atom energies of the DFTB+ setup for
+        atomization energies. DTNN results use the builtin energies.
+    @:param bootstrap: Optional 'Bootstrap' option adding confidence
+        intervals of all statistics.
+    """
     dftb_deviations = dict()
     dtnn_deviations = dict()
-    for set_name in testsets.keys():
-        set_type = testsets[set_name]["type"]
-        dftb_systems = dftb_calcs[set_name]
+    writers = {"reaction": _write_reactions,
+               "atomization": _write_atomizations,
+               "distance": _write_measurements,
+               "angle": _write_measurements,
+               "dihedral": _write_measurements}
+    for set_name, set_definition in testsets.items():
+        write = writers[set_definition["type"]]
+        dftb_entries = get_entries(set_definition,
+                                   dftb_calcs.get(set_name, dict()), atomics)
+        dftb_deviations[set_name] = Deviations(dftb_entries)
         if dtnn_calcs:
-            dtnn_systems = dtnn_calcs[set_name]
-        if set_type == "reaction":
-            inputs = testsets[set_name]["reactions"]
-            dftb_reacs = _get_reactions(dftb_systems, inputs)
-            dftb_deviations[set_name] = Deviations(dftb_reacs)
-            if dtnn_calcs:
-                dtnn_reacs = _get_reactions(dtnn_systems, inputs)
-                dtnn_deviations[set_name] = Deviations(dtnn_reacs)
-                _write_reactions(set_name, dftb_reacs, dtnn_reacs)
-            else:
-                _write_reactions(set_name, dftb_reacs)
-        elif set_type == "atomization":
-            set_path = testsets[set_name]["path"]
-            inputs = testsets[set_name]["references"]
-            dftb_eats = _get_atomizations(dftb_systems, inputs, set_path)
-            dftb_deviations[set_name] = Deviations(dftb_eats)
-            if dtnn_calcs:
-                dtnn_eats = _get_atomizations(dtnn_systems, inputs, set_path)
-                dtnn_deviations[set_name] = Deviations(dtnn_eats)
-                _write_atomizations(set_name, dftb_eats, dtnn_eats)
-            else:
-                _write_atomizations(set_name, dftb_eats)
-        elif set_type == "distance":
-            inputs = testsets[set_name]["references"]
-            dftb_dists = _get_distances(dftb_systems, inputs)
-            dftb_deviations[set_name] = Deviations(dftb_dists)
-            if dtnn_calcs:
-                dtnn_dists = _get_distances(dtnn_systems, inputs)
-                dtnn_deviations[set_name] = Deviations(dtnn_dists)
-                _write_distances(set_name, dftb_dists, dtnn_dists)
-            else:
-                _write_distances(set_name, dftb_dists)
-    _write_deviations(dftb_deviations, "DFTB_deviations.csv")
+            dtnn_entries = get_entries(set_definition,
+                                       dtnn_calcs.get(set_name, dict()))
+            dtnn_deviations[set_name] = Deviations(dtnn_entries)
+            write(set_name, dftb_entries, dtnn_entries)
+        else:
+            write(set_name, dftb_entries)
+    _write_summary(testsets, dftb_deviations, "DFTB", bootstrap)
     if dtnn_calcs:
-        _write_deviations(dtnn_deviations, "DTNN_deviations.csv")
+        _write_summary(testsets, dtnn_deviations, "DTNN", bootstrap)
+
+
+def references(set_definition):
+    """Returns the reference values of all entries of a testset."""
+    if set_definition["type"] == "reaction":
+        return np.array([x["reference"] for x in set_definition["reactions"]],
+                        dtype=float)
+    values = set_definition["references"].values()
+    if set_definition["type"] != "atomization":
+        values = [x["reference"] for x in values]
+    return np.array(list(values), dtype=float)
+
+
+def summarize(testsets, deviations, bootstrap=None):
+    """Calculates confidence intervals and WTMADs of all testsets.
+
+    Inputs:
+    @:param testsets: Dictionary of testset names and definitions.
+    @:param deviations: Dictionary of testset names and Deviations objects.
+    @:param bootstrap: Optional 'Bootstrap' option.
+
+    @:returns (bounds, wtmads): bounds is None or an (n_testsets, 4, 2)
+        array of the lower and upper bounds of MSD, MAD, RMSD and MAX,
+        wtmads a dictionary of 'WTMAD-1' and 'WTMAD-2' and their value and
+        bounds (None without bootstrap), empty without GMTKN55 testsets.
+    """
+    names = list(testsets)
+    samples = bounds = None
+    if bootstrap:
+        samples = statistics.bootstrap(
+            [deviations[x].deviations for x in names], bootstrap["samples"],
+            bootstrap["seed"])
+        bounds = statistics.intervals(samples, bootstrap["confidence"])
+    subsets = [i for i, x in enumerate(names)
+               if testsets[x].get("collection") == statistics.GMTKN55]
+    wtmads = dict()
+    if subsets:
+        refs = [references(testsets[names[i]]) for i in subsets]
+        values = statistics.wtmad(refs, [deviations[names[i]].mad
+                                         for i in subsets])
+        sampled = [None, None]
+        if samples is not None:
+            sampled = [statistics.intervals(x, bootstrap["confidence"])
+                       for x in statistics.wtmad(refs,
+                                                 samples[:, subsets, 1])]
+        for i, metric in enumerate(("WTMAD-1", "WTMAD-2")):
+            wtmads[metric] = (float(values[i]), sampled[i])
+    return bounds, wtmads
 
 
 def _get_reactions(systems, inputs):
@@ -306,25 +444,61 @@ def _get_reactions(systems, inputs):
     for reaction in inputs:
         eq = reaction["equation"]
         ref = reaction["reference"]
-        reac_list.append(Reaction(eq, systems, ref))
+        stoichiometry = reaction.get("stoichiometry") or parse_equation(eq)
+        missing = sorted(x for x in stoichiometry if x not in systems)
+        if missing:
+            reac_list.append(Missing(eq, ref, missing))
+            continue
+        reac_list.append(Reaction(eq, systems, ref, stoichiometry))
     return reac_list
 
 
-def _get_atomizations(systems, inputs, set_path):
+def _get_atomizations(systems, inputs, set_path, atomics=None):
     eat_list = []
     for name, ref in inputs.items():
         xyz = join(set_path, "%s.xyz" % name)
-        eat_list.append(AtomizationEnergy(xyz, systems[name].energy, ref))
+        if name not in systems:
+            eat_list.append(Missing(name, ref, [name], xyz))
+            continue
+        eat_list.append(AtomizationEnergy(xyz, systems[name].energy, ref,
+                                          atomics))
     return eat_list
 
 
-def _get_distances(systems, inputs):
-    dist_list = []
+def _get_measurements(systems, inputs, set_type):
+    """Measures all requested geometric properties of a testset at once.
+
+    The coordinates of all calculated systems are joined into one array, so
+    every distance, angle or dihedral is calculated in a single NumPy pass.
+    """
+    names = [x for x in inputs if x in systems]
+    measured = dict()
+    if names:
+        coords = [np.asarray(systems[x].coordinates).reshape(-1, 3)
+                  for x in names]
+        offsets = np.cumsum([0] + [len(x) for x in coords[:-1]])
+        atoms = np.array([[int(y) - 1 for y in
+                           str(inputs[x]["atoms"]).split(",")]
+                          for x in names], dtype=np.int64)
+        values = measure(np.concatenate(coords), atoms + offsets[:, None])
+        measured = dict(zip(names, values))
+    entries = []
     for sys_name in inputs:
         atoms = inputs[sys_name]["atoms"]
         ref = inputs[sys_name]["reference"]
-        dist_list.append(Distance(systems[sys_name], atoms, ref))
-    return dist_list
+        if sys_name not in measured:
+            entries.append(Missing(sys_name, ref, [sys_name]))
+            continue
+        entries.append(Measurement(sys_name, set_type, atoms, ref,
+                                   measured[sys_name]))
+    return entries
+
+
+def _fmt(value):
+    """Formats a result value for the output files."""
+    if value is None:
+        return MISSING
+    return str(np.round(value, 3))
 
 
 def _write_reactions(set_name, dftb_reacs, dtnn_reacs=None):
@@ -335,9 +509,9 @@ def _write_reactions(set_name, dftb_reacs, dtnn_reacs=None):
         data = []
         for reaction in dftb_reacs:
             data.append({"Reaction": reaction.reaction,
-                         "Reference": str(np.round(reaction.ref, 3)),
-                         "DFTB3": str(np.round(reaction.energy, 3)),
-                         "ΔDFTB3": str(np.round(reaction.deviation, 3))
+                         "Reference": _fmt(reaction.ref),
+                         "DFTB3": _fmt(reaction.energy),
+                         "ΔDFTB3": _fmt(reaction.deviation)
                          })
         print("Writing results of reaction test set %s "
               "to file %s" % (set_name, "%s.csv" % set_name))
@@ -354,11 +528,11 @@ def _write_reactions_with_dtnn(set_name, dftb_reacs, dtnn_reacs):
     for i, dftb_reaction in enumerate(dftb_reacs):
         dtnn_reaction = dtnn_reacs[i]
         data.append({"Reaction": dftb_reaction.reaction,
-                     "Reference": str(np.round(dftb_reaction.ref, 3)),
-                     "DFTB3": str(np.round(dftb_reaction.energy, 3)),
-                     "DTNN": str(np.round(dtnn_reaction.energy, 3)),
-                     "ΔDFTB3": str(np.round(dftb_reaction.deviation, 3)),
-                     "ΔDTNN": str(np.round(dtnn_reaction.deviation, 3))
+                     "Reference": _fmt(dftb_reaction.ref),
+                     "DFTB3": _fmt(dftb_reaction.energy),
+                     "DTNN": _fmt(dtnn_reaction.energy),
+                     "ΔDFTB3": _fmt(dftb_reaction.deviation),
+                     "ΔDTNN": _fmt(dtnn_reaction.deviation)
                      })
     print("Writing results of reaction test set %s "
           "to file %s" % (set_name, "%s.csv" % set_name))
@@ -378,9 +552,9 @@ def _write_atomizations(set_name, dftb_eats, dtnn_eats=None):
         for energy in dftb_eats:
             sys_name = basename(energy.xyz)[:-4]
             data.append({"System": sys_name,
-                         "Reference": str(np.round(energy.ref, 3)),
-                         "DFTB3": str(np.round(energy.eat, 3)),
-                         "ΔDFTB3": str(np.round(energy.deviation, 3))
+                         "Reference": _fmt(energy.ref),
+                         "DFTB3": _fmt(energy.eat),
+                         "ΔDFTB3": _fmt(energy.deviation)
                          })
         print("Writing results of atomization energy test set %s "
               "to file %s" % (set_name, "%s.csv" % set_name))
@@ -398,11 +572,11 @@ def _write_atomizations_with_dtnn(set_name, dftb_eats, dtnn_eats):
         dtnn_energy = dtnn_eats[i]
         sys_name = basename(dftb_energy.xyz)[:-4]
         data.append({"System": sys_name,
-                     "Reference": str(np.round(dftb_energy.ref, 3)),
-                     "DFTB3": str(np.round(dftb_energy.eat, 3)),
-                     "DTNN": str(np.round(dtnn_energy.eat, 3)),
-                     "ΔDFTB3": str(np.round(dftb_energy.deviation, 3)),
-                     "ΔDTNN": str(np.round(dtnn_energy.deviation, 3)),
+                     "Reference": _fmt(dftb_energy.ref),
+                     "DFTB3": _fmt(dftb_energy.eat),
+                     "DTNN": _fmt(dtnn_energy.eat),
+                     "ΔDFTB3": _fmt(dftb_energy.deviation),
+                     "ΔDTNN": _fmt(dtnn_energy.deviation),
                      })
     print("Writing results of atomization energy test set %s "
           "to file %s" % (set_name, "%s.csv" % set_name))
@@ -413,20 +587,19 @@ def _write_atomizations_with_dtnn(set_name, dftb_eats, dtnn_eats):
             writer.writerow(entry)
 
 
-def _write_distances(set_name, dftb_dists, dtnn_dists=None):
-    if dtnn_dists:
-        _write_distances_with_dtnn(set_name, dftb_dists, dtnn_dists)
+def _write_measurements(set_name, dftb_values, dtnn_values=None):
+    if dtnn_values:
+        _write_measurements_with_dtnn(set_name, dftb_values, dtnn_values)
     else:
         categories = ["System", "Reference", "DFTB3", "ΔDFTB3"]
         data = []
-        for dftb_dist in dftb_dists:
-            sys_name = dftb_dist.sys_name
-            data.append({"System": sys_name,
-                         "Reference": str(np.round(dftb_dist.ref, 3)),
-                         "DFTB3": str(np.round(dftb_dist.distance, 3)),
-                         "ΔDFTB3": str(np.round(dftb_dist.deviation, 3))
+        for dftb_value in dftb_values:
+            data.append({"System": dftb_value.sys_name,
+                         "Reference": _fmt(dftb_value.ref),
+                         "DFTB3": _fmt(dftb_value.value),
+                         "ΔDFTB3": _fmt(dftb_value.deviation)
                          })
-        print("Writing results of atomization energy test set %s "
+        print("Writing results of geometry test set %s "
               "to file %s" % (set_name, "%s.csv" % set_name))
         with open("%s.csv" % set_name, "w") as out:
             writer = csv.DictWriter(out, fieldnames=categories)
@@ -435,20 +608,19 @@ def _write_distances(set_name, dftb_dists, dtnn_dists=None):
                 writer.writerow(entry)
 
 
-def _write_distances_with_dtnn(set_name, dftb_dists, dtnn_dists):
+def _write_measurements_with_dtnn(set_name, dftb_values, dtnn_values):
     categories = ["System", "Reference", "DFTB3", "DTNN", "ΔDFTB3", "ΔDTNN"]
     data = []
-    for i, dftb_dist in enumerate(dftb_dists):
-        dtnn_dist = dtnn_dists[i]
-        sys_name = dftb_dist.sys_name
-        data.append({"System": sys_name,
-                     "Reference": str(np.round(dftb_dist.ref, 3)),
-                     "DFTB3": str(np.round(dftb_dist.distance, 3)),
-                     "DTNN": str(np.round(dtnn_dist.distance, 3)),
-                     "ΔDFTB3": str(np.round(dftb_dist.deviation, 3)),
-                     "ΔDTNN": str(np.round(dtnn_dist.deviation, 3)),
+    for i, dftb_value in enumerate(dftb_values):
+        dtnn_value = dtnn_values[i]
+        data.append({"System": dftb_value.sys_name,
+                     "Reference": _fmt(dftb_value.ref),
+                     "DFTB3": _fmt(dftb_value.value),
+                     "DTNN": _fmt(dtnn_value.value),
+                     "ΔDFTB3": _fmt(dftb_value.deviation),
+                     "ΔDTNN": _fmt(dtnn_value.deviation),
                      })
-    print("Writing results of atomization energy test set %s "
+    print("Writing results of geometry test set %s "
           "to file %s" % (set_name, "%s.csv" % set_name))
     with open("%s.csv" % set_name, "w") as out:
         writer = csv.DictWriter(out, fieldnames=categories)
@@ -457,20 +629,52 @@ def _write_distances_with_dtnn(set_name, dftb_dists, dtnn_dists):
             writer.writerow(entry)
 
 
-def _write_deviations(dftb_deviations, filename):
-    categories = ["Set Name", "MSD", "MAD", "RMSD", "MAX"]
+def _write_summary(testsets, deviations, prefix, bootstrap=None):
+    bounds, wtmads = summarize(testsets, deviations, bootstrap)
+    _write_deviations(deviations, "%s_deviations.csv" % prefix, bounds)
+    if wtmads:
+        _write_wtmads(wtmads, "%s_WTMAD.csv" % prefix)
+
+
+def _write_deviations(dftb_deviations, filename, bounds=None):
+    categories = ["Set Name", "MSD", "MAD", "RMSD", "MAX", "Missing"]
+    if bounds is not None:
+        categories.extend("%s %s" % (x, y) for x in statistics.STATISTICS
+                          for y in ("low", "high"))
     data = []
-    for testset in dftb_deviations.keys():
+    for i, testset in enumerate(dftb_deviations.keys()):
         dev = dftb_deviations[testset]
-        data.append({"Set Name": testset,
-                     "MSD": str(np.round(dev.msd, 3)),
-                     "MAD": str(np.round(dev.mad, 3)),
-                     "RMSD": str(np.round(dev.rmsd, 3)),
-                     "MAX": str(np.round(dev.max, 3))
-                     })
+        row = {"Set Name": testset,
+               "MSD": _fmt(dev.msd),
+               "MAD": _fmt(dev.mad),
+               "RMSD": _fmt(dev.rmsd),
+               "MAX": _fmt(dev.max),
+               "Missing": str(dev.n_missing)
+               }
+        if bounds is not None:
+            for j, stat in enumerate(statistics.STATISTICS):
+                row["%s low" % stat] = _fmt(bounds[i, j, 0])
+                row["%s high" % stat] = _fmt(bounds[i, j, 1])
+        data.append(row)
     print("Writing deviations for all test sets to file %s" % filename)
     with open(filename, "w") as out:
         writer = csv.DictWriter(out, fieldnames=categories)
         writer.writeheader()
         for entry in data:
             writer.writerow(entry)
+
+
+def _write_wtmads(wtmads, filename):
+    categories = ["Metric", "Value"]
+    if any(x[1] is not None for x in wtmads.values()):
+        categories.extend(["Low", "High"])
+    print("Writing weighted total MADs of GMTKN55 to file %s" % filename)
+    with open(filename, "w") as out:
+        writer = csv.DictWriter(out, fieldnames=categories)
+        writer.writeheader()
+        for metric, (value, bounds) in wtmads.items():
+            row = {"Metric": metric, "Value": _fmt(value)}
+            if bounds is not None:
+                row["Low"] = _fmt(bounds[0])
+                row["High"] = _fmt(bounds[1])
+            writer.writerow(row)
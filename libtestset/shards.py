@@ -0,0 +1,134 @@
+from heapq import heapify, heappop, heappush
+from libtestset.jobs import StoredResult
+from libtestset.planner import DEFAULT_MODEL
+from os import getpid, replace
+
+import json
+
+SHARD_FILE = "shard_%d_of_%d.json"
+
+
+class ShardError(Exception):
+    """Error raised for invalid shard selections or shard result files."""
+    pass
+
+
+def parse(selection):
+    """Parses a shard selection 'i/N' with 1 <= i <= N.
+
+    @:returns (i, N) tuple of integers.
+    """
+    try:
+        index, n_shards = (int(x) for x in selection.split("/"))
+    except ValueError:
+        raise ShardError("Shard '%s' is not of the form i/N." % selection)
+    if not 1 <= index <= n_shards:
+        raise ShardError("Shard '%s' needs 1 <= i <= N." % selection)
+    return index, n_shards
+
+
+def assign(jobs, n_shards):
+    """Distributes jobs over shards with balanced estimated cost.
+
+    Jobs are assigned longest first to the shard with the least total cost.
+    The cost only depends on the number of atoms and ties are broken by the
+    job keys, so every shard of a run computes the same assignment.
+
+    Inputs:
+    @:param jobs: List of jobs.Job objects of all testsets.
+    @:param n_shards: Number of shards.
+
+    @:returns list of n_shards lists of jobs.
+    """
+    prefactor, exponent = DEFAULT_MODEL
+    order = sorted(jobs, key=lambda x: (-x.n_atoms, x.key))
+    loads = [(0.0, x) for x in range(n_shards)]
+    heapify(loads)
+    shards = [[] for _i in range(n_shards)]
+    for job in order:
+        load, index = heappop(loads)
+        shards[index].append(job)
+        heappush(loads, (load + prefactor * job.n_atoms**exponent, index))
+    return shards
+
+
+def select(jobs, index, n_shards):
+    """Returns the jobs of shard index (1-based) of n_shards."""
+    selected = {x.key for x in assign(jobs, n_shards)[index - 1]}
+    return [x for x in jobs if x.key in selected]
+
+
+def write(path, index, n_shards, jobs, drivers):
+    """Writes the results of one shard.
+
+    Inputs:
+    @:param path: Path of the shard result file.
+    @:param index: Shard number (1-based).
+    @:param n_shards: Number of shards.
+    @:param jobs: List of the jobs.Job objects of the shard.
+    @:param drivers: Dictionary of method names and dictionaries of job keys
+        and finished drivers.
+    """
+    data = {"shard": [index, n_shards],
+            "jobs": sorted(x.key for x in jobs),
+            "results": {method: {key: StoredResult.from_driver(x).to_dict()
+                                 for key, x in results.items()}
+                        for method, results in drivers.items()},
+            "errors": {x.key: x.errors for x in jobs if x.errors}}
+    tmp = "%s.%d.tmp" % (path, getpid())
+    with open(tmp, "w") as outfile:
+        json.dump(data, outfile)
+    replace(tmp, path)
+
+
+def merge(paths, jobs):
+    """Combines the result files of all shards of a run.
+
+    Inputs:
+    @:param paths: Paths of the shard result files.
+    @:param jobs: List of jobs.Job objects of all testsets.
+
+    @:returns dictionary of method names and dictionaries of job keys and
+        jobs.StoredResult objects. Errors of failed jobs are restored in
+        Job.errors.
+    """
+    n_shards = None
+    found = dict()
+    results = dict()
+    errors = dict()
+    for path in paths:
+        try:
+            with open(path, "r") as infile:
+                data = json.load(infile)
+            index, n_total = data["shard"]
+        except (OSError, ValueError, KeyError) as exc:
+            raise ShardError("Cannot read shard file %s: %s" % (path, exc))
+        if n_shards is None:
+            n_shards = n_total
+        elif n_total != n_shards:
+            raise ShardError("Shard file %s is part of a run with %d shards, "
+                             "not %d." % (path, n_total, n_shards))
+        found[index] = set(data["jobs"])
+        for method, method_results in data["results"].items():
+            results.setdefault(method, dict()).update(
+                {key: StoredResult(x) for key, x in method_results.items()})
+        errors.update(data["errors"])
+    if n_shards is None:
+        raise ShardError("No shard files given.")
+    expected = assign(jobs, n_shards)
+    missing = []
+    for index in range(1, n_shards + 1):
+        keys = {x.key for x in expected[index - 1]}
+        if found.get(index) != keys:
+            missing.append(str(index))
+    if missing:
+        raise ShardError("Results of shard(s) %s of %d are missing or belong "
+                         "to a different input, please (re)run them."
+                         % (", ".join(missing), n_shards))
+    for job in jobs:
+        job.errors = dict(errors.get(job.key, dict()))
+    return results
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,69 @@
+import numpy as np
+
+STAGE_DIR = "stage_1"
+# Loose settings of the first stage of a staged optimization
+DEFAULT_HSD = {"Driver/MaxForceComponent": 1e-3,
+               "Hamiltonian/SCCTolerance": 1e-4}
+DEFAULT_FMAX = 0.05  # eV/Angstrom, first stage of DTNN optimizations
+FMAX = 0.00005  # eV/Angstrom, final DTNN optimizations
+
+
+def report(testsets, jobs, drivers, method):
+    """Returns the geometry steps and timings of staged optimizations.
+
+    With 'check' enabled for a testset, every system was also optimized in a
+    single stage and the energies and wall times of both are compared.
+
+    Inputs:
+    @:param testsets: Dictionary of testset names and definitions.
+    @:param jobs: List of jobs.Job objects.
+    @:param drivers: Dictionary of job keys and finished drivers.
+    @:param method: Method name used in the report.
+
+    @:returns report string or None if no testset is staged.
+    """
+    staged = [x for x, y in testsets.items() if y.get("staged")]
+    if not staged:
+        return None
+    # systems, steps, steps of the first stage, wall time
+    counts = {x: [0, 0, 0, 0.0] for x in staged}
+    # systems, steps, wall time, energy differences
+    checks = {x: [0, 0, 0.0, []] for x in staged}
+    for job in jobs:
+        driver = drivers.get(job.key)
+        if getattr(driver, "stage_steps", None) is None:
+            continue  # failed, not staged or run elsewhere
+        for set_name, _sys_name in job.aliases:
+            if set_name not in counts:
+                continue
+            count = counts[set_name]
+            count[0] += 1
+            count[1] += driver.geometry_steps
+            count[2] += driver.stage_steps[0]
+            count[3] += driver.wall_time
+            reference = driver.reference
+            if reference is not None:
+                check = checks[set_name]
+                check[0] += 1
+                check[1] += reference["geometry_steps"]
+                check[2] += reference["wall_time"]
+                check[3].append(driver.energy - reference["energy"])
+    lines = ["Staged optimization (%s):" % method]
+    for set_name in staged:
+        n_jobs, steps, first, wall_time = counts[set_name]
+        lines.append("  %s: %d systems, %d geometry steps (%d in the loose "
+                     "stage), %.3f s" % (set_name, n_jobs, steps, first,
+                                         wall_time))
+        n_checked, ref_steps, ref_time, diffs = checks[set_name]
+        if not n_checked:
+            continue
+        diffs = np.abs(diffs)
+        speedup = ref_time / wall_time if wall_time else float("nan")
+        lines.append("    single stage: %d geometry steps, %.3f s (speedup "
+                     "%.2f), energy difference max. absolute %.6f kcal/mol"
+                     % (ref_steps, ref_time, speedup, diffs.max()))
+    return "\n".join(lines)
+
+
+if __name__ == "__main__":
+    pass
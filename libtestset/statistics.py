@@ -0,0 +1,136 @@
+import numpy as np
+
+STATISTICS = ("MSD", "MAD", "RMSD", "MAX")
+GMTKN55 = "GMTKN55"  # collection name of the testsets weighted by WTMAD
+WTMAD2_MEAN = 56.84  # average |reference| over all GMTKN55 subsets, kcal/mol
+# WTMAD-1 weights by average |reference| of a subset: below 7.5, up to 75
+# and above 75 kcal/mol
+WTMAD1_LIMITS = (7.5, 75.0)
+WTMAD1_WEIGHTS = (10.0, 1.0, 0.1)
+DEFAULT_SAMPLES = 1000
+DEFAULT_CONFIDENCE = 0.95
+BATCH_VALUES = 10**7  # resampled values held in memory at once
+
+
+def bootstrap(deviations, n_samples=DEFAULT_SAMPLES, seed=None):
+    """Resamples the deviations of all testsets with replacement.
+
+    All testsets are resampled together: each batch draws one index matrix
+    for all deviations of all testsets and reduces it per testset, so the
+    cost does not depend on the number of testsets.
+
+    Inputs:
+    @:param deviations: List of 1D arrays of the deviations of each testset,
+        without missing values.
+    @:param n_samples: Number of bootstrap samples.
+    @:param seed: Seed of the random number generator.
+
+    @:returns (n_samples, n_testsets, 4) array of MSD, MAD, RMSD and MAX of
+        every sample, NaN for testsets without deviations.
+    """
+    sizes = np.array([len(x) for x in deviations], dtype=np.int64)
+    samples = np.full((n_samples, len(sizes), len(STATISTICS)), np.nan)
+    filled = np.flatnonzero(sizes)
+    if not len(filled):
+        return samples
+    values = np.concatenate([np.asarray(deviations[x], dtype=np.float64)
+                             for x in filled])
+    counts = sizes[filled]
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    rng = np.random.default_rng(seed)
+    batch = max(1, BATCH_VALUES // len(values))
+    for first in range(0, n_samples, batch):
+        last = min(first + batch, n_samples)
+        resampled = values[_draws(rng, last - first, counts, starts)]
+        absolute = np.abs(resampled)
+        samples[first:last, filled, 0] = np.add.reduceat(
+            resampled, starts, axis=1) / counts
+        samples[first:last, filled, 1] = np.add.reduceat(
+            absolute, starts, axis=1) / counts
+        samples[first:last, filled, 2] = np.sqrt(np.add.reduceat(
+            resampled**2, starts, axis=1) / counts)
+        samples[first:last, filled, 3] = np.maximum.reduceat(
+            absolute, starts, axis=1)
+    return samples
+
+
+def resample(values, statistic, n_samples=DEFAULT_SAMPLES, seed=None):
+    """Bootstrap samples of a statistic of paired values.
+
+    The rows of values are resampled together with replacement, drawn the
+    same way as in bootstrap(), e.g. the wall times of two variants of the
+    same calculation.
+
+    Inputs:
+    @:param values: Array of N rows.
+    @:param statistic: Function reducing an array of resampled rows, of
+        shape (n, N, ...), to n values.
+    @:param n_samples: Number of bootstrap samples.
+    @:param seed: Seed of the random number generator.
+
+    @:returns array of n_samples values of the statistic.
+    """
+    values = np.asarray(values, dtype=np.float64)
+    counts = np.array([len(values)], dtype=np.int64)
+    starts = np.zeros(1, dtype=np.int64)
+    rng = np.random.default_rng(seed)
+    batch = max(1, BATCH_VALUES // max(values.size, 1))
+    samples = []
+    for first in range(0, n_samples, batch):
+        last = min(first + batch, n_samples)
+        samples.append(statistic(values[_draws(rng, last - first, counts,
+                                               starts)]))
+    return np.concatenate(samples)
+
+
+def intervals(samples, confidence=DEFAULT_CONFIDENCE):
+    """Returns percentile confidence intervals of bootstrap samples.
+
+    Inputs:
+    @:param samples: Array of bootstrap samples along the first axis.
+    @:param confidence: Confidence level, e.g. 0.95.
+
+    @:returns array of the shape of one sample with a last axis of
+        (lower, upper) bounds, NaN where the samples are NaN.
+    """
+    tail = 50.0 * (1.0 - confidence)
+    bounds = np.percentile(samples, [tail, 100.0 - tail], axis=0)
+    return np.moveaxis(bounds, 0, -1)
+
+
+def wtmad(references, mads):
+    """Weighted total mean absolute deviations of GMTKN55 subsets.
+
+    Inputs:
+    @:param references: List of the reference values of every subset.
+    @:param mads: Array of the MADs of the subsets in its last axis, e.g.
+        bootstrap samples of shape (n_samples, n_subsets).
+
+    @:returns (WTMAD-1, WTMAD-2) of the shape of mads without its last axis,
+        NaN if a subset has no MAD.
+    """
+    counts = np.array([len(x) for x in references], dtype=np.float64)
+    means = np.array([np.mean(np.abs(x)) for x in references])
+    weights_1 = np.select([means < WTMAD1_LIMITS[0],
+                           means <= WTMAD1_LIMITS[1]],
+                          WTMAD1_WEIGHTS[:2], WTMAD1_WEIGHTS[2])
+    weights_2 = WTMAD2_MEAN / means
+    mads = np.asarray(mads, dtype=np.float64)
+    total = counts.sum()
+    return ((mads * counts * weights_1).sum(axis=-1) / total,
+            (mads * counts * weights_2).sum(axis=-1) / total)
+
+
+def _draws(rng, n_samples, counts, starts):
+    """Random indices into values stored group after group.
+
+    @:returns (n_samples, sum(counts)) array, every column draws from the
+        values of its own group.
+    """
+    owner = np.repeat(np.arange(len(counts)), counts)
+    return starts[owner] + (rng.random((n_samples, len(owner)))
+                            * counts[owner]).astype(np.int64)
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,185 @@
+from libtestset.constants import element_symbols
+from os import getpid, rename
+from os.path import exists, isdir, join
+from pathlib import Path
+from shutil import rmtree
+
+import numpy as np
+
+STORE_DIR = "%s_geometries"  # per method, e.g. DFTB_geometries
+ARRAYS = ("keys", "numbers", "coordinates", "offsets", "energies",
+          "wall_times")
+# Number of atoms of the geometric properties per testset type
+N_ATOMS = {"distance": 2, "angle": 3, "dihedral": 4}
+_NUMBERS = {sym.lower(): num for num, sym in enumerate(element_symbols)}
+
+
+class StoreError(Exception):
+    """Error raised when a geometry store cannot be read."""
+    pass
+
+
+class StoredGeometry(object):
+    """Result of one calculation in a GeometryStore.
+
+    Offers the attributes of a finished driver used for the analysis, the
+    coordinates are a view into the store's array.
+    """
+
+    def __init__(self, energy, atoms, coordinates, wall_time):
+        self.energy = energy
+        self.atoms = atoms
+        self.coordinates = coordinates
+        self.wall_time = wall_time
+
+
+class GeometryStore(object):
+    """Optimized geometries and energies of finished calculations.
+
+    All coordinates are held in one contiguous (N, 3) float64 array, the
+    atoms of calculation i are found at offsets[i]:offsets[i + 1]. A store
+    is saved as one .npy file per array and loaded memory-mapped, so stored
+    geometries can be analyzed again without reading them into memory.
+
+    Inputs for instantiation:
+    @:param keys: Job keys of the calculations.
+    @:param numbers: Atomic numbers of all atoms.
+    @:param coordinates: Coordinates of all atoms in Angstrom.
+    @:param offsets: Start offset of each calculation plus the atom count.
+    @:param energies: Total energies in kcal/mol.
+    @:param wall_times: Wall times in seconds, NaN if unknown.
+    """
+
+    def __init__(self, keys, numbers, coordinates, offsets, energies,
+                 wall_times):
+        self.keys = [str(x) for x in keys]
+        self.numbers = numbers
+        self.coordinates = coordinates
+        self.offsets = offsets
+        self.energies = energies
+        self.wall_times = wall_times
+        self._lookup = {key: i for i, key in enumerate(self.keys)}
+
+    def __contains__(self, key):
+        return key in self._lookup
+
+    def __len__(self):
+        return len(self.keys)
+
+    @classmethod
+    def from_drivers(cls, drivers):
+        """Collects the results of finished drivers into a store.
+
+        Inputs:
+        @:param drivers: Dictionary of job keys and finished drivers.
+        """
+        keys = sorted(drivers)
+        coordinates = [np.asarray(drivers[x].coordinates, dtype=np.float64)
+                       .reshape(-1, 3) for x in keys]
+        numbers = [_NUMBERS[str(y).lower()] for x in keys
+                   for y in drivers[x].atoms]
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        np.cumsum([len(x) for x in coordinates], out=offsets[1:])
+        if coordinates:
+            coordinates = np.ascontiguousarray(np.concatenate(coordinates))
+        else:
+            coordinates = np.zeros((0, 3), dtype=np.float64)
+        wall_times = [drivers[x].wall_time for x in keys]
+        return cls(keys, np.asarray(numbers, dtype=np.uint8), coordinates,
+                   offsets, np.array([drivers[x].energy for x in keys],
+                                     dtype=np.float64),
+                   np.array([np.nan if x is None else x for x in wall_times],
+                            dtype=np.float64))
+
+    @classmethod
+    def load(cls, path):
+        """Loads a saved store with memory-mapped coordinates.
+
+        Inputs:
+        @:param path: Directory the store was saved to.
+        """
+        try:
+            data = {x: np.load(join(path, "%s.npy" % x),
+                               mmap_mode=None if x == "keys" else "r")
+                    for x in ARRAYS}
+        except (OSError, ValueError) as exc:
+            raise StoreError("Cannot read geometry store %s: %s"
+                             % (path, exc))
+        return cls(data["keys"].tolist(), data["numbers"],
+                   data["coordinates"], data["offsets"], data["energies"],
+                   data["wall_times"])
+
+    def save(self, path):
+        """Writes the store to a directory, replacing an older store."""
+        tmp = "%s.%d.tmp" % (path, getpid())
+        if exists(tmp):
+            rmtree(tmp)
+        Path(tmp).mkdir(parents=True)
+        arrays = {"keys": np.asarray(self.keys, dtype=np.str_),
+                  "numbers": self.numbers, "coordinates": self.coordinates,
+                  "offsets": self.offsets, "energies": self.energies,
+                  "wall_times": self.wall_times}
+        for name in ARRAYS:
+            np.save(join(tmp, "%s.npy" % name), arrays[name])
+        if isdir(path):
+            rmtree(path)
+        rename(tmp, path)
+
+    def get(self, key):
+        """Returns the StoredGeometry of a job key."""
+        i = self._lookup[key]
+        start, end = self.offsets[i], self.offsets[i + 1]
+        wall_time = float(self.wall_times[i])
+        return StoredGeometry(
+            float(self.energies[i]),
+            [element_symbols[x] for x in self.numbers[start:end]],
+            self.coordinates[start:end],
+            None if np.isnan(wall_time) else wall_time)
+
+    def drivers(self, jobs):
+        """Returns the stored results of jobs, missing ones are left out.
+
+        @:returns dictionary of job keys and StoredGeometry objects.
+        """
+        return {x.key: self.get(x.key) for x in jobs if x.key in self}
+
+
+def path(method):
+    """Returns the directory of the geometry store of a method."""
+    return STORE_DIR % method.rstrip("+")
+
+
+def measure(coordinates, atoms):
+    """Calculates distances, angles or dihedrals in one vectorized pass.
+
+    Inputs:
+    @:param coordinates: (N, 3) array of the coordinates of all systems.
+    @:param atoms: (M, k) integer array of row indices into coordinates,
+        k = 2 for distances, 3 for angles and 4 for dihedral angles.
+
+    @:returns (M,) array of distances in Angstrom or angles in degrees.
+        Angles are between the bonds 2-1 and 2-3, dihedrals between the
+        planes 1-2-3 and 2-3-4 in the range (-180, 180].
+    """
+    points = np.asarray(coordinates)[np.asarray(atoms)]
+    bonds = np.diff(points, axis=1)  # (M, k - 1, 3)
+    if points.shape[1] == 2:
+        return np.linalg.norm(bonds[:, 0], axis=1)
+    if points.shape[1] == 3:
+        first, second = -bonds[:, 0], bonds[:, 1]
+        cosine = np.einsum("ij,ij->i", first, second) / (
+            np.linalg.norm(first, axis=1) * np.linalg.norm(second, axis=1))
+        return np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+    if points.shape[1] == 4:
+        normal_1 = np.cross(bonds[:, 0], bonds[:, 1])
+        normal_2 = np.cross(bonds[:, 1], bonds[:, 2])
+        axis = bonds[:, 1] / np.linalg.norm(bonds[:, 1], axis=1)[:, None]
+        x = np.einsum("ij,ij->i", normal_1, normal_2)
+        y = np.einsum("ij,ij->i", np.cross(normal_1, normal_2), axis)
+        return np.degrees(np.arctan2(y, x))
+    raise ValueError("Geometric properties need 2 to 4 atoms, not %d."
+                     % points.shape[1])
+
+
+if __name__ == "__main__":
+    pass
@@ -0,0 +1,152 @@
+from hashlib import sha1
+from itertools import product
+from libtestset import api, atomic, backends, pipeline
+from time import perf_counter
+
+import csv
+import json
+import numpy as np
+
+SWEEP_FILE = "DFTB_sweep.csv"
+WTMAD_FILE = "DFTB_sweep_WTMAD.csv"
+
+
+def variants(settings):
+    """Expands the normalized 'Sweep' option into named variants.
+
+    Every named variant is combined with every point of the grid, i.e. every
+    combination of the grid values. Names of grid points are built from the
+    last part of the HSD paths, e.g. "3ob, Exponent=4.2".
+
+    @:returns dictionary of variant names and dictionaries of HSD overrides.
+    """
+    named = settings["variants"] or {"": dict()}
+    grid = settings["grid"]
+    labels = {x: x.split("/")[-1] for x in grid}
+    if len(set(labels.values())) < len(labels):
+        labels = {x: x for x in grid}  # last parts are ambiguous
+    expanded = dict()
+    for name, overrides in named.items():
+        for values in product(*grid.values()):
+            variant = dict(overrides)
+            variant.update(zip(grid, values))
+            parts = ["%s=%s" % (labels[x], y) for x, y in zip(grid, values)]
+            expanded[", ".join([name] * bool(name) + parts)] = variant
+    return expanded
+
+
+def expand(jobs, variants):
+    """Builds the jobs of all variants as one job graph.
+
+    Every job is copied per variant with the variant's overrides and a key
+    of its own. Copies that end up with the same settings, e.g. because a
+    variant repeats the setting of a testset, are shared. The names of the
+    variants a copy belongs to are kept in its variants list.
+
+    Inputs:
+    @:param jobs: List of jobs.Job objects of all testsets.
+    @:param variants: Dictionary of variant names and HSD overrides.
+
+    @:returns dictionary of variant names and lists of jobs, in the order of
+        jobs.
+    """
+    shared = dict()
+    expanded = dict()
+    for name, overrides in variants.items():
+        expanded[name] = []
+        for job in jobs:
+            variant_job = api.with_overrides(job, overrides)
+            variant_job.variants = []
+            settings = json.dumps(variant_job.overrides, sort_keys=True,
+                                  default=str)
+            variant_job.key = sha1(("%s\n%s" % (job.key, settings))
+                                   .encode()).hexdigest()[:16]
+            variant_job = shared.setdefault(variant_job.key, variant_job)
+            variant_job.variants.append(name)
+            expanded[name].append(variant_job)
+    return expanded
+
+
+def run(testsets, options, jobs, variants, workers=1, history=None,
+        archive=None, cache=None, workdir=None):
+    """Runs all variants of all testsets with DFTB+ in one go.
+
+    The calculations of all variants are scheduled together, longest first
+    by the timing history (or by the number of atoms), over the given
+    number of parallel workers.
+
+    Inputs:
+    @:param testsets: Dictionary of testset names and definitions.
+    @:param options: 'Options' section of the settings.
+    @:param jobs: List of jobs.Job objects of all testsets.
+    @:param variants: Dictionary of variant names and HSD overrides.
+    @:param workers: Number of calculations running at the same time.
+    @:param history: Optional planner.TimingHistory for the job costs, the
+        wall times of the sweep are added to it.
+    @:param archive: Optional archive.OutputArchive for output files.
+    @:param cache: Optional atomic.AtomicEnergyCache.
+    @:param workdir: Directory for the calculation directories, defaults to
+        the current working directory.
+
+    @:returns dictionary of variant names and api.Evaluation objects.
+    """
+    expanded = expand(jobs, variants)
+    unique = list({x.key: x for y in expanded.values() for x in y}.values())
+    if history is not None:
+        unique.sort(key=lambda x: -history.estimate("DFTB+", x)[0])
+    else:
+        unique.sort(key=lambda x: -x.n_atoms)
+    methods = [x for x in backends.enabled(options) if x.name == "DFTB+"]
+    start = perf_counter()
+    drivers = pipeline.run(methods, unique, options, archive, workdir,
+                           workers=workers)["DFTB+"]
+    wall_time = perf_counter() - start
+    if history is not None:
+        history.record("DFTB+", unique, drivers)
+    evaluations = dict()
+    for name, variant_jobs in expanded.items():
+        atomics = atomic.reference_energies(testsets, options, cache,
+                                            variants[name], workdir)
+        evaluations[name] = api.evaluation("DFTB+", testsets, variant_jobs,
+                                           drivers, wall_time, atomics)
+    return evaluations
+
+
+def write(evaluations, filename=SWEEP_FILE, wtmad_file=WTMAD_FILE):
+    """Writes the statistics of every variant and testset to one table.
+
+    WTMAD-1 and WTMAD-2 of the variants are written to wtmad_file if the
+    testsets include the GMTKN55 collection.
+    """
+    categories = ["Variant", "Set Name", "MSD", "MAD", "RMSD", "MAX",
+                  "Missing"]
+    print("Writing statistics of %d variants to file %s"
+          % (len(evaluations), filename))
+    with open(filename, "w") as out:
+        writer = csv.DictWriter(out, fieldnames=categories)
+        writer.writeheader()
+        for name, evaluation in evaluations.items():
+            for set_name, result in evaluation.testsets.items():
+                writer.writerow({"Variant": name, "Set Name": set_name,
+                                 "MSD": str(np.round(result.msd, 3)),
+                                 "MAD": str(np.round(result.mad, 3)),
+                                 "RMSD": str(np.round(result.rmsd, 3)),
+                                 "MAX": str(np.round(result.max, 3)),
+                                 "Missing": str(result.n_missing)})
+    wtmads = {x: y.wtmad for x, y in evaluations.items()}
+    if not any(wtmads.values()):
+        return
+    print("Writing weighted total MADs of the variants to file %s"
+          % wtmad_file)
+    with open(wtmad_file, "w") as out:
+        writer = csv.DictWriter(out, fieldnames=["Variant", "WTMAD-1",
+                                                 "WTMAD-2"])
+        writer.writeheader()
+        for name, values in wtmads.items():
+            row = {x: str(np.round(y, 3)) for x, y in values.items()}
+            row["Variant"] = name
+            writer.writerow(row)
+
+
+if __name__ == "__main__":
+    pass
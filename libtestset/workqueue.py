@@ -0,0 +1,307 @@
+from libtestset.dftbplus_runner import DFTBPlusRunnerError
+from libtestset.dftbplus_runner import get_random_folder, run_staged
+from libtestset.hsd import load_template
+from libtestset.jobs import StoredResult
+from os import getpid, listdir, remove, rename, replace, stat, utime
+from os.path import exists, join
+from pathlib import Path
+from shutil import rmtree
+from socket import gethostname
+from threading import Event, Thread
+from time import sleep, time
+
+import json
+
+PENDING = "pending"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+WORKERS = "workers"
+SETTINGS = "settings.json"
+CLOSED = "closed"
+POLL_INTERVAL = 0.2  # seconds between checks for new jobs or results
+HEARTBEAT = 5.0  # seconds between signs of life of a worker
+STALE_AFTER = 60.0  # seconds without heartbeat until jobs are requeued
+
+
+class WorkQueueError(Exception):
+    """Error raised when the work queue directory cannot be used."""
+    pass
+
+
+class WorkQueue(object):
+    """Job queue in a directory shared by all hosts taking part in a run.
+
+    Every job is a small JSON file. Jobs wait in 'pending' and a worker
+    claims one by renaming it into 'running', which succeeds for exactly one
+    worker. Results and errors are written to 'done' and 'failed'. Workers
+    touch a heartbeat file in 'workers' while they are alive, so jobs of
+    workers that left without finishing them are put back into 'pending'.
+
+    Inputs for instantiation:
+    @:param path: Path to the queue directory.
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def _dir(self, name):
+        return join(self.path, name)
+
+    def publish(self, jobs, hsd, executable):
+        """Creates the queue and adds all jobs (coordinator side).
+
+        Results of an earlier run in the same directory are removed.
+
+        Inputs:
+        @:param jobs: List of jobs.Job objects.
+        @:param hsd: Path to the dftb_in.hsd template.
+        @:param executable: Default DFTB+ executable of the workers.
+        """
+        for name in (PENDING, RUNNING, DONE, FAILED):
+            rmtree(self._dir(name), ignore_errors=True)
+        for name in (PENDING, RUNNING, DONE, FAILED, WORKERS):
+            Path(self._dir(name)).mkdir(parents=True, exist_ok=True)
+        if exists(self._dir(CLOSED)):
+            remove(self._dir(CLOSED))
+        _write_json(self._dir(SETTINGS), {"hsd": hsd,
+                                          "executable": executable})
+        for job in jobs:
+            self.submit(job.key, job.xyz, job.overrides, staged=job.staged)
+
+    def submit(self, key, xyz, overrides, attempt=0, staged=None):
+        """Adds one job to the pending jobs."""
+        _write_json(join(self._dir(PENDING), "%s.json" % key),
+                    {"key": key, "xyz": xyz, "overrides": overrides,
+                     "attempt": attempt, "staged": staged})
+
+    def close(self):
+        """Tells all workers that no more jobs will come."""
+        open(self._dir(CLOSED), "w").close()
+
+    @property
+    def closed(self):
+        return exists(self._dir(CLOSED))
+
+    def claim(self, worker):
+        """Takes the next pending job (worker side).
+
+        @:returns job dictionary or None if no job is pending.
+        """
+        try:
+            names = sorted(listdir(self._dir(PENDING)))
+        except FileNotFoundError:
+            return None
+        for name in names:
+            if not name.endswith(".json"):
+                continue
+            target = join(self._dir(RUNNING), "%s@%s.json"
+                          % (name[:-5], worker))
+            try:
+                rename(join(self._dir(PENDING), name), target)
+            except FileNotFoundError:
+                continue  # claimed by another worker first
+            with open(target, "r") as infile:
+                spec = json.load(infile)
+            spec["claim"] = target
+            return spec
+        return None
+
+    def release(self, spec):
+        """Puts a claimed job back into the pending jobs."""
+        try:
+            rename(spec["claim"], join(self._dir(PENDING),
+                                       "%s.json" % spec["key"]))
+        except FileNotFoundError:
+            pass
+
+    def finish(self, spec, result=None, error=None):
+        """Stores the result or error of a claimed job."""
+        if result is not None:
+            _write_json(join(self._dir(DONE), "%s.json" % spec["key"]),
+                        result)
+        else:
+            _write_json(join(self._dir(FAILED), "%s.json" % spec["key"]),
+                        {"error": error, "overrides": spec["overrides"],
+                         "attempt": spec["attempt"]})
+        try:
+            remove(spec["claim"])
+        except FileNotFoundError:
+            pass
+
+    def heartbeat(self, worker):
+        """Marks a worker as alive."""
+        path = join(self._dir(WORKERS), worker)
+        if not exists(path):
+            open(path, "w").close()
+        utime(path)
+
+    def requeue_stale(self, stale_after=STALE_AFTER):
+        """Puts jobs of workers without recent heartbeat back.
+
+        @:returns number of requeued jobs.
+        """
+        n_requeued = 0
+        now = time()
+        for name in listdir(self._dir(RUNNING)):
+            key, worker = name[:-5].split("@", 1)
+            try:
+                alive = stat(join(self._dir(WORKERS), worker)).st_mtime
+            except FileNotFoundError:
+                alive = 0.0
+            if now - alive < stale_after:
+                continue
+            try:
+                rename(join(self._dir(RUNNING), name),
+                       join(self._dir(PENDING), "%s.json" % key))
+                n_requeued += 1
+            except FileNotFoundError:
+                pass  # finished in the meantime
+        return n_requeued
+
+    def collect(self, jobs, retries=None, stale_after=STALE_AFTER,
+                poll=POLL_INTERVAL):
+        """Waits for the results of all jobs (coordinator side).
+
+        Inputs:
+        @:param jobs: List of the published jobs.Job objects.
+        @:param retries: None to raise the first error, otherwise list of
+            HSD override dictionaries for resubmitting failed jobs (see
+            jobs.run_with_retries()).
+        @:param stale_after: Seconds without heartbeat after which the jobs
+            of a worker are requeued.
+        @:param poll: Seconds between checks for new results.
+
+        @:returns dictionary of job keys and jobs.StoredResult objects.
+        """
+        waiting = {x.key: x for x in jobs}
+        results = dict()
+        while waiting:
+            for name in listdir(self._dir(DONE)):
+                key = name[:-5]
+                if key in waiting:
+                    with open(join(self._dir(DONE), name), "r") as infile:
+                        results[key] = StoredResult(json.load(infile))
+                    del waiting[key]
+            for name in listdir(self._dir(FAILED)):
+                key = name[:-5]
+                if key not in waiting:
+                    continue
+                path = join(self._dir(FAILED), name)
+                with open(path, "r") as infile:
+                    failure = json.load(infile)
+                remove(path)
+                job = waiting[key]
+                if retries is None:
+                    self.close()
+                    raise WorkQueueError("Calculation of %s failed:\n%s"
+                                         % (job.name, failure["error"]))
+                job.errors.setdefault("DFTB+", []).append(failure["error"])
+                attempt = failure["attempt"] + 1
+                if attempt > len(retries):
+                    del waiting[key]
+                    continue
+                overrides = dict(job.overrides or dict())
+                overrides.update(retries[attempt - 1])
+                self.submit(key, job.xyz, overrides, attempt, job.staged)
+            if waiting:
+                self.requeue_stale(stale_after)
+                sleep(poll)
+        for job in jobs:
+            if job.key in results:
+                job.errors.pop("DFTB+", None)
+        self.close()
+        return results
+
+
+def work(path, executable=None, max_jobs=None, poll=POLL_INTERVAL,
+         exit_when_idle=False):
+    """Runs jobs of a work queue until it is closed (worker side).
+
+    Workers can join a running queue at any time and leave after max_jobs
+    jobs. A job interrupted by KeyboardInterrupt is handed back.
+
+    Inputs:
+    @:param path: Path to the queue directory.
+    @:param executable: DFTB+ executable on this host, defaults to the one
+        given by the coordinator.
+    @:param max_jobs: Number of jobs after which the worker stops.
+    @:param poll: Seconds between checks for new jobs.
+    @:param exit_when_idle: Stop as soon as no job is pending, instead of
+        waiting until the coordinator closes the queue.
+
+    @:returns number of jobs run.
+    """
+    queue = WorkQueue(path)
+    while not exists(join(path, SETTINGS)):
+        if queue.closed:
+            return 0
+        sleep(poll)
+    with open(join(path, SETTINGS), "r") as infile:
+        settings = json.load(infile)
+    template = load_template(settings["hsd"])
+    executable = executable or settings["executable"]
+    worker = "%s-%d" % (gethostname(), getpid())
+    stop = Event()
+    beat = Thread(target=_beat, args=(queue, worker, stop), daemon=True)
+    queue.heartbeat(worker)
+    beat.start()
+    n_jobs = 0
+    try:
+        while max_jobs is None or n_jobs < max_jobs:
+            spec = queue.claim(worker)
+            if spec is None:
+                if queue.closed or exit_when_idle:
+                    break
+                sleep(poll)
+                continue
+            try:
+                result, error = _run(spec, template, executable, worker)
+            except (KeyboardInterrupt, SystemExit):
+                queue.release(spec)
+                raise
+            queue.finish(spec, result, error)
+            n_jobs += 1
+    finally:
+        stop.set()
+        beat.join()
+        try:
+            remove(join(path, WORKERS, worker))
+        except FileNotFoundError:
+            pass
+    return n_jobs
+
+
+def _run(spec, template, executable, worker):
+    """Runs one job, returns (result, error).
+
+    Every failure is returned as error of the job, so a job that cannot run
+    is not claimed again and again by the next worker.
+    """
+    exec_dir = get_random_folder(prefix="dftb+_run_")
+    try:
+        driver = run_staged(executable, template, spec["xyz"], exec_dir,
+                            spec["overrides"], spec.get("staged"))
+    except DFTBPlusRunnerError as exc:
+        return None, "%s (worker %s)" % (exc, worker)
+    except Exception as exc:
+        return None, "%s: %s (worker %s)" % (type(exc).__name__, exc, worker)
+    rmtree(exec_dir)
+    return StoredResult.from_driver(driver, worker).to_dict(), None
+
+
+def _beat(queue, worker, stop):
+    while not stop.wait(HEARTBEAT):
+        queue.heartbeat(worker)
+
+
+def _write_json(path, data):
+    """Writes a JSON file atomically."""
+    tmp = "%s.%d.tmp" % (path, getpid())
+    with open(tmp, "w") as outfile:
+        json.dump(data, outfile)
+    replace(tmp, path)
+
+
+if __name__ == "__main__":
+    pass
@@ -1,28 +1,261 @@
 #!/bin/python3
 
-from libtestset import dftbplus_runner, dtnn_runner
-from libtestset import results, input_parser
-
-
-def main():
-    settings = input_parser.load("testsets_config.yml")
-    dftb_calcs = dict()
-    dtnn_calcs = None
-    hsd = settings["Options"]["DFTBPlusHSD"]
-    dftbplus = settings["Options"]["DFTBPlusPath"]
-    dtnn = ("DTNN" in settings["Options"])
-    if dtnn:
-        dtnn_calcs = dict()
-        model = settings["Options"]["DTNN"]["DTNNModel"]
-        skf = settings["Options"]["DTNN"]["DTNNSkfPath"]
-    for testset in settings["Testsets"]:
-        set_definition = settings["Testsets"][testset]
-        dftb_calcs[testset] = dftbplus_runner.run_testset(set_definition,
-                                                          hsd, dftbplus)
-        if dtnn:
-            dtnn_calcs[testset] = dtnn_runner.run_testset(
-                set_definition, model, dftbplus, skf)
-    results.write_results(settings["Testsets"], dftb_calcs, dtnn_calcs)
+from libtestset import api, archive, atomic, backends, charges, compare
+from libtestset import daemon, input_parser, jobs, pipeline, planner, results
+from libtestset import shards, stages, store, sweep, workqueue
+from os import cpu_count
+from os.path import abspath, dirname, isfile, join
+from shutil import which
+
+import argparse
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Runs testsets in bulk as given in the input file.")
+    parser.add_argument("--config", default="testsets_config.yml",
+                        help="Input file (default: testsets_config.yml).")
+    parser.add_argument("--plan", action="store_true",
+                        help="Only estimate job count, core-hours and "
+                             "makespan, do not run any calculation.")
+    parser.add_argument("--workers", type=int, default=cpu_count() or 1,
+                        help="Number of parallel workers assumed for the "
+                             "makespan of --plan or run by --daemon or a "
+                             "Sweep (default: all cores).")
+    parser.add_argument("--compare", action="store_true",
+                        help="Run all systems with the settings of the "
+                             "input file (A) and with --executable-b and/or "
+                             "--hsd-b (B) and compare speed and energies.")
+    parser.add_argument("--executable-b",
+                        help="DFTB+ executable of variant B for --compare.")
+    parser.add_argument("--hsd-b",
+                        help="HSD template of variant B for --compare.")
+    parser.add_argument("--coordinator", metavar="QUEUE_DIR",
+                        help="Publish the DFTB+ calculations to a work queue "
+                             "in this shared directory and collect the "
+                             "results of the workers.")
+    parser.add_argument("--worker", metavar="QUEUE_DIR",
+                        help="Run calculations from the work queue in this "
+                             "shared directory until it is closed.")
+    parser.add_argument("--executable",
+                        help="DFTB+ executable of a --worker, defaults to "
+                             "the one of the coordinator.")
+    parser.add_argument("--max-jobs", type=int,
+                        help="Number of calculations after which a --worker "
+                             "leaves the queue.")
+    parser.add_argument("--shard", metavar="i/N",
+                        help="Only run the i-th of N cost-balanced parts of "
+                             "all calculations (1 <= i <= N) and write the "
+                             "results to shard_i_of_N.json.")
+    parser.add_argument("--merge", nargs="+", metavar="SHARD_FILE",
+                        help="Combine the results of all shards and write "
+                             "the results of the testsets.")
+    parser.add_argument("--reanalyze", action="store_true",
+                        help="Write the results of the testsets again from "
+                             "the geometries and energies stored by the "
+                             "last run, without running any calculation.")
+    parser.add_argument("--daemon", metavar="SOCKET",
+                        help="Keep the input loaded and evaluate requests "
+                             "of clients connecting to this Unix socket.")
+    args = parser.parse_args(argv)
+    if args.worker:
+        n_jobs = workqueue.work(args.worker, args.executable, args.max_jobs)
+        print("Worker finished %d calculation(s)." % n_jobs)
+        return
+    if args.compare and not (args.executable_b or args.hsd_b):
+        parser.error("--compare needs --executable-b and/or --hsd-b.")
+    if args.shard:
+        try:
+            index, n_shards = shards.parse(args.shard)
+        except shards.ShardError as exc:
+            parser.error(str(exc))
+    if args.daemon:
+        run_daemon(args.daemon, args.config, args.workers)
+        return
+    settings = input_parser.load(args.config)
+    options = settings["Options"]
+    job_list = jobs.collect_jobs(settings["Testsets"])
+    history = planner.TimingHistory(join(dirname(abspath(args.config)),
+                                         planner.HISTORY_FILE))
+    if options.get("Sweep"):
+        if any((args.compare, args.coordinator, args.shard, args.merge,
+                args.reanalyze)):
+            parser.error("A Sweep cannot be combined with --compare, "
+                         "--coordinator, --shard, --merge or --reanalyze.")
+        variants = sweep.variants(options["Sweep"])
+        if args.plan:
+            sweep_jobs = sweep.expand(job_list, variants)
+            all_jobs = {x.key: x for y in sweep_jobs.values() for x in y}
+            print(planner.plan(settings["Testsets"], list(all_jobs.values()),
+                               ["DFTB+"], args.workers, history))
+            return
+        print(jobs.report(job_list))
+        run_sweep(settings, job_list, variants, args.workers, history,
+                  dirname(abspath(args.config)))
+        return
+    if args.plan:
+        methods = [x.name for x in backends.enabled(options)]
+        print(planner.plan(settings["Testsets"], job_list, methods,
+                           args.workers, history))
+        return
+    print(jobs.report(job_list))
+    if args.compare:
+        run_comparison(options, job_list, args.executable_b, args.hsd_b)
+        return
+    if args.merge:
+        drivers = shards.merge(args.merge, job_list)
+    elif args.reanalyze:
+        try:
+            drivers = load_stores(options, job_list)
+        except store.StoreError as exc:
+            parser.error(str(exc))
+    else:
+        all_jobs = job_list
+        if args.shard:
+            job_list = shards.select(job_list, index, n_shards)
+            print("Shard %d of %d: %d of %d calculations"
+                  % (index, n_shards, len(job_list), len(all_jobs)))
+        drivers = dict()
+        outputs = archive.from_options(options)
+        methods = backends.enabled(options)
+        try:
+            if args.coordinator and "DFTB+" in [x.name for x in methods]:
+                drivers["DFTB+"] = run_coordinator(args.coordinator,
+                                                   job_list, options)
+                methods = [x for x in methods if x.name != "DFTB+"]
+            drivers.update(pipeline.run(methods, job_list, options, outputs))
+            for method, method_drivers in drivers.items():
+                history.record(method, job_list, method_drivers)
+        finally:
+            if outputs is not None:
+                outputs.close()
+            history.save()
+        if options.get("WarmStart") and "DFTB+" in drivers:
+            print(charges.report(settings["Testsets"], job_list,
+                                 drivers["DFTB+"]))
+        for method, method_drivers in drivers.items():
+            report = stages.report(settings["Testsets"], job_list,
+                                   method_drivers, method)
+            if report is not None:
+                print(report)
+        if args.shard:
+            filename = shards.SHARD_FILE % (index, n_shards)
+            shards.write(filename, index, n_shards, job_list, drivers)
+            print("Results of shard %d of %d written to file %s, combine "
+                  "all shards with --merge" % (index, n_shards, filename))
+            return
+    if not args.reanalyze:
+        for method, method_drivers in drivers.items():
+            store.GeometryStore.from_drivers(method_drivers).save(
+                store.path(method))
+    calcs = {x: jobs.distribute(job_list, y) for x, y in drivers.items()}
+    failures = jobs.failure_report(job_list)
+    if failures is not None:
+        print(failures)
+    cache = atomic.AtomicEnergyCache(join(dirname(abspath(args.config)),
+                                          atomic.CACHE_FILE))
+    atomics = atomic.reference_energies(settings["Testsets"], options, cache)
+    results.write_results(settings["Testsets"], calcs["DFTB+"],
+                          calcs.get("DTNN"), atomics, options.get("Bootstrap"))
+
+
+def load_stores(options, job_list):
+    """Loads the stored results of the last run of every enabled method.
+
+    @:returns dictionary of method names and dictionaries of job keys and
+        store.StoredGeometry objects, calculations not in the store are
+        missing.
+    """
+    drivers = dict()
+    for backend in backends.enabled(options):
+        geometries = store.GeometryStore.load(store.path(backend.name))
+        drivers[backend.name] = geometries.drivers(job_list)
+        n_missing = len(job_list) - len(drivers[backend.name])
+        if n_missing:
+            print("%s: %d of %d calculations are not stored, their systems "
+                  "are written as missing" % (backend.name, n_missing,
+                                              len(job_list)))
+    return drivers
+
+
+def run_coordinator(queue_dir, job_list, options):
+    """Runs the DFTB+ calculations through a work queue.
+
+    Workers neither archive output files nor start from stored charges, so
+    KeepOutputs and WarmStart have no effect.
+
+    @:returns dictionary of job keys and jobs.StoredResult objects.
+    """
+    unsupported = [x for x in ("KeepOutputs", "WarmStart") if options.get(x)]
+    if unsupported:
+        print("Warning: %s not supported with --coordinator, the workers "
+              "run without" % " and ".join(unsupported))
+    queue = workqueue.WorkQueue(abspath(queue_dir))
+    queue.publish(job_list, options["DFTBPlusHSD"], options["DFTBPlusPath"])
+    print("Published %d calculations to %s, start workers with\n"
+          "    python3 run_testsets.py --worker %s"
+          % (len(job_list), queue.path, queue.path))
+    return queue.collect(job_list, backends.retries(options))
+
+
+def run_sweep(settings, job_list, variants, workers, history, base_dir):
+    """Runs all variants of a Sweep and writes DFTB_sweep.csv."""
+    options = settings["Options"]
+    print("Sweeping %d variants of all testsets with %d workers"
+          % (len(variants), workers))
+    outputs = archive.from_options(options)
+    cache = atomic.AtomicEnergyCache(join(base_dir, atomic.CACHE_FILE))
+    try:
+        evaluations = sweep.run(settings["Testsets"], options, job_list,
+                                variants, workers, history, outputs, cache)
+    finally:
+        if outputs is not None:
+            outputs.close()
+        history.save()
+    for name, evaluation in evaluations.items():
+        if evaluation.errors:
+            print("Variant %s: %d system(s) failed, e.g. %s"
+                  % (name, len(evaluation.errors),
+                     next(iter(evaluation.errors))))
+    sweep.write(evaluations)
+
+
+def run_daemon(socket_path, config, workers):
+    """Serves evaluation requests until interrupted."""
+    server = daemon.EvaluationServer(socket_path, api.Plan(config), workers)
+    print("Evaluating %d testsets with %d workers for clients of %s, stop "
+          "with Ctrl+C" % (len(server.plan.testsets), workers, socket_path))
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+def run_comparison(options, job_list, executable_b=None, hsd_b=None):
+    """Runs an A/B comparison and writes DFTB_comparison.csv."""
+    exe_a = options["DFTBPlusPath"]
+    hsd_a = options["DFTBPlusHSD"]
+    exe_b = which(executable_b) if executable_b else exe_a
+    if not exe_b:
+        raise input_parser.InputError("Executable %s of variant B does not "
+                                      "exist." % executable_b)
+    hsd_b = abspath(hsd_b) if hsd_b else hsd_a
+    if not isfile(hsd_b):
+        raise input_parser.InputError("HSD template %s of variant B does not "
+                                      "exist." % hsd_b)
+    variant_a = compare.Variant("A", exe_a, hsd_a)
+    variant_b = compare.Variant("B", abspath(exe_b), hsd_b)
+    print("A: %s with %s\nB: %s with %s"
+          % (exe_a, hsd_a, variant_b.executable, hsd_b))
+    comparison = compare.compare(job_list, variant_a, variant_b)
+    failures = jobs.failure_report(job_list)
+    if failures is not None:
+        print(failures)
+    print(comparison.summary())
+    print("Writing per system comparison to file DFTB_comparison.csv")
+    comparison.write("DFTB_comparison.csv")
 
 
 if __name__ == "__main__":
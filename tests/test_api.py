@@ -0,0 +1,115 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from os import environ, getcwd, listdir, remove
+from os.path import exists, join
+from pathlib import Path
+from shutil import rmtree
+
+import libtestset.api as api
+import libtestset.atomic as atomic
+import numpy as np
+import unittest
+import yaml
+
+
+class TestAPI(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/run_testsets/"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        rmtree(self.exec_dir)
+        cache = join(self.input_dir, atomic.CACHE_FILE)
+        if exists(cache):
+            remove(cache)
+
+    def _settings(self):
+        with open(join(self.input_dir, "testsets_config.yml"), "r") as infile:
+            settings = yaml.safe_load(infile)
+        settings["Options"]["DFTBPlusPath"] = join(
+            self.base_dir, "../benchmarks/fake_dftbplus.py")
+        return settings
+
+    def test_evaluate(self):
+        plan = api.Plan(self._settings(), self.input_dir)
+        workdir = join(self.exec_dir, "work")
+        Path(workdir).mkdir()
+        output = StringIO()
+        with redirect_stdout(output):
+            first = api.evaluate(plan, workdir=workdir)["DFTB+"]
+            second = api.evaluate(plan, workdir=workdir)["DFTB+"]
+        self.assertEqual(output.getvalue(), "")
+        self.assertEqual(getcwd(), self.base_dir)
+        self.assertListEqual(listdir(workdir), [])
+        self.assertNotIn("DFTB_deviations.csv", listdir(self.base_dir))
+        reactions = first.testsets["Sample Reactions"]
+        self.assertListEqual(reactions.labels,
+                             ["c2h6 + h2o -> c2h5oh + h2",
+                              "2 c2h6 + 2 h2o -> 2 c2h5oh + 2 h2"])
+        np.testing.assert_allclose(reactions.reference, [-24.3, -48.6])
+        self.assertAlmostEqual(reactions.values[1], 2 * reactions.values[0])
+        np.testing.assert_allclose(reactions.deviations,
+                                   reactions.reference - reactions.values)
+        self.assertAlmostEqual(reactions.mad,
+                               np.abs(reactions.deviations).mean())
+        self.assertEqual(first.statistics.shape, (2, 4))
+        np.testing.assert_allclose(first.statistics, second.statistics)
+        self.assertEqual(first.confidence_intervals(10, seed=0).shape,
+                         (2, 4, 2))
+        self.assertDictEqual(first.wtmad, dict())
+
+    def test_evaluate_dataset(self):
+        settings = self._settings()
+        del settings["Testsets"]["Sample Reactions"]
+        plan = api.Plan(settings, self.input_dir)
+        directory = api.evaluate(plan, workdir=self.exec_dir)["DFTB+"]
+        dataset = join(self.base_dir, self.exec_dir, "samples.xyz")
+        with open(dataset, "w") as outfile:
+            for name in ["c2h6", "ch4"]:
+                path = join(self.input_dir, "sample_energies", name + ".xyz")
+                with open(path, "r") as infile:
+                    lines = infile.read().strip().splitlines()
+                lines[1] = "name=%s" % name
+                outfile.write("\n".join(lines) + "\n")
+        settings["Testsets"]["Sample Energies"]["path"] = dataset
+        plan = api.Plan(settings, self.input_dir)
+        self.assertListEqual(plan.testsets["Sample Energies"][
+            "required_systems"], ["c2h6", "ch4"])
+        evaluation = api.evaluate(plan, workdir=self.exec_dir)["DFTB+"]
+        # Results are in the order of the dataset file
+        energies = evaluation.testsets["Sample Energies"]
+        self.assertListEqual(energies.labels, ["c2h6", "ch4"])
+        np.testing.assert_allclose(
+            energies.values,
+            directory.testsets["Sample Energies"].values[::-1])
+
+    def test_evaluate_failures(self):
+        settings = self._settings()
+        settings["Options"]["FaultTolerance"] = True
+        plan = api.Plan(settings, self.input_dir)
+        # ch4 needs 200 SCC iterations, c2h6 and larger ones more
+        environ["FAKE_DFTBPLUS_SCC_PER_ATOM"] = "40"
+        try:
+            evaluation = api.evaluate(
+                plan, {"Hamiltonian/MaxSCCIterations": 250},
+                workdir=self.exec_dir)["DFTB+"]
+        finally:
+            del environ["FAKE_DFTBPLUS_SCC_PER_ATOM"]
+        energies = evaluation.testsets["Sample Energies"]
+        self.assertListEqual(energies.labels, ["ch4", "c2h6"])
+        self.assertFalse(np.isnan(energies.values[0]))
+        self.assertTrue(np.isnan(energies.values[1]))
+        self.assertEqual(energies.n_missing, 1)
+        self.assertIn("Sample Energies/c2h6", evaluation.errors)
+        self.assertEqual(evaluation.testsets["Sample Reactions"].n_missing, 2)
+        # The plan itself is not changed by an evaluation
+        self.assertFalse(any(x.errors for x in plan.jobs))
+        with self.assertRaises(api.APIError):
+            api.Plan("no_such_input.yml")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,70 @@
+from libtestset.archive import ArchiveError, OutputArchive
+from os import chdir, getcwd, listdir
+from os.path import abspath, join
+from pathlib import Path
+from shutil import rmtree
+
+import libtestset.archive as archive
+import libtestset.dftbplus_runner as dftb
+import libtestset.jobs as jobs
+import unittest
+
+
+class TestArchive(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/dftbplus_runner/"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        chdir(self.base_dir)
+        rmtree(self.exec_dir)
+
+    def test_write_read(self):
+        run_dir = join(self.exec_dir, "run")
+        Path(run_dir).mkdir()
+        for name in ("detailed.out", "geo_end.xyz", "charges.bin"):
+            with open(join(run_dir, name), "w") as out:
+                out.write("content of %s\n" % name)
+        out_dir = join(self.exec_dir, "outputs")
+        with OutputArchive(out_dir, ["detailed.out", "*.xyz"]) as outputs:
+            outputs.add([("Set A", "ch4"), ("Set B", "methane")], run_dir)
+        self.assertListEqual(sorted(listdir(out_dir)),
+                             ["Set A.zip", "Set B.zip"])
+        path = archive.archive_path(out_dir, "Set B")
+        self.assertListEqual(archive.list_systems(path), ["methane"])
+        files = archive.read_system(path, "methane")
+        self.assertListEqual(sorted(files), ["detailed.out", "geo_end.xyz"])
+        self.assertEqual(files["detailed.out"], b"content of detailed.out\n")
+        with self.assertRaises(ArchiveError):
+            archive.read_system(path, "ch4")
+        with self.assertRaises(ArchiveError):
+            archive.read_system(path, "methane", method="DTNN")
+        with self.assertRaises(ArchiveError):
+            OutputArchive(out_dir, compression="wombat")
+
+    def test_run_jobs(self):
+        stub = join(self.base_dir, "../benchmarks/fake_dftbplus.py")
+        hsd = join(self.input_dir, "dftb_in.hsd")
+        testsets = {"Sample": {"path": join(self.input_dir, "testset")}}
+        job_list = jobs.collect_jobs(testsets)
+        out_dir = abspath(join(self.exec_dir, "outputs"))
+        outputs = OutputArchive(out_dir, compression="lzma")
+        chdir(self.exec_dir)
+        dftb.run_jobs(job_list, join(self.base_dir, hsd), stub, outputs)
+        outputs.close()
+        chdir(self.base_dir)
+        path = archive.archive_path(out_dir, "Sample")
+        self.assertListEqual(archive.list_systems(path), ["c2h6", "ch4"])
+        files = archive.read_system(path, "ch4")
+        self.assertListEqual(sorted(files),
+                             ["detailed.out", "dftbplus_output.log"])
+        self.assertIn(b"Total energy:", files["detailed.out"])
+        # Only the archive is left, no calculation directories
+        self.assertListEqual(listdir(self.exec_dir), ["outputs"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+from libtestset.atomic import AtomicEnergyCache, AtomicEnergyError
+from os import environ, getcwd, listdir, remove
+from os.path import join
+from pathlib import Path
+from shutil import rmtree
+
+import libtestset.atomic as atomic
+import libtestset.input_parser as input_parser
+import unittest
+import yaml
+
+
+class TestAtomic(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/run_testsets/"
+        self.exe = join(self.base_dir, "../benchmarks/fake_dftbplus.py")
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        rmtree(self.exec_dir)
+
+    def test_unpaired_electrons(self):
+        expected = {"H": 1, "He": 0, "C": 2, "N": 3, "O": 2, "F": 1,
+                    "Ne": 0, "Na": 1, "Mg": 0, "P": 3, "S": 2, "Cl": 1,
+                    "K": 1, "Ca": 0, "Ti": 2, "Mn": 5, "Fe": 4, "Zn": 0,
+                    "Br": 1, "I": 1}
+        for symbol, unpaired in expected.items():
+            self.assertEqual(atomic.unpaired_electrons(symbol), unpaired,
+                             symbol)
+        with self.assertRaises(AtomicEnergyError):
+            atomic.unpaired_electrons("Au")
+
+    def test_elements(self):
+        with open(join(self.input_dir, "testsets_config.yml"), "r") as infile:
+            settings = yaml.safe_load(infile)
+        settings["Options"]["DFTBPlusPath"] = self.exe
+        settings = input_parser.validate(settings, self.input_dir)
+        self.assertListEqual(atomic.elements(settings["Testsets"]),
+                             ["c", "h"])
+
+    def test_calculate(self):
+        skf_dir = join(self.base_dir, self.exec_dir, "skf")
+        Path(skf_dir).mkdir()
+        with open(join(self.input_dir, "dftb_in.hsd"), "r") as infile:
+            hsd = infile.read().replace("/home/mkubillus/slko/3ob-3-1/",
+                                        skf_dir + "/")
+        hsd = hsd.replace("Charge = 0", "Charge = 0\n SpinConstants = {}")
+        template = join(self.exec_dir, "dftb_in.hsd")
+        with open(template, "w") as outfile:
+            outfile.write(hsd)
+        with open(join(skf_dir, "C-C.skf"), "w") as outfile:
+            outfile.write("carbon\n")
+        cache_file = join(self.exec_dir, atomic.CACHE_FILE)
+        workdir = join(self.exec_dir, "work")
+        Path(workdir).mkdir()
+        log = join(self.base_dir, self.exec_dir, "calls.log")
+        environ["FAKE_DFTBPLUS_LOG"] = log
+        try:
+            cache = AtomicEnergyCache(cache_file)
+            energies = atomic.calculate(["C", "h"], template, self.exe,
+                                        None, cache, workdir)
+            # Read from the cache file without running DFTB+ again
+            cache = AtomicEnergyCache(cache_file)
+            self.assertDictEqual(atomic.calculate(
+                ["c", "h"], template, self.exe, None, cache, workdir),
+                energies)
+            # Changed Slater-Koster files are calculated again
+            with open(join(skf_dir, "C-C.skf"), "w") as outfile:
+                outfile.write("new carbon\n")
+            atomic.calculate(["c", "h"], template, self.exe, None, cache,
+                             workdir)
+        finally:
+            del environ["FAKE_DFTBPLUS_LOG"]
+        with open(log, "r") as infile:
+            self.assertEqual(len(infile.readlines()), 3)
+        # Energies of the stub in Hartree
+        self.assertAlmostEqual(energies["c"], -1.44 * 627.509, 6)
+        self.assertAlmostEqual(energies["h"], -0.28 * 627.509, 6)
+        self.assertListEqual(listdir(workdir), [])
+        with self.assertRaises(AtomicEnergyError):
+            atomic.calculate(["c"], template, "no_dftb+", None, None,
+                             workdir)
+        remove(cache_file)
+        options = {"DFTBPlusHSD": template, "DFTBPlusPath": self.exe,
+                   "AtomicEnergies": "builtin"}
+        self.assertIsNone(atomic.reference_energies(dict(), options))
+
+
+if __name__ == "__main__":
+    unittest.main()
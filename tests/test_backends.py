@@ -0,0 +1,39 @@
+from libtestset.backends import Backend, BackendError
+
+import libtestset.backends as backends
+import unittest
+
+
+class TestBackends(unittest.TestCase):
+
+    def test_enabled(self):
+        options = {"DFTBPlusHSD": "dftb_in.hsd", "DFTBPlusPath": "dftb+"}
+        self.assertListEqual([x.name for x in backends.enabled(options)],
+                             ["DFTB+"])
+        options["DTNN"] = {"DTNNModel": "model", "DTNNSkfPath": "skf"}
+        self.assertListEqual([x.name for x in backends.enabled(options)],
+                             ["DFTB+", "DTNN"])
+        options["DFTBPlusLibrary"] = "libdftbplus.so"
+        methods = backends.enabled(options)
+        self.assertListEqual([x.name for x in methods], ["DFTB+", "DTNN"])
+        self.assertEqual(methods[0].module_name,
+                         "libtestset.dftbplus_library")
+        with self.assertRaises(BackendError):
+            backends.get("wombat")
+
+    def test_lazy_load(self):
+        backend = Backend("Dummy", "json",
+                          lambda mod, set_def, opts, archive, workdir: mod,
+                          option="Dummy")
+        self.assertIsNone(backend.import_time)
+        self.assertFalse(backend.enabled(dict()))
+        module = backend.run_jobs([], {"Dummy": None})
+        self.assertEqual(module.__name__, "json")
+        self.assertGreaterEqual(backend.import_time, 0.0)
+        missing = Backend("Missing", "no_such_module_wombat", None)
+        with self.assertRaises(BackendError):
+            missing.load()
+
+
+if __name__ == "__main__":
+    unittest.main()
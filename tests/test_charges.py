@@ -0,0 +1,74 @@
+from libtestset.charges import ChargeStore
+from libtestset.hsd import HSDTemplate
+from libtestset.jobs import collect_jobs
+from os import chdir, getcwd, listdir
+from os.path import join
+from pathlib import Path
+from shutil import rmtree
+
+import libtestset.charges as charges
+import libtestset.dftbplus_runner as dftb
+import unittest
+
+
+class TestCharges(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/dftbplus_runner/"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        chdir(self.base_dir)
+        rmtree(self.exec_dir)
+
+    def test_keys(self):
+        template = HSDTemplate(join(self.input_dir, "dftb_in.hsd"))
+        testsets = {"Sample": {"path": join(self.input_dir, "testset")}}
+        job = collect_jobs(testsets)[0]
+        store = ChargeStore(join(self.exec_dir, "store"))
+        key = store.key(job, template)
+        # Changed parameters keep the charges, a changed charge does not
+        self.assertEqual(key, store.key(job, template,
+                                        {"Hamiltonian/MaxSCCIterations": 9}))
+        self.assertNotEqual(key, store.key(job, template,
+                                           {"Hamiltonian/Charge": 1}))
+        self.assertFalse(store.get(key, join(self.exec_dir, "run")))
+        self.assertIsNone(store.cold_iterations(key))
+
+    def test_warm_start(self):
+        stub = join(self.base_dir, "../benchmarks/fake_dftbplus.py")
+        hsd = join(self.base_dir, self.input_dir, "dftb_in.hsd")
+        testsets = {"Sample": {"path": join(self.input_dir, "testset")}}
+        job_list = collect_jobs(testsets)
+        store = ChargeStore(join(self.base_dir, self.exec_dir, "store"))
+        chdir(self.exec_dir)
+        cold = dftb.run_jobs(job_list, hsd, stub, charges=store)
+        warm = dftb.run_jobs(job_list, hsd, stub, charges=store)
+        chdir(self.base_dir)
+        for job in job_list:
+            self.assertFalse(cold[job.key].warm_start)
+            self.assertTrue(warm[job.key].warm_start)
+            self.assertEqual(warm[job.key].cold_iterations,
+                             cold[job.key].scc_iterations)
+            self.assertLess(warm[job.key].scc_iterations,
+                            cold[job.key].scc_iterations)
+            self.assertAlmostEqual(warm[job.key].energy, cold[job.key].energy)
+        self.assertEqual(len(listdir(store.directory)), 4)
+        report = charges.report(testsets, job_list, warm)
+        self.assertIn("2 of 2 systems warm started, 11 SCC iterations "
+                      "instead of 33 (66.7 % saved)", report)
+        # Unusable stored charges fall back to a cold start
+        for name in listdir(store.directory):
+            if name.endswith(".bin"):
+                with open(join(store.directory, name), "w") as out:
+                    out.write("1 wrong number of atoms\n")
+        chdir(self.exec_dir)
+        again = dftb.run_jobs(job_list, hsd, stub, charges=store)
+        chdir(self.base_dir)
+        self.assertFalse(any(x.warm_start for x in again.values()))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,35 @@
+from libtestset.compare import Comparison
+from libtestset.jobs import Job
+
+import numpy as np
+import unittest
+
+
+class TestCompare(unittest.TestCase):
+
+    def test_statistics(self):
+        job_list = [Job("job%d" % x, "%d.xyz" % x, x, dict())
+                    for x in range(4)]
+        times = np.array([[1.0, 0.5], [2.0, 1.0], [3.0, 1.5], [2.0, 1.0]])
+        energies = np.array([[-10.0, -10.0], [-20.0, -20.5],
+                             [-30.0, -30.0], [-40.0, -39.0]])
+        comparison = Comparison(job_list, times, energies)
+        self.assertAlmostEqual(comparison.speedup, 2.0)
+        self.assertTrue(np.allclose(comparison.ratios, 0.5))
+        self.assertListEqual(list(comparison.energy_differences),
+                             [0.0, -0.5, 0.0, 1.0])
+        # Constant ratios leave no uncertainty
+        lower, upper = comparison.speedup_interval(n_bootstrap=100)
+        self.assertAlmostEqual(lower, 2.0)
+        self.assertAlmostEqual(upper, 2.0)
+        times[0, 1] = 2.0
+        lower, upper = comparison.speedup_interval(n_bootstrap=1000)
+        self.assertLess(lower, comparison.speedup)
+        self.assertGreater(upper, comparison.speedup)
+        self.assertIn("4 jobs compared", comparison.summary())
+        empty = Comparison([], np.zeros((0, 2)), np.zeros((0, 2)))
+        self.assertIn("No job", empty.summary())
+
+
+if __name__ == "__main__":
+    unittest.main()
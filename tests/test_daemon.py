@@ -0,0 +1,78 @@
+from concurrent.futures import ThreadPoolExecutor
+from libtestset.daemon import DaemonError, EvaluationServer
+from os import getcwd, remove
+from os.path import exists, join
+from pathlib import Path
+from shutil import rmtree
+from threading import Thread
+
+import libtestset.api as api
+import libtestset.atomic as atomic
+import libtestset.daemon as daemon
+import unittest
+import yaml
+
+
+class TestDaemon(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/run_testsets/"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        rmtree(self.exec_dir)
+        cache = join(self.input_dir, atomic.CACHE_FILE)
+        if exists(cache):
+            remove(cache)
+
+    def test_requests(self):
+        with open(join(self.input_dir, "testsets_config.yml"), "r") as infile:
+            settings = yaml.safe_load(infile)
+        settings["Options"]["DFTBPlusPath"] = join(
+            self.base_dir, "../benchmarks/fake_dftbplus.py")
+        plan = api.Plan(settings, self.input_dir)
+        path = join(self.exec_dir, "daemon.sock")
+        server = EvaluationServer(path, plan, 2)
+        thread = Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            with self.assertRaises(DaemonError):
+                EvaluationServer(path, plan, 1)
+            # Two clients at the same time share the workers
+            with ThreadPoolExecutor(2) as pool:
+                first = pool.submit(list, daemon.request(path))
+                second = pool.submit(list, daemon.request(
+                    path, ["Sample Energies"],
+                    {"Hamiltonian/MaxSCCIterations": 500}))
+                first = first.result()
+                second = second.result()
+            errors = list(daemon.request(path, ["Wombats"]))
+            errors += list(daemon.request(path, overrides=[1]))
+        finally:
+            server.shutdown()
+            thread.join()
+            server.server_close()
+        self.assertFalse(exists(path))
+        # 2 + 4 systems, 2 testsets
+        self.assertListEqual([x["type"] for x in first],
+                             ["system"] * 6 + ["testset"] * 2 + ["done"])
+        self.assertListEqual([x["type"] for x in second],
+                             ["system"] * 2 + ["testset", "done"])
+        energies = {x["system"]: x["energy"] for x in first
+                    if x["type"] == "system"
+                    and x["testset"] == "Sample Energies"}
+        self.assertIsNotNone(energies["ch4"])
+        results = {x["name"]: x for x in first if x["type"] == "testset"}
+        self.assertEqual(len(results["Sample Reactions"]["values"]), 2)
+        self.assertEqual(results["Sample Energies"]["labels"],
+                         ["ch4", "c2h6"])
+        self.assertEqual(results["Sample Energies"], second[2])
+        self.assertListEqual([x["type"] for x in errors], ["error"] * 2)
+        self.assertIn("Wombats", errors[0]["message"])
+        self.assertIn("TypeError", errors[1]["message"])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+from libtestset.dftbplus_library import DFTBPlusLibraryDriver
+from libtestset.dftbplus_library import DFTBPlusLibraryError
+from libtestset.hsd import load_template
+from os import environ, getcwd, listdir
+from os.path import dirname, join
+from pathlib import Path
+from shutil import rmtree, which
+
+import libtestset.dftbplus_library as dftbplus_library
+import libtestset.dftbplus_runner as dftbplus_runner
+import libtestset.jobs as jobs
+import numpy as np
+import subprocess
+import sys
+import unittest
+
+
+@unittest.skipIf(which("cc") is None, "needs a C compiler for the stub")
+class TestDFTBPlusLibrary(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/run_testsets/"
+        self.exe = join(self.base_dir, "../benchmarks/fake_dftbplus.py")
+        self.hsd = join(self.input_dir, "dftb_in.hsd")
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+        self.lib = join(self.base_dir, self.exec_dir, "libfakedftbplus.so")
+        subprocess.run(["cc", "-shared", "-fPIC", "-o", self.lib,
+                        join(self.base_dir,
+                             "../benchmarks/fake_libdftbplus.c"), "-lm"],
+                       check=True)
+        self.log = join(self.base_dir, self.exec_dir, "calls.log")
+        environ["FAKE_DFTBPLUS_LOG"] = self.log
+
+    def tearDown(self):
+        del environ["FAKE_DFTBPLUS_LOG"]
+        dftbplus_library.load(self.lib).close()
+        rmtree(self.exec_dir)
+
+    def _jobs(self, overrides):
+        sets = {"Energies": {"path": join(self.input_dir, "sample_energies"),
+                             "references": {"ch4": 0.0, "c2h6": 0.0}},
+                "Reactions": {"path": join(self.input_dir,
+                                           "sample_reactions"),
+                              "references": {"h2o": 0.0, "h2": 0.0}}}
+        job_list = jobs.collect_jobs(sets)
+        for job in job_list:
+            job.overrides = overrides
+        return job_list
+
+    def test_single_points(self):
+        job_list = self._jobs({"Driver": None})
+        processes = dftbplus_runner.run_jobs(job_list, self.hsd, self.exe,
+                                             workdir=self.exec_dir)
+        library = dftbplus_library.run_jobs(job_list, self.hsd, self.exe,
+                                            self.lib, workdir=self.exec_dir)
+        self.assertEqual(len(library), 5)
+        for key, driver in library.items():
+            self.assertIsInstance(driver, DFTBPlusLibraryDriver)
+            self.assertAlmostEqual(driver.energy, processes[key].energy,
+                                   places=6)
+            np.testing.assert_allclose(driver.coordinates,
+                                       processes[key].coordinates)
+            self.assertListEqual(driver.atoms, processes[key].atoms)
+            # the synthetic energy only depends on distances
+            np.testing.assert_allclose(driver.gradients.sum(axis=0), 0.0,
+                                       atol=1e-12)
+        with open(self.log, "r") as infile:
+            self.assertEqual(infile.read().count("process_input"), 5)
+        dftbplus_library.run_jobs(job_list, self.hsd, self.exe, self.lib,
+                                  workdir=self.exec_dir)
+        with open(self.log, "r") as infile:
+            # the instances are kept for further geometries
+            self.assertEqual(infile.read().count("process_input"), 5)
+        retried = dftbplus_library.run_jobs(job_list, self.hsd, self.exe,
+                                            self.lib, retries=[],
+                                            workdir=self.exec_dir)
+        for driver in retried.values():
+            self.assertNotIsInstance(driver, DFTBPlusLibraryDriver)
+
+    def test_output(self):
+        library = dftbplus_library.load(self.lib)
+        template = load_template(self.hsd)
+        xyz = join(self.input_dir, "sample_energies", "ch4.xyz")
+        exec_dir = join(self.exec_dir, "run")
+        driver = library.driver(template, xyz, exec_dir, {"Driver": None})
+        driver.run()
+        with open(join(exec_dir, "dftbplus_output.log"), "r") as infile:
+            self.assertEqual(infile.read().count("Total Mermin"), 1)
+        self.assertFalse(library.accepts(template, {
+            "Driver": None, "Hamiltonian/ConvergentSCCOnly": False}))
+
+    def test_abort(self):
+        # errors inside the library stop the process, they cannot be caught
+        script = ("import libtestset.dftbplus_library as lib\n"
+                  "from libtestset.hsd import load_template\n"
+                  "library = lib.load(%r)\n"
+                  "try:\n"
+                  "    library.driver(load_template(%r), %r, %r,\n"
+                  "                   {'Driver': None}).run()\n"
+                  "except BaseException:\n"
+                  "    print('caught')\n"
+                  % (self.lib, self.hsd,
+                     join(self.input_dir, "sample_energies", "ch4.xyz"),
+                     join(self.exec_dir, "run")))
+        env = dict(environ, FAKE_DFTBPLUS_ABORT="1",
+                   PYTHONPATH=dirname(self.base_dir))
+        process = subprocess.run([sys.executable, "-c", script], env=env,
+                                 stdout=subprocess.PIPE)
+        self.assertNotEqual(process.returncode, 0)
+        self.assertNotIn(b"caught", process.stdout)
+
+    def test_close_at_exit(self):
+        script = ("import libtestset.dftbplus_library as lib\n"
+                  "from libtestset.hsd import load_template\n"
+                  "lib.load(%r).driver(load_template(%r), %r, %r,\n"
+                  "                    {'Driver': None}).run()\n"
+                  % (self.lib, self.hsd,
+                     join(self.input_dir, "sample_energies", "ch4.xyz"),
+                     join(self.exec_dir, "run")))
+        tmp = join(self.base_dir, self.exec_dir, "tmp")
+        Path(tmp).mkdir()
+        env = dict(environ, TMPDIR=tmp, PYTHONPATH=dirname(self.base_dir))
+        subprocess.run([sys.executable, "-c", script], env=env, check=True)
+        self.assertListEqual(listdir(tmp), [])
+
+    def test_optimization(self):
+        job_list = self._jobs(None)
+        drivers = dftbplus_library.run_jobs(job_list, self.hsd, self.exe,
+                                            self.lib, workdir=self.exec_dir)
+        for driver in drivers.values():
+            self.assertNotIsInstance(driver, DFTBPlusLibraryDriver)
+        with self.assertRaises(DFTBPlusLibraryError):
+            dftbplus_library.load(join(self.exec_dir, "missing.so"))
+
+
+if __name__ == "__main__":
+    unittest.main()
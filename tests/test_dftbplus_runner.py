@@ -1,10 +1,12 @@
 from libtestset.dftbplus_runner import DFTBPlusRunnerError, XYZError
-from os import chdir, getcwd
+from libtestset.jobs import collect_jobs, distribute
+from os import chdir, environ, getcwd
 from os.path import join
 from pathlib import Path
 from shutil import rmtree
 
 import libtestset.dftbplus_runner as dftb
+import libtestset.stages as stages
 import numpy as np
 import unittest
 
@@ -51,6 +53,90 @@ class TestDFTBPlusRunner(unittest.TestCase):
         coords = np.asarray(vecs)
         np.testing.assert_array_almost_equal(driver.coordinates, coords, 5)
 
+    def test_run_dftb_stub(self):
+        exec_dir = join(self.exec_dir, "run_dftb_stub")
+        stub = join(self.base_dir, "../benchmarks/fake_dftbplus.py")
+        ch4_xyz = join(self.input_dir, "testset/ch4.xyz")
+        hsd = join(self.input_dir, "dftb_in.hsd")
+        driver = dftb.DFTBPlusDriver(stub, hsd, ch4_xyz, exec_dir)
+        driver.run()
+        self.assertAlmostEqual(driver.energy, -1754.627, 3)
+        self.assertListEqual(driver.atoms, ['C', 'H', 'H', 'H', 'H'])
+
+    def test_run_jobs_retries(self):
+        stub = join(self.base_dir, "../benchmarks/fake_dftbplus.py")
+        hsd = join(self.base_dir, self.input_dir, "dftb_in.hsd")
+        testsets = {"Sample": {"path": join(self.input_dir, "testset")}}
+        job_list = collect_jobs(testsets)
+        # MaxSCCIterations = 250 suffices for ch4 (200), but not for c2h6
+        environ["FAKE_DFTBPLUS_SCC_PER_ATOM"] = "40"
+        chdir(self.exec_dir)
+        try:
+            with self.assertRaises(DFTBPlusRunnerError):
+                dftb.run_jobs(job_list, hsd, stub)
+            self.assertEqual(getcwd(), join(self.base_dir, self.exec_dir))
+            retries = [{"Hamiltonian/MaxSCCIterations": 300},
+                       {"Hamiltonian/MaxSCCIterations": 1000}]
+            drivers = dftb.run_jobs(job_list, hsd, stub, retries=retries)
+            self.assertEqual(len(drivers), 2)
+            drivers = dftb.run_jobs(job_list, hsd, stub,
+                                    retries=retries[:1])
+        finally:
+            del environ["FAKE_DFTBPLUS_SCC_PER_ATOM"]
+            chdir(self.base_dir)
+        calcs = distribute(job_list, drivers)["Sample"]
+        self.assertListEqual(sorted(calcs), ["ch4"])
+        failed = [x for x in job_list if x.errors]
+        self.assertEqual(failed[0].name, "c2h6")
+        self.assertEqual(len(failed[0].errors["DFTB+"]), 2)
+
+    def test_run_jobs_staged(self):
+        stub = join(self.base_dir, "../benchmarks/fake_dftbplus.py")
+        hsd = join(self.base_dir, self.input_dir, "dftb_in.hsd")
+        staged = {"hsd": {"Driver/MaxForceComponent": 1e-3}, "fmax": 0.05,
+                  "check": True}
+        testsets = {"Sample": {"path": join(self.input_dir, "testset"),
+                               "staged": staged}}
+        job_list = collect_jobs(testsets)
+        chdir(self.exec_dir)
+        drivers = dftb.run_jobs(job_list, hsd, stub)
+        chdir(self.base_dir)
+        for driver in drivers.values():
+            # The stub halves the force from 0.1 per step
+            self.assertListEqual(driver.stage_steps, [7, 11])
+            self.assertEqual(driver.geometry_steps, 18)
+            self.assertEqual(driver.reference["geometry_steps"], 11)
+            self.assertAlmostEqual(driver.energy,
+                                   driver.reference["energy"])
+        report = stages.report(testsets, job_list, drivers, "DFTB+")
+        self.assertIn("Sample: 2 systems, 36 geometry steps (14 in the "
+                      "loose stage)", report)
+        self.assertIn("single stage: 22 geometry steps", report)
+        self.assertIn("max. absolute 0.000000 kcal/mol", report)
+
+    def test_run_jobs_single_point(self):
+        stub = join(self.base_dir, "../benchmarks/fake_dftbplus.py")
+        hsd = join(self.base_dir, self.input_dir, "dftb_in.hsd")
+        testsets = {"Sample": {"path": join(self.input_dir, "testset"),
+                               "calculation": "single_point"},
+                    "Optimized": {"path": join(self.input_dir, "testset")}}
+        job_list = collect_jobs(testsets)
+        self.assertEqual(len(job_list), 4)
+        chdir(self.exec_dir)
+        drivers = dftb.run_jobs(job_list, hsd, stub)
+        chdir(self.base_dir)
+        calcs = distribute(job_list, drivers)
+        for sys_name in ("ch4", "c2h6"):
+            single = calcs["Sample"][sys_name]
+            self.assertEqual(single.geometry_steps, 0)
+            self.assertGreater(calcs["Optimized"][sys_name].geometry_steps,
+                               0)
+            self.assertAlmostEqual(single.energy,
+                                   calcs["Optimized"][sys_name].energy)
+        np.testing.assert_array_almost_equal(
+            calcs["Sample"]["ch4"].coordinates,
+            calcs["Optimized"]["ch4"].coordinates)
+
     def test_run_dftb_sccerror(self):
         exec_dir = join(self.exec_dir, "run_dftb_sccerror")
         Path(exec_dir).mkdir(parents=True, exist_ok=True)
@@ -69,6 +155,15 @@ class TestDFTBPlusRunner(unittest.TestCase):
         with self.assertRaises(DFTBPlusRunnerError):
             driver.run()
 
+    def test_run_dftb_missing_output(self):
+        exec_dir = join(self.exec_dir, "run_dftb_missing_output")
+        ch4_xyz = join(self.input_dir, "testset/ch4.xyz")
+        hsd = join(self.input_dir, "dftb_in.hsd")
+        driver = dftb.DFTBPlusDriver("true", hsd, ch4_xyz, exec_dir)
+        with self.assertRaises(DFTBPlusRunnerError) as context:
+            driver.run()
+        self.assertIn("detailed.out", str(context.exception))
+
     def test_xyz2gen(self):
         exec_dir = join(self.exec_dir, "xyz2gen")
         Path(exec_dir).mkdir(parents=True, exist_ok=True)
@@ -1,4 +1,6 @@
-from libtestset.dtnn_runner import DTNNDriver, run_testset
+from libtestset.dtnn_runner import DTNNDriver, DTNNRunnerError, run_jobs
+from libtestset.dtnn_runner import run_testset
+from libtestset.jobs import collect_jobs
 from os import chdir, getcwd
 from os.path import join
 from pathlib import Path
@@ -51,6 +53,22 @@ class TestDFTBPlusRunner(unittest.TestCase):
         atoms = ["C", "H", "H", "H", "H"]
         self.assertListEqual(driver.atoms, atoms)
 
+    def test_run_dtnn_error(self):
+        exec_dir = join(self.exec_dir, "run_dtnn_error")
+        ch4_xyz = join(self.input_dir, "ch4.xyz")
+        model = join(self.input_dir, "missing.dtnn")
+        skf = "/home/mkubillus/slko/3ob-3-1/"
+        driver = DTNNDriver(model, ch4_xyz, "dftb+", skf, exec_dir)
+        with self.assertRaises(DTNNRunnerError):
+            driver.run()
+        job_list = collect_jobs({"Sample": {"path": join(self.input_dir,
+                                                         "testset")}})
+        drivers = run_jobs(job_list, model, "dftb+", skf,
+                           fault_tolerant=True, workdir=self.exec_dir)
+        self.assertDictEqual(drivers, dict())
+        for job in job_list:
+            self.assertIn("DTNN", job.errors)
+
 
 if __name__ == "__main__":
     unittest.main()
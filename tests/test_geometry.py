@@ -0,0 +1,93 @@
+from libtestset.geometry import XYZError
+from os import getcwd
+from os.path import exists, join
+from pathlib import Path
+from shutil import copy2, rmtree
+
+import libtestset.geometry as geometry
+import numpy as np
+import unittest
+
+
+class TestGeometry(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/dftbplus_runner/"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        rmtree(self.exec_dir)
+
+    def test_load_index(self):
+        set_dir = join(self.exec_dir, "load_index")
+        Path(set_dir).mkdir(parents=True, exist_ok=True)
+        for name in ["testset/ch4.xyz", "testset/c2h6.xyz", "h2_fail.xyz"]:
+            copy2(join(self.input_dir, name), set_dir)
+        index = geometry.load_index(set_dir)
+        self.assertListEqual(index.names, ["c2h6", "ch4"])
+        self.assertTrue(exists(join(set_dir, geometry.INDEX_FILE)))
+        self.assertEqual(index.coordinates.dtype, np.float64)
+        self.assertEqual(index.offsets[-1], 13)
+        self.assertListEqual(index.symbols("ch4"), ["C", "H", "H", "H", "H"])
+        self.assertDictEqual(index.element_counts("c2h6"), {"c": 2, "h": 6})
+        with self.assertRaises(XYZError):
+            index.get("h2_fail")
+        # Second load comes from the sidecar file
+        geometry._indices.clear()
+        cached = geometry.load_index(set_dir)
+        np.testing.assert_array_equal(cached.coordinates, index.coordinates)
+        # Changed directory invalidates the index
+        copy2(join(self.input_dir, "h2.xyz"), set_dir)
+        self.assertIn("h2", geometry.load_index(set_dir))
+
+    def test_load_dataset(self):
+        frames = []
+        for name in ["testset/ch4.xyz", "testset/c2h6.xyz", "h2.xyz"]:
+            with open(join(self.input_dir, name), "r") as infile:
+                lines = infile.read().strip().splitlines()
+            if name == "h2.xyz":
+                lines[1] = 'energy=-1.0 name="hydrogen" pbc="F F F"'
+            frames.append("\n".join(lines) + "\n")
+        frames.insert(2, "2\n\nXx 0.0 0.0 0.0\nH 0.0 0.0 0.8\n")
+        dataset = join(self.exec_dir, "samples.xyz")
+        with open(dataset, "w") as outfile:
+            outfile.write("".join(frames))
+        self.assertTrue(geometry.is_dataset(dataset))
+        index = geometry.load_index(dataset)
+        # Unnamed frames are named after their position in the file
+        self.assertListEqual(index.names, ["0", "1", "hydrogen"])
+        self.assertIn("2", index.errors)
+        self.assertEqual(index.offsets[-1], 15)
+        self.assertListEqual(index.order(["hydrogen", "wombat", "0"]),
+                             ["0", "hydrogen", "wombat"])
+        self.assertTrue(exists(join(self.exec_dir,
+                                    ".samples.xyz" + geometry.INDEX_FILE)))
+        symbols, coords = geometry.read_geometry(join(dataset, "1.xyz"))
+        self.assertListEqual(symbols, ["C"] * 2 + ["H"] * 6)
+        geometry._indices.clear()
+        cached = geometry.load_index(dataset)
+        np.testing.assert_array_equal(cached.coordinates, index.coordinates)
+        self.assertListEqual(cached.names, index.names)
+        # Frames are collected in chunks
+        geometry.CHUNK_SIZE, chunk_size = 2, geometry.CHUNK_SIZE
+        try:
+            chunked = geometry._build_index(
+                dataset, geometry.read_frames(dataset), "")
+        finally:
+            geometry.CHUNK_SIZE = chunk_size
+        np.testing.assert_array_equal(chunked.offsets, index.offsets)
+        np.testing.assert_array_equal(chunked.coordinates, index.coordinates)
+        with self.assertRaises(XYZError):
+            next(geometry.read_frames(join(self.exec_dir, "samples.mol")))
+
+    def test_read_geometry(self):
+        symbols, coords = geometry.read_geometry(
+            join(self.input_dir, "testset/ch4.xyz"))
+        self.assertListEqual(symbols, ["C", "H", "H", "H", "H"])
+        np.testing.assert_array_almost_equal(coords[1], [0.62834] * 3, 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from os import listdir, makedirs, remove
+from os.path import join
+from shutil import rmtree
+
+import json
+import unittest
+import util.gmtkn_parser as gmtkn_parser
+
+
+class TestGMTKNParser(unittest.TestCase):
+
+    def setUp(self):
+        self.exec_dir = "testing_dir"
+        self.data = join(self.exec_dir, "GMTKN55")
+        self.output = join(self.exec_dir, "parsed")
+        subset = join(self.data, "W4")
+        for name, n_atoms in (("h", 1), ("h2", 2), ("o2", 2)):
+            makedirs(join(subset, name))
+            with open(join(subset, name, "struc.xyz"), "w") as out:
+                out.write("%d\n\n" % n_atoms)
+                for i in range(n_atoms):
+                    out.write("%s 0.0 0.0 %.1f\n" % (name[0].upper(), i))
+        with open(join(subset, "o2", ".UHF"), "w") as out:
+            out.write("2\n")
+        with open(join(subset, "W4.ref"), "w") as out:
+            out.write("1 h h2 -2 1 -109.5\n")
+
+    def tearDown(self):
+        rmtree(self.exec_dir)
+
+    def _parse(self):
+        with redirect_stdout(StringIO()) as output:
+            config = gmtkn_parser.parse_gmtkn_55(self.data, self.output, 1)
+        return config, output.getvalue()
+
+    def test_incremental(self):
+        config, output = self._parse()
+        self.assertIn("parsing 1", output)
+        self.assertIn("collection: \"GMTKN55\"", config)
+        self.assertIn("unpaired_electrons: 2", config)
+        self.assertEqual(len(listdir(join(self.output, ".objects"))), 3)
+        self.assertEqual(self._parse()[1].count("parsing 0"), 1)
+        # manifests of other versions are parsed again
+        manifest = join(self.output, gmtkn_parser.MANIFEST)
+        with open(manifest, "r") as infile:
+            subsets = json.load(infile)["subsets"]
+        subsets["W4"]["config"] = "  W4:\n"
+        with open(manifest, "w") as out:
+            json.dump(subsets, out)
+        config, output = self._parse()
+        self.assertIn("parsing 1", output)
+        self.assertIn("collection: \"GMTKN55\"", config)
+        # geometries no longer used are removed
+        remove(join(self.data, "W4", "o2", "struc.xyz"))
+        self._parse()
+        self.assertEqual(len(listdir(join(self.output, ".objects"))), 2)
+        self.assertListEqual(sorted(listdir(join(self.output, "W4"))),
+                             ["h.xyz", "h2.xyz"])
+
+
+if __name__ == "__main__":
+    unittest.main()
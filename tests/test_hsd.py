@@ -0,0 +1,89 @@
+from libtestset.hsd import HSDError
+from os.path import join
+
+import libtestset.hsd as hsd
+import unittest
+
+
+class TestHSD(unittest.TestCase):
+
+    def setUp(self):
+        self.input_dir = "input_files/dftbplus_runner/"
+
+    def test_parse_render(self):
+        tree = hsd.parse('Driver = ConjugateGradient{\n MaxSteps = 10 # c\n}\n'
+                         'Options { WriteDetailedOut = Yes }')
+        self.assertEqual(tree.find("driver").method, "ConjugateGradient")
+        self.assertEqual(tree.find("Driver/MaxSteps").value, "10")
+        self.assertEqual(tree.find("Options/WriteDetailedOut").value, "Yes")
+        rendered = tree.render()
+        self.assertEqual(hsd.parse(rendered).render(), rendered)
+        with self.assertRaises(HSDError):
+            hsd.parse("Driver = {\n MaxSteps = 10\n")
+
+    def test_overrides(self):
+        tree = hsd.parse("Hamiltonian = DFTB {\n Charge = 0\n}")
+        tree.set("Hamiltonian/Charge", 1)
+        tree.set("Hamiltonian/SpinPolarisation",
+                 "Colinear { UnpairedElectrons = 2 }")
+        tree.set("Analysis/CalculateForces", True)
+        tree.set("Driver", None)
+        self.assertEqual(tree.find("Hamiltonian/Charge").value, "1")
+        spin = tree.find("Hamiltonian/SpinPolarisation")
+        self.assertEqual(spin.method, "Colinear")
+        self.assertEqual(spin.find("UnpairedElectrons").value, "2")
+        self.assertEqual(tree.find("Analysis/CalculateForces").value, "Yes")
+        with self.assertRaises(HSDError):
+            tree.set("Hamiltonian/Charge/Value", 1)
+
+    def test_units(self):
+        tree = hsd.parse("Hamiltonian = DFTB {\n Filling = Fermi {\n"
+                         "  Temperature [K] = 300\n }\n}")
+        node = tree.find("Hamiltonian/Filling/Temperature")
+        self.assertEqual((node.value, node.unit), ("300", "K"))
+        self.assertIn("Temperature [K] = 300", tree.render())
+        tree.set("Hamiltonian/Filling/Temperature [Kelvin]", 200)
+        filling = tree.find("Hamiltonian/Filling")
+        self.assertEqual(len(filling.children), 1)
+        self.assertEqual(filling.children[0].render(),
+                         "Temperature [Kelvin] = 200")
+
+    def test_template(self):
+        template = hsd.load_template(join(self.input_dir, "dftb_in.hsd"))
+        self.assertIs(template,
+                      hsd.load_template(join(self.input_dir, "dftb_in.hsd")))
+        text = template.render(["H", "H"], [[0.0, 0.0, 0.0], [0.0, 0.0, 0.8]],
+                               {"Hamiltonian/Charge": 1})
+        tree = hsd.parse(text)
+        geometry = tree.find("Geometry")
+        self.assertEqual(geometry.method, "GenFormat")
+        self.assertListEqual([x.value for x in geometry.children[:2]],
+                             ["2 C", "H"])
+        self.assertNotIn("in.gen", text)
+        self.assertEqual(tree.find("Hamiltonian/Charge").value, "1")
+        # fallback settings of the removed Driver of single points
+        text = template.render(["H"], [[0.0, 0.0, 0.0]],
+                               {"Driver": None,
+                                "Driver/MaxForceComponent": 1e-4})
+        self.assertIsNone(hsd.parse(text).find("Driver"))
+
+    def test_system_overrides(self):
+        set_definition = {"hsd": {"Hamiltonian/MaxSCCIterations": 500},
+                          "systems": {"na+": {"charge": 1},
+                                      "o2": {"unpaired_electrons": 2}}}
+        na = hsd.system_overrides(set_definition, "na+")
+        self.assertEqual(na["Hamiltonian/Charge"], 1)
+        self.assertEqual(na["Hamiltonian/MaxSCCIterations"], 500)
+        o2 = hsd.system_overrides(set_definition, "o2")
+        self.assertIn("UnpairedElectrons = 2",
+                      o2["Hamiltonian/SpinPolarisation"])
+        self.assertNotIn("Hamiltonian/Charge",
+                         hsd.system_overrides(set_definition, "h2"))
+        self.assertFalse(hsd.is_single_point(na))
+        set_definition["calculation"] = "single_point"
+        self.assertTrue(hsd.is_single_point(
+            hsd.system_overrides(set_definition, "h2")))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,10 +1,11 @@
-from libtestset import input_parser
+from libtestset import input_parser, stages
 from libtestset.input_parser import InputError
-from os import chdir, getcwd, mkdir
-from os.path import join
-from shutil import copy2, rmtree
+from os import chdir, environ, getcwd, mkdir, pathsep
+from os.path import abspath, exists, join
+from shutil import copy2, copytree, rmtree
 
 import unittest
+import yaml
 
 
 class TestInputParser(unittest.TestCase):
@@ -39,6 +40,115 @@ class TestInputParser(unittest.TestCase):
             input_parser.load("fail2.yml")
         chdir(self.base_dir)
 
+    def test_load_validation(self):
+        exec_dir = join(self.exec_dir, "load_validation")
+        mkdir(exec_dir)
+        copy2(join(self.input_dir, "dftbplus.hsd"), exec_dir)
+        samples = abspath("input_files/run_testsets/sample_reactions")
+        settings = {
+            "Options": {"DFTBPlusHSD": "dftbplus.hsd",
+                        "DFTBPlusPath": abspath(
+                            "../benchmarks/fake_dftbplus.py")},
+            "Testsets": {"Reactions": {
+                "path": samples,
+                "type": "reaction",
+                "reactions": [{"equation": "c2h6 + h2o -> c2h5oh + h2",
+                               "reference": "-24.3"}],
+                "staged": True}}}
+        with open(join(exec_dir, "valid.yml"), "w") as outfile:
+            yaml.safe_dump(settings, outfile)
+        settings["Testsets"]["Reactions"]["reactions"].extend([
+            {"equation": "c2h6 + h2o -> c2h5oh + wombat", "reference": 1.0},
+            {"equation": "c2h6 + -> h2", "reference": 1.0},
+            {"equation": "h2 -> h2", "reference": "one"}])
+        settings["Options"]["AtomicEnergies"] = "guessed"
+        settings["Testsets"]["Energies"] = {"path": samples,
+                                            "type": "atomisation",
+                                            "staged": {"fmax": "loose"}}
+        with open(join(exec_dir, "invalid.yml"), "w") as outfile:
+            yaml.safe_dump(settings, outfile)
+        chdir(exec_dir)
+        loaded = input_parser.load("valid.yml")
+        testset = loaded["Testsets"]["Reactions"]
+        self.assertEqual(testset["path"], samples)
+        self.assertEqual(testset["reactions"][0]["reference"], -24.3)
+        self.assertDictEqual(testset["reactions"][0]["stoichiometry"],
+                             {"c2h6": -1, "h2o": -1, "c2h5oh": 1, "h2": 1})
+        self.assertListEqual(testset["required_systems"],
+                             ["c2h5oh", "c2h6", "h2", "h2o"])
+        self.assertDictEqual(testset["staged"],
+                             {"hsd": stages.DEFAULT_HSD,
+                              "fmax": stages.DEFAULT_FMAX, "check": False})
+        self.assertTrue(exists(".valid.yml.cache"))
+        self.assertDictEqual(input_parser.load("valid.yml"), loaded)
+        with self.assertRaises(InputError) as context:
+            input_parser.load("invalid.yml")
+        msg = str(context.exception)
+        self.assertIn("'wombat'", msg)
+        self.assertIn("reaction 3", msg)
+        self.assertIn("reaction 4", msg)
+        self.assertIn("'atomisation'", msg)
+        self.assertIn("staged 'fmax' 'loose'", msg)
+        self.assertIn("AtomicEnergies", msg)
+        chdir(self.base_dir)
+
+    def test_cache_invalidation(self):
+        exec_dir = join(self.exec_dir, "cache_invalidation")
+        mkdir(exec_dir)
+        copy2(join(self.input_dir, "dftbplus.hsd"), exec_dir)
+        copytree("input_files/run_testsets/sample_reactions",
+                 join(exec_dir, "samples"))
+        for name in ("bin1", "bin2"):
+            mkdir(join(exec_dir, name))
+            copy2("../benchmarks/fake_dftbplus.py", join(exec_dir, name))
+        settings = {
+            "Options": {"DFTBPlusHSD": "dftbplus.hsd",
+                        "DFTBPlusPath": "fake_dftbplus.py"},
+            "Testsets": {"Reactions": {
+                "path": "samples",
+                "type": "reaction",
+                "reactions": [{"equation": "h2o -> h2",
+                               "reference": 1.0}]}}}
+        with open(join(exec_dir, "valid.yml"), "w") as outfile:
+            yaml.safe_dump(settings, outfile)
+        path = environ["PATH"]
+        chdir(exec_dir)
+        try:
+            environ["PATH"] = abspath("bin1") + pathsep + path
+            loaded = input_parser.load("valid.yml")
+            self.assertEqual(loaded["Options"]["DFTBPlusPath"],
+                             abspath("bin1/fake_dftbplus.py"))
+            environ["PATH"] = abspath("bin2") + pathsep + path
+            loaded = input_parser.load("valid.yml")
+            self.assertEqual(loaded["Options"]["DFTBPlusPath"],
+                             abspath("bin2/fake_dftbplus.py"))
+        finally:
+            environ["PATH"] = path
+        with open("samples/h2.xyz", "w") as outfile:
+            outfile.write("2\n\nH 0.0 0.0\n")
+        with self.assertRaises(InputError):
+            input_parser.load("valid.yml")
+        chdir(self.base_dir)
+
+    def test_spin_validation(self):
+        samples = abspath("input_files/run_testsets/sample_reactions")
+        settings = {
+            "Options": {"DFTBPlusHSD": abspath(join(self.input_dir,
+                                                    "dftbplus.hsd")),
+                        "DFTBPlusPath": abspath(
+                            "../benchmarks/fake_dftbplus.py")},
+            "Testsets": {"Reactions": {
+                "path": samples,
+                "type": "reaction",
+                "reactions": [{"equation": "h2o -> h2", "reference": 1.0}],
+                "systems": {"h2": {"unpaired_electrons": 2}}}}}
+        with self.assertRaises(InputError) as context:
+            input_parser.validate(settings, self.base_dir)
+        self.assertIn("SpinConstants", str(context.exception))
+        settings["Testsets"]["Reactions"]["hsd"] = {
+            "Hamiltonian/SpinConstants": "{ H = { -0.072 } }"}
+        input_parser.validate(settings, self.base_dir)
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,134 @@
+from os import getcwd
+from os.path import join
+from pathlib import Path
+from shutil import copy2, rmtree
+
+from libtestset.constants import element_symbols
+from libtestset.geometry import load_index
+from libtestset.store import StoredGeometry
+
+import libtestset.jobs as jobs
+import libtestset.results as results
+import numpy as np
+import unittest
+
+
+class TestJobs(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/dftbplus_runner/testset"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        rmtree(self.exec_dir)
+
+    def test_collect_jobs(self):
+        set_a = join(self.exec_dir, "set_a")
+        set_b = join(self.exec_dir, "set_b")
+        Path(set_a).mkdir()
+        Path(set_b).mkdir()
+        copy2(join(self.input_dir, "ch4.xyz"), set_a)
+        copy2(join(self.input_dir, "c2h6.xyz"), set_a)
+        # Shifted methane with reordered hydrogen atoms
+        with open(join(set_b, "methane.xyz"), "w") as out:
+            out.write("5\n\n"
+                      "H  1.62834  1.62834  1.62834\n"
+                      "H  0.37166  0.37166  1.62834\n"
+                      "C  1.00000  1.00000  1.00000\n"
+                      "H  1.62834  0.37166  0.37166\n"
+                      "H  0.37166  1.62834  0.37166\n")
+        copy2(join(set_b, "methane.xyz"), join(set_b, "cation.xyz"))
+        testsets = {"A": {"path": set_a},
+                    "B": {"path": set_b,
+                          "systems": {"cation": {"charge": 1}}}}
+        job_list = jobs.collect_jobs(testsets)
+        self.assertEqual(len(job_list), 3)
+        aliases = sorted(sorted(x.aliases) for x in job_list)
+        self.assertListEqual(aliases, [[("A", "c2h6")], [("A", "ch4"),
+                                                          ("B", "methane")],
+                                       [("B", "cation")]])
+        self.assertIn("1 saved", jobs.report(job_list))
+        self.assertEqual(len(jobs.collect_jobs(testsets, tolerance=None)), 4)
+        drivers = {x.key: x.name for x in job_list}
+        calcs = jobs.distribute(job_list, drivers)
+        self.assertEqual(calcs["B"]["cation"], "cation")
+        self.assertIsInstance(calcs["B"]["methane"], jobs.PermutedResult)
+
+    def test_atom_order(self):
+        set_a = join(self.exec_dir, "set_a")
+        set_b = join(self.exec_dir, "set_b")
+        Path(set_a).mkdir()
+        Path(set_b).mkdir()
+        copy2(join(self.input_dir, "ch4.xyz"), set_a)
+        with open(join(set_a, "ch4.xyz"), "r") as infile:
+            lines = infile.read().splitlines()
+        atoms = lines[2:7]
+        # The same methane with the carbon atom in the middle
+        with open(join(set_b, "ch4.xyz"), "w") as out:
+            out.write("\n".join(lines[:2] + atoms[1:3] + atoms[:1]
+                                + atoms[3:]) + "\n")
+        references = {"ch4": {"atoms": "1,2", "reference": 1.0}}
+        testsets = {"A": {"path": set_a, "type": "distance",
+                          "references": references,
+                          "required_systems": ["ch4"]},
+                    "B": {"path": set_b, "type": "distance",
+                          "references": references,
+                          "required_systems": ["ch4"]}}
+        job_list = jobs.collect_jobs(testsets)
+        self.assertEqual(len(job_list), 1)
+        numbers, coords = load_index(set_a).get("ch4")
+        driver = StoredGeometry(-1.0, [element_symbols[x] for x in numbers],
+                                coords, 1.0)
+        calcs = jobs.distribute(job_list, {job_list[0].key: driver})
+        self.assertListEqual(calcs["B"]["ch4"].atoms,
+                             [x.split()[0] for x in atoms[1:3] + atoms[:1]
+                              + atoms[3:]])
+        self.assertEqual(calcs["B"]["ch4"].energy, -1.0)
+        distances = {}
+        for set_name in testsets:
+            entry = results.get_entries(testsets[set_name],
+                                        calcs[set_name])[0]
+            distances[set_name] = entry.value
+        coords = np.array([[float(y) for y in x.split()[1:4]]
+                           for x in atoms])
+        self.assertAlmostEqual(distances["A"],
+                               np.linalg.norm(coords[0] - coords[1]))
+        self.assertAlmostEqual(distances["B"],
+                               np.linalg.norm(coords[1] - coords[2]))
+
+    def test_run_with_retries(self):
+        job_list = [jobs.Job(x, "%s.xyz" % x, 1, {"Charge": 0})
+                    for x in ("good", "flaky", "bad")]
+        for job in job_list:
+            job.aliases.append(("Set", job.key))
+        order = []
+
+        def run_job(job, overrides):
+            order.append(job.key)
+            if job.key == "bad" or (job.key == "flaky" and
+                                    "Mixer" not in overrides):
+                raise ValueError("%s failed" % job.key)
+            return overrides
+
+        with self.assertRaises(ValueError):
+            jobs.run_with_retries(job_list, run_job, ValueError, "DFTB+")
+        order.clear()
+        drivers = jobs.run_with_retries(job_list, run_job, ValueError,
+                                        "DFTB+", [{"Mixer": "Broyden"}])
+        self.assertListEqual(order, ["good", "flaky", "bad", "flaky", "bad"])
+        self.assertListEqual(sorted(drivers), ["flaky", "good"])
+        self.assertDictEqual(drivers["flaky"],
+                             {"Charge": 0, "Mixer": "Broyden"})
+        self.assertDictEqual(job_list[1].errors, dict())
+        self.assertListEqual(job_list[2].errors["DFTB+"],
+                             ["bad failed", "bad failed"])
+        self.assertIn("Set/bad after 2 attempt(s)",
+                      jobs.failure_report(job_list))
+        calcs = jobs.distribute(job_list, drivers)
+        self.assertListEqual(sorted(calcs["Set"]), ["flaky", "good"])
+
+
+if __name__ == "__main__":
+    unittest.main()
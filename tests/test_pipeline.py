@@ -0,0 +1,49 @@
+from libtestset.backends import Backend
+from threading import Event
+
+import libtestset.jobs as jobs
+import libtestset.pipeline as pipeline
+import unittest
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.job_list = [jobs.Job(x, "%s.xyz" % x, 1, None)
+                         for x in ("a", "b", "c", "d")]
+        self.started = {"Slow": Event(), "Fast": Event()}
+
+    def _backend(self, name, wait_for=None, fail=None):
+        def run_job(job, _overrides):
+            self.started[name].set()
+            if wait_for is not None:
+                # only returns if the other stage runs at the same time
+                self.assertTrue(self.started[wait_for].wait(5.0))
+            if job.key == fail:
+                raise ValueError("%s failed" % job.key)
+            return "%s %s" % (name, job.key)
+
+        def runner(_module, job_list, _options, _archive, _workdir):
+            return jobs.run_with_retries(job_list, run_job, ValueError, name)
+
+        return Backend(name, "json", runner)
+
+    def test_run(self):
+        methods = [self._backend("Slow", wait_for="Fast"),
+                   self._backend("Fast")]
+        drivers = pipeline.run(methods, iter(self.job_list), dict(),
+                               depth=1)
+        self.assertListEqual(list(drivers), ["Slow", "Fast"])
+        self.assertDictEqual(drivers["Fast"],
+                             {x.key: "Fast %s" % x.key
+                              for x in self.job_list})
+        self.assertEqual(drivers["Slow"]["d"], "Slow d")
+
+    def test_failure(self):
+        methods = [self._backend("Slow"), self._backend("Fast", fail="b")]
+        with self.assertRaises(ValueError):
+            pipeline.run(methods, self.job_list, dict(), depth=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
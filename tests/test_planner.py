@@ -0,0 +1,65 @@
+from libtestset.jobs import Job
+from libtestset.planner import PlannerError, TimingHistory
+from os import getcwd
+from os.path import join
+from pathlib import Path
+from shutil import rmtree
+
+import libtestset.planner as planner
+import unittest
+
+
+class DummyDriver(object):
+
+    def __init__(self, wall_time):
+        self.wall_time = wall_time
+
+
+class TestPlanner(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        rmtree(self.exec_dir)
+
+    def test_makespan(self):
+        # LPT is no exact scheduler: 7 instead of the optimal 6 here
+        self.assertAlmostEqual(planner.makespan([3, 3, 2, 2, 2], 2), 7.0)
+        self.assertAlmostEqual(planner.makespan([5, 1, 1], 4), 5.0)
+        self.assertAlmostEqual(planner.makespan([1, 2, 3], 1), 6.0)
+        self.assertAlmostEqual(planner.makespan([], 3), 0.0)
+
+    def test_history(self):
+        path = join(self.exec_dir, "timings.json")
+        job_list = [Job("job%d" % x, "%d.xyz" % x, x, dict())
+                    for x in (2, 4, 8)]
+        history = TimingHistory(path)
+        self.assertEqual(history.model("DFTB+"), planner.DEFAULT_MODEL)
+        # Recorded times follow seconds = 0.5 * n_atoms**3
+        drivers = {x.key: DummyDriver(0.5 * x.n_atoms**3)
+                   for x in job_list[:2]}
+        history.record("DFTB+", job_list, drivers)
+        history.save()
+        history = TimingHistory(path)
+        self.assertEqual(len(history), 2)
+        self.assertEqual(history.estimate("DFTB+", job_list[0]), (4.0, True))
+        seconds, recorded = history.estimate("DFTB+", job_list[2])
+        self.assertFalse(recorded)
+        self.assertAlmostEqual(seconds, 256.0)
+        for job in job_list:
+            job.aliases.append(("Set", job.key))
+        report = planner.plan({"Set": None}, job_list, ["DFTB+"], 2, history)
+        self.assertIn("3 unique calculations", report)
+        self.assertIn("2 of 3 job times", report)
+        self.assertIn("with 2 worker(s): 0.071 h", report)
+        with open(path, "w") as out:
+            out.write("wombat")
+        with self.assertRaises(PlannerError):
+            TimingHistory(path)
+
+
+if __name__ == "__main__":
+    unittest.main()
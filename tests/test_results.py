@@ -42,6 +42,12 @@ class TestResults(unittest.TestCase):
         self.assertAlmostEqual(c2h6.deviation, -3.532017110458696, 3)
         with self.assertRaises(AtomizationEnergyError):
             results.AtomizationEnergy("wom.bat", 0.0, 1.0)
+        atomics = {"c": -900.0, "h": -175.0}
+        ch4 = results.AtomizationEnergy(ch4_xyz, ch4_energy, ch4_ref, atomics)
+        self.assertAlmostEqual(ch4.eat, 2028.4592464933714 - 1600.0, 6)
+        with self.assertRaises(AtomizationEnergyError):
+            results.AtomizationEnergy(ch4_xyz, ch4_energy, ch4_ref,
+                                      {"c": -900.0})
 
     def test_reaction_energy(self):
         systems = {"c2h6": DummyDriver(-3580.085689008599),
@@ -119,6 +125,57 @@ class TestResults(unittest.TestCase):
         assert(exists("DFTB_deviations.csv"))
         assert(exists("Sample Energies.csv"))
         assert(exists("Sample Reactions.csv"))
+        assert(not exists("DFTB_WTMAD.csv"))
+        testsets["Sample Reactions"]["collection"] = "GMTKN55"
+        results.write_results(testsets, systems)
+        with open("DFTB_WTMAD.csv", "r") as infile:
+            lines = infile.read().splitlines()
+        self.assertEqual(lines[0], "Metric,Value")
+        self.assertNotIn(results.MISSING, lines[1])
+        results.write_results(testsets, systems, bootstrap={
+            "samples": 20, "confidence": 0.9, "seed": 0})
+        with open("DFTB_deviations.csv", "r") as infile:
+            self.assertIn("MAD low", infile.readline())
+        with open("DFTB_WTMAD.csv", "r") as infile:
+            lines = infile.read().splitlines()
+        self.assertEqual(lines[0], "Metric,Value,Low,High")
+        self.assertEqual(len(lines), 3)
+        chdir(self.base_dir)
+
+    def test_missing_results(self):
+        testsets = {
+            "Sample Reactions": {
+                "path": join(self.input_dir, "samples"),
+                "type": "reaction",
+                "reactions": [
+                    {"equation": "c2h6 + h2o -> c2h5oh + h2",
+                     "reference": -24.300},
+                    {"equation": "c4h8 -> 2 c2h4",
+                     "reference": -30.0}
+                ]
+            }
+        }
+        systems = {"Sample Reactions": {"c2h6": DummyDriver(712.5),
+                                        "h2o": DummyDriver(232.4),
+                                        "c2h5oh": DummyDriver(809.0),
+                                        "h2": DummyDriver(109.8)}}
+        reactions = testsets["Sample Reactions"]["reactions"]
+        reac_list = results._get_reactions(systems["Sample Reactions"],
+                                           reactions)
+        self.assertIsInstance(reac_list[1], results.Missing)
+        self.assertListEqual(reac_list[1].missing_systems, ["c2h4", "c4h8"])
+        dev = results.Deviations(reac_list)
+        self.assertEqual(dev.n_missing, 1)
+        self.assertAlmostEqual(dev.mad, abs(reac_list[0].deviation), 3)
+        exec_dir = join(self.exec_dir, "missing_results")
+        Path(exec_dir).mkdir(parents=True, exist_ok=True)
+        chdir(exec_dir)
+        results.write_results(testsets, systems)
+        with open("Sample Reactions.csv", "r") as infile:
+            lines = infile.read().splitlines()
+        self.assertEqual(lines[2], "c4h8 -> 2 c2h4,-30.0,missing,missing")
+        with open("DFTB_deviations.csv", "r") as infile:
+            self.assertTrue(infile.read().splitlines()[1].endswith(",1"))
         chdir(self.base_dir)
 
     def test_write_results_with_dtnn(self):
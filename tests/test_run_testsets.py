@@ -1,10 +1,15 @@
-from os import chdir, getcwd
-from os.path import join
+from contextlib import redirect_stdout
+from io import StringIO
+from libtestset.input_parser import InputError
+from os import chdir, environ, getcwd
+from os.path import exists, join
 from pathlib import Path
 from shutil import copytree, rmtree
 
+import csv
 import run_testsets
 import unittest
+import yaml
 
 
 class TestDFTBPlusRunner(unittest.TestCase):
@@ -23,7 +28,80 @@ class TestDFTBPlusRunner(unittest.TestCase):
         exec_dir = join(self.exec_dir, "run_testsets")
         copytree(self.input_dir, exec_dir)
         chdir(exec_dir)
-        run_testsets.main()
+        run_testsets.main([])
+        chdir(self.base_dir)
+
+    def test_run_testsets_stub(self):
+        exec_dir = join(self.exec_dir, "run_testsets_stub")
+        copytree(self.input_dir, exec_dir)
+        config = join(exec_dir, "testsets_config.yml")
+        with open(config, "r") as infile:
+            settings = yaml.safe_load(infile)
+        settings["Options"]["DFTBPlusPath"] = join(
+            self.base_dir, "../benchmarks/fake_dftbplus.py")
+        with open(config, "w") as outfile:
+            yaml.safe_dump(settings, outfile)
+        chdir(exec_dir)
+        run_testsets.main([])
+        self.assertTrue(exists("DFTB_deviations.csv"))
+        self.assertTrue(exists("Sample Reactions.csv"))
+        self.assertTrue(exists("Sample Energies.csv"))
+        self.assertTrue(exists(".testset_timings.json"))
+        chdir(self.base_dir)
+
+    def test_plan(self):
+        exec_dir = join(self.exec_dir, "plan")
+        copytree(self.input_dir, exec_dir)
+        chdir(exec_dir)
+        with self.assertRaises(InputError):
+            run_testsets.main(["--plan"])  # no DFTB+ executable
+        with open("testsets_config.yml", "r") as infile:
+            settings = yaml.safe_load(infile)
+        settings["Options"]["DFTBPlusPath"] = join(
+            self.base_dir, "../benchmarks/fake_dftbplus.py")
+        with open("testsets_config.yml", "w") as outfile:
+            yaml.safe_dump(settings, outfile)
+        output = StringIO()
+        with redirect_stdout(output):
+            run_testsets.main(["--plan", "--workers", "4"])
+        self.assertIn("5 unique calculations", output.getvalue())
+        self.assertIn("Expected makespan with 4 worker(s)",
+                      output.getvalue())
+        self.assertFalse(exists("DFTB_deviations.csv"))
+        chdir(self.base_dir)
+
+    def test_compare(self):
+        exec_dir = join(self.exec_dir, "compare")
+        copytree(self.input_dir, exec_dir)
+        config = join(exec_dir, "testsets_config.yml")
+        with open(config, "r") as infile:
+            settings = yaml.safe_load(infile)
+        settings["Options"]["DFTBPlusPath"] = join(
+            self.base_dir, "../benchmarks/fake_dftbplus.py")
+        with open(config, "w") as outfile:
+            yaml.safe_dump(settings, outfile)
+        with open(join(exec_dir, "dftb_in.hsd"), "r") as infile:
+            hsd = infile.read()
+        with open(join(exec_dir, "dftb_b.hsd"), "w") as outfile:
+            outfile.write(hsd.replace("MaxSCCIterations = 250",
+                                      "MaxSCCIterations = 100"))
+        chdir(exec_dir)
+        with self.assertRaises(SystemExit):
+            run_testsets.main(["--compare"])
+        output = StringIO()
+        environ["FAKE_DFTBPLUS_SCC_PER_ATOM"] = "12"  # c2h5oh fails for B
+        try:
+            with redirect_stdout(output):
+                run_testsets.main(["--compare", "--hsd-b", "dftb_b.hsd"])
+        finally:
+            del environ["FAKE_DFTBPLUS_SCC_PER_ATOM"]
+        self.assertIn("4 jobs compared", output.getvalue())
+        self.assertIn("B failed for Sample Reactions/c2h5oh",
+                      output.getvalue())
+        with open("DFTB_comparison.csv", "r") as infile:
+            rows = list(csv.DictReader(infile))
+        self.assertEqual(len(rows), 4)
+        self.assertTrue(all(float(x["ΔE"]) == 0.0 for x in rows))
         chdir(self.base_dir)
 
 
@@ -0,0 +1,74 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from libtestset.jobs import Job
+from libtestset.shards import ShardError
+from os import chdir, getcwd, remove
+from os.path import exists, join
+from pathlib import Path
+from shutil import copytree, rmtree
+
+import libtestset.shards as shards
+import run_testsets
+import unittest
+import yaml
+
+
+class TestShards(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/run_testsets/"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        chdir(self.base_dir)
+        rmtree(self.exec_dir)
+
+    def test_assign(self):
+        self.assertEqual(shards.parse("2/3"), (2, 3))
+        for selection in ("0/3", "4/3", "1-3", "a/b"):
+            with self.assertRaises(ShardError):
+                shards.parse(selection)
+        job_list = [Job("key%02d" % x, "%d.xyz" % x, n, None)
+                    for x, n in enumerate([10, 10, 9, 5, 4, 3, 3, 1])]
+        parts = shards.assign(job_list, 2)
+        self.assertEqual(sum(len(x) for x in parts), len(job_list))
+        costs = [sum(x.n_atoms**2 for x in part) for part in parts]
+        self.assertLess(abs(costs[0] - costs[1]), 100)
+        # Independent of the order of the jobs
+        reordered = shards.assign(list(reversed(job_list)), 2)
+        self.assertListEqual([[x.key for x in part] for part in parts],
+                             [[x.key for x in part] for part in reordered])
+
+    def test_shard_merge(self):
+        exec_dir = join(self.exec_dir, "shards")
+        copytree(self.input_dir, exec_dir)
+        config = join(exec_dir, "testsets_config.yml")
+        with open(config, "r") as infile:
+            settings = yaml.safe_load(infile)
+        settings["Options"]["DFTBPlusPath"] = join(
+            self.base_dir, "../benchmarks/fake_dftbplus.py")
+        with open(config, "w") as outfile:
+            yaml.safe_dump(settings, outfile)
+        chdir(exec_dir)
+        with redirect_stdout(StringIO()):
+            run_testsets.main([])
+            with open("Sample Reactions.csv", "r") as infile:
+                single_run = infile.read()
+            remove("Sample Reactions.csv")
+            for index in (1, 2, 3):
+                run_testsets.main(["--shard", "%d/3" % index])
+            self.assertFalse(exists("Sample Reactions.csv"))
+            with self.assertRaises(ShardError):
+                run_testsets.main(["--merge", "shard_1_of_3.json",
+                                   "shard_3_of_3.json"])
+            run_testsets.main(["--merge", "shard_1_of_3.json",
+                               "shard_2_of_3.json", "shard_3_of_3.json"])
+        with open("Sample Reactions.csv", "r") as infile:
+            self.assertEqual(infile.read(), single_run)
+        chdir(self.base_dir)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,68 @@
+import libtestset.statistics as statistics
+import numpy as np
+import unittest
+
+
+class TestStatistics(unittest.TestCase):
+
+    def setUp(self):
+        self.deviations = [np.array([1.0, -2.0, 3.0]), np.array([]),
+                           np.array([0.5])]
+
+    def test_bootstrap(self):
+        samples = statistics.bootstrap(self.deviations, 50, seed=1)
+        self.assertEqual(samples.shape, (50, 3, 4))
+        self.assertTrue(np.isnan(samples[:, 1]).all())
+        # a single deviation is drawn every time
+        np.testing.assert_allclose(samples[:, 2],
+                                   [[0.5, 0.5, 0.5, 0.5]] * 50)
+        # resampled statistics stay within the range of the deviations
+        self.assertTrue((samples[:, 0, 0] >= -2.0).all())
+        self.assertTrue((samples[:, 0, 1] <= 3.0).all())
+        self.assertTrue((samples[:, 0, 3] <= 3.0).all())
+        np.testing.assert_array_equal(
+            samples, statistics.bootstrap(self.deviations, 50, seed=1))
+
+    def test_bootstrap_batches(self):
+        batch_values = statistics.BATCH_VALUES
+        statistics.BATCH_VALUES = 8  # two samples per batch
+        try:
+            samples = statistics.bootstrap(self.deviations, 5, seed=2)
+        finally:
+            statistics.BATCH_VALUES = batch_values
+        self.assertEqual(samples.shape, (5, 3, 4))
+        self.assertFalse(np.isnan(samples[:, 0]).any())
+
+    def test_resample(self):
+        values = np.array([[1.0, 2.0], [2.0, 4.0], [3.0, 6.0]])
+        ratios = statistics.resample(
+            values, lambda x: x[:, :, 1].sum(axis=1) / x[:, :, 0].sum(axis=1),
+            n_samples=50, seed=0)
+        self.assertEqual(ratios.shape, (50,))
+        np.testing.assert_allclose(ratios, 2.0)
+        means = statistics.resample(values[:, 0], lambda x: x.mean(axis=1),
+                                    n_samples=50, seed=0)
+        self.assertTrue(np.all((means >= 1.0) & (means <= 3.0)))
+
+    def test_intervals(self):
+        samples = np.arange(101, dtype=float).reshape(101, 1)
+        bounds = statistics.intervals(samples, 0.9)
+        self.assertEqual(bounds.shape, (1, 2))
+        np.testing.assert_allclose(bounds[0], [5.0, 95.0])
+
+    def test_wtmad(self):
+        # small subset (weight 10) and large subset (weight 0.1)
+        references = [np.array([2.0, 4.0]),
+                      np.array([100.0, -100.0, 100.0])]
+        wtmad_1, wtmad_2 = statistics.wtmad(references, [0.5, 2.0])
+        self.assertAlmostEqual(wtmad_1, (0.5 * 2 * 10 + 2.0 * 3 * 0.1) / 5)
+        self.assertAlmostEqual(wtmad_2, (0.5 * 2 * 56.84 / 3.0
+                                         + 2.0 * 3 * 56.84 / 100.0) / 5)
+        wtmad_1, wtmad_2 = statistics.wtmad(references,
+                                            np.array([[0.5, 2.0],
+                                                      [1.0, 2.0]]))
+        self.assertEqual(wtmad_1.shape, (2,))
+
+
+if __name__ == "__main__":
+    unittest.main()
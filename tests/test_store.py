@@ -0,0 +1,93 @@
+from libtestset.store import GeometryStore, StoreError
+from os import getcwd
+from os.path import join
+from pathlib import Path
+from shutil import rmtree
+
+import libtestset.results as results
+import libtestset.store as store
+import numpy as np
+import unittest
+
+
+class DummyDriver(object):
+
+    def __init__(self, energy, atoms, coordinates):
+        self.energy = energy
+        self.atoms = atoms
+        self.coordinates = np.asarray(coordinates, dtype=float)
+        self.wall_time = 1.5
+
+
+class TestStore(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+        # H2O2 with a dihedral angle of 90 degrees
+        self.h2o2 = DummyDriver(-1.0, ["O", "O", "H", "H"],
+                                [[0.0, 0.0, 0.0], [0.0, 0.0, 1.5],
+                                 [1.0, 0.0, 0.0], [0.0, 1.0, 1.5]])
+        self.h2o = DummyDriver(-2.0, ["O", "H", "H"],
+                               [[0.0, 0.0, 0.0], [1.0, 0.0, 0.0],
+                                [0.0, 2.0, 0.0]])
+
+    def tearDown(self):
+        rmtree(self.exec_dir)
+
+    def test_save_load(self):
+        geometries = GeometryStore.from_drivers({"b": self.h2o,
+                                                 "a": self.h2o2})
+        self.assertListEqual(geometries.keys, ["a", "b"])
+        self.assertListEqual(geometries.offsets.tolist(), [0, 4, 7])
+        path = join(self.exec_dir, store.path("DFTB+"))
+        geometries.save(path)
+        geometries.save(path)  # replaces the older store
+        loaded = GeometryStore.load(path)
+        self.assertIsInstance(loaded.coordinates, np.memmap)
+        stored = loaded.get("b")
+        self.assertListEqual(stored.atoms, ["O", "H", "H"])
+        self.assertEqual(stored.energy, -2.0)
+        self.assertEqual(stored.wall_time, 1.5)
+        np.testing.assert_array_equal(stored.coordinates,
+                                      self.h2o.coordinates)
+        with self.assertRaises(StoreError):
+            GeometryStore.load(join(self.exec_dir, "wombat"))
+
+    def test_measure(self):
+        coords = np.concatenate([self.h2o2.coordinates,
+                                 self.h2o.coordinates])
+        np.testing.assert_allclose(
+            store.measure(coords, [[0, 1], [4, 6], [5, 6]]),
+            [1.5, 2.0, np.sqrt(5.0)])
+        np.testing.assert_allclose(
+            store.measure(coords, [[5, 4, 6], [2, 0, 1]]), [90.0, 90.0])
+        np.testing.assert_allclose(
+            store.measure(coords, [[2, 0, 1, 3], [3, 1, 0, 2]]),
+            [90.0, 90.0])
+        mirrored = coords * [1.0, -1.0, 1.0]
+        np.testing.assert_allclose(
+            store.measure(mirrored, [[2, 0, 1, 3]]), [-90.0])
+
+    def test_get_entries(self):
+        systems = {"h2o2": self.h2o2, "h2o": self.h2o}
+        angles = {"type": "angle", "references": {
+            "h2o": {"atoms": "2,1,3", "reference": 104.5},
+            "h2o2": {"atoms": "3,1,2", "reference": 100.0},
+            "wombat": {"atoms": "1,2,3", "reference": 1.0}}}
+        entries = results.get_entries(angles, systems)
+        self.assertAlmostEqual(entries[0].value, 90.0)
+        self.assertAlmostEqual(entries[0].deviation, 14.5)
+        self.assertAlmostEqual(entries[1].value, 90.0)
+        self.assertIsInstance(entries[2], results.Missing)
+        dihedrals = {"type": "dihedral", "references": {
+            "h2o2": {"atoms": "3,1,2,4", "reference": -175.0}}}
+        entry = results.get_entries(dihedrals, systems)[0]
+        self.assertAlmostEqual(entry.value, 90.0)
+        # Deviations are wrapped around 180 degrees
+        self.assertAlmostEqual(entry.deviation, 95.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
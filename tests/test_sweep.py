@@ -0,0 +1,113 @@
+from contextlib import redirect_stdout
+from io import StringIO
+from os import chdir, getcwd
+from os.path import join
+from pathlib import Path
+from shutil import rmtree
+
+import libtestset.api as api
+import libtestset.archive as archive
+import libtestset.charges as charges
+import libtestset.hsd as hsd
+import libtestset.input_parser as input_parser
+import libtestset.sweep as sweep
+import unittest
+import yaml
+import zipfile
+
+
+class TestSweep(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/run_testsets/"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+        self.options = {"Sweep": {
+            "variants": {"a": {"Hamiltonian/MaxSCCIterations": 100},
+                         "b": dict()},
+            "grid": {"Hamiltonian/HCorrection/Damping/Exponent": [4.0, 4.2]}
+        }}
+
+    def tearDown(self):
+        chdir(self.base_dir)
+        rmtree(self.exec_dir)
+
+    def _settings(self):
+        with open(join(self.input_dir, "testsets_config.yml"), "r") as infile:
+            settings = yaml.safe_load(infile)
+        settings["Options"]["DFTBPlusPath"] = join(
+            self.base_dir, "../benchmarks/fake_dftbplus.py")
+        settings["Options"].update(self.options)
+        return settings
+
+    def test_variants(self):
+        errors = []
+        input_parser._validate_sweep(self.options, errors)
+        self.assertListEqual(errors, [])
+        variants = sweep.variants(self.options["Sweep"])
+        self.assertListEqual(list(variants), [
+            "a, Exponent=4.0", "a, Exponent=4.2",
+            "b, Exponent=4.0", "b, Exponent=4.2"])
+        self.assertDictEqual(variants["a, Exponent=4.2"], {
+            "Hamiltonian/MaxSCCIterations": 100,
+            "Hamiltonian/HCorrection/Damping/Exponent": 4.2})
+        variants = sweep.variants({"variants": dict(),
+                                   "grid": {"A/Value": [1], "B/Value": [2]}})
+        self.assertListEqual(list(variants), ["A/Value=1, B/Value=2"])
+        input_parser._validate_sweep({"Sweep": {"grid": {"A": 1}}}, errors)
+        self.assertEqual(len(errors), 1)
+
+    def test_run(self):
+        plan = api.Plan(self._settings(), self.input_dir)
+        variants = sweep.variants(plan.options["Sweep"])
+        variants["copy"] = dict(variants["b, Exponent=4.0"])
+        expanded = sweep.expand(plan.jobs, variants)
+        self.assertEqual(len({x.key for x in expanded["a, Exponent=4.0"]}),
+                         len(plan.jobs))
+        self.assertListEqual(expanded["copy"], expanded["b, Exponent=4.0"])
+        workdir = join(self.base_dir, self.exec_dir)
+        evaluations = sweep.run(plan.testsets, plan.options, plan.jobs,
+                                variants, workers=2, workdir=workdir)
+        self.assertListEqual(list(evaluations), list(variants))
+        for evaluation in evaluations.values():
+            self.assertEqual(evaluation.statistics.shape, (2, 4))
+            self.assertDictEqual(evaluation.errors, dict())
+        chdir(self.exec_dir)
+        with redirect_stdout(StringIO()):
+            sweep.write(evaluations)
+        with open(sweep.SWEEP_FILE, "r") as infile:
+            lines = infile.read().splitlines()
+        self.assertEqual(lines[0], "Variant,Set Name,MSD,MAD,RMSD,MAX,Missing")
+        self.assertEqual(len(lines), 1 + 2 * len(variants))
+
+    def test_outputs(self):
+        plan = api.Plan(self._settings(), self.input_dir)
+        variants = sweep.variants(plan.options["Sweep"])
+        expanded = sweep.expand(plan.jobs, variants)
+        # charges are stored per geometry, not per variant
+        template = hsd.load_template(plan.options["DFTBPlusHSD"])
+        store = charges.ChargeStore(join(self.exec_dir, "charges"))
+        keys = [{store.key(x, template, x.overrides) for x in y}
+                for y in expanded.values()]
+        self.assertTrue(all(x == keys[0] for x in keys))
+        self.assertEqual(len(keys[0]), len(plan.jobs))
+        workdir = join(self.base_dir, self.exec_dir)
+        outputs = join(workdir, "outputs")
+        with archive.OutputArchive(outputs) as output_archive:
+            sweep.run(plan.testsets, plan.options, plan.jobs, variants,
+                      archive=output_archive, workdir=workdir)
+        for set_name in plan.testsets:
+            systems = sorted({y for x in plan.jobs for z, y in x.aliases
+                              if z == set_name})
+            path = archive.archive_path(outputs, set_name)
+            with zipfile.ZipFile(path, "r") as zip_file:
+                names = zip_file.namelist()
+            self.assertEqual(len(names), len(set(names)))
+            for name in variants:
+                self.assertListEqual(
+                    archive.list_systems(path, "DFTB+/%s" % name), systems)
+
+
+if __name__ == "__main__":
+    unittest.main()
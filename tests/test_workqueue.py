@@ -0,0 +1,106 @@
+from libtestset.jobs import Job
+from libtestset.workqueue import WorkQueue
+from os import chdir, environ, getcwd, listdir
+from os.path import abspath, join
+from pathlib import Path
+from shutil import copytree, rmtree
+
+import libtestset.workqueue as workqueue
+import run_testsets
+import subprocess
+import sys
+import unittest
+import yaml
+
+
+class TestWorkQueue(unittest.TestCase):
+
+    def setUp(self):
+        self.base_dir = getcwd()
+        self.exec_dir = "testing_dir"
+        self.input_dir = "input_files/run_testsets/"
+        Path(self.exec_dir).mkdir(parents=True, exist_ok=True)
+
+    def tearDown(self):
+        chdir(self.base_dir)
+        rmtree(self.exec_dir)
+
+    def test_claim_requeue(self):
+        queue = WorkQueue(join(self.exec_dir, "queue"))
+        job_list = [Job("key%d" % x, "%d.xyz" % x, 1, None) for x in (1, 2)]
+        queue.publish(job_list, "dftb_in.hsd", "dftb+")
+        first = queue.claim("ghost")
+        self.assertEqual(first["key"], "key1")
+        queue.heartbeat("alive")
+        second = queue.claim("alive")
+        self.assertEqual(second["key"], "key2")
+        self.assertIsNone(queue.claim("alive"))
+        # Only the job of the worker without heartbeat is put back
+        self.assertEqual(queue.requeue_stale(stale_after=1.0), 1)
+        self.assertEqual(queue.claim("alive")["key"], "key1")
+        queue.finish(second, {"energy": -1.0, "atoms": ["H"],
+                              "coordinates": [[0.0, 0.0, 0.0]],
+                              "wall_time": 0.1, "worker": "alive"})
+        self.assertListEqual(listdir(join(queue.path, "done")),
+                             ["key2.json"])
+        self.assertFalse(queue.closed)
+
+    def test_failing_job(self):
+        queue = WorkQueue(join(self.exec_dir, "queue"))
+        job_list = [Job("missing", abspath(join(self.exec_dir, "none.xyz")),
+                        1, None)]
+        queue.publish(job_list, abspath(join(self.input_dir, "dftb_in.hsd")),
+                      abspath("../benchmarks/fake_dftbplus.py"))
+        chdir(self.exec_dir)
+        try:
+            self.assertEqual(workqueue.work("queue", exit_when_idle=True), 1)
+        finally:
+            chdir(self.base_dir)
+        self.assertListEqual(listdir(join(queue.path, "failed")),
+                             ["missing.json"])
+        self.assertListEqual(listdir(join(queue.path, "pending")), [])
+
+    def test_workers(self):
+        stub = join(self.base_dir, "../benchmarks/fake_dftbplus.py")
+        for name in ("local", "distributed"):
+            run_dir = join(self.exec_dir, name)
+            copytree(self.input_dir, run_dir)
+            config = join(run_dir, "testsets_config.yml")
+            with open(config, "r") as infile:
+                settings = yaml.safe_load(infile)
+            settings["Options"]["DFTBPlusPath"] = stub
+            with open(config, "w") as outfile:
+                yaml.safe_dump(settings, outfile)
+        queue_dir = abspath(join(self.exec_dir, "queue"))
+        env = dict(environ, PYTHONPATH=abspath(".."),
+                   FAKE_DFTBPLUS_LATENCY="0.05")
+        script = abspath("../run_testsets.py")
+        # One worker leaves after its first calculation
+        workers = [subprocess.Popen([sys.executable, script, "--worker",
+                                     queue_dir] + extra,
+                                    cwd=self.exec_dir, env=env,
+                                    stdout=subprocess.DEVNULL)
+                   for extra in ([], [], ["--max-jobs", "1"])]
+        chdir(join(self.exec_dir, "distributed"))
+        try:
+            run_testsets.main(["--coordinator", queue_dir])
+        finally:
+            chdir(self.base_dir)
+            for worker in workers:
+                worker.wait(timeout=30)
+        self.assertTrue(all(x.returncode == 0 for x in workers))
+        self.assertEqual(len(listdir(join(queue_dir, "done"))), 5)
+        self.assertListEqual(listdir(join(queue_dir, "running")), [])
+        chdir(join(self.exec_dir, "local"))
+        run_testsets.main([])
+        chdir(self.base_dir)
+        for name in ("Sample Energies.csv", "Sample Reactions.csv"):
+            with open(join(self.exec_dir, "local", name), "r") as infile:
+                local = infile.read()
+            with open(join(self.exec_dir, "distributed", name), "r") as infile:
+                self.assertEqual(infile.read(), local)
+        self.assertEqual(workqueue.work(queue_dir), 0)  # closed queue
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,33 +1,131 @@
 """Script that reads GMTKN55 data and creates a input template.
 
+Subsets are processed in parallel. A manifest with content hashes of every
+subset is kept in the output directory, so subsets whose .ref file and
+structures did not change are skipped on the next run. Geometries are stored
+once per content in a hidden object directory and hard linked into the
+subset directories. A change of MANIFEST_VERSION (i.e. of the generated
+config or geometries) makes the next run parse all subsets again.
+
 Might not work for earlier or future versions of the GMTKN collection.
+
+Usage:
+python3 gmtkn_parser.py path/to/GMTKN55 output/path/GMTKN55_parsed
 """
 
-import os
-from os.path import join, exists
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha1
+from os.path import join, exists, isdir, samefile
 from shutil import copy2
 
+import argparse
+import json
+import os
 
-def parse_gmtkn_55(data_path, output_path):
+MANIFEST = ".gmtkn_manifest.json"
+MANIFEST_VERSION = 2
+OBJECT_DIR = ".objects"
+STRUCTURE_FILES = ("struc.xyz", ".CHRG", ".UHF")
+
+
+def parse_gmtkn_55(data_path, output_path, workers=None):
     print(f"parsing from {data_path}, writing to {output_path}")
-    subsets = get_subsets(data_path)
-    input_base = ((f"Options:\n  # Input file to use for all calculations.\n"
-                   "  # All skf paths have to be absolute and the gen input "
-                   "geometry has to be set\n  # to \"in.gen\" since the "
-                   "program will generate that file.\n  DFTBPlusHSD: "
-                   "\"dftb_in.hsd\"\n  DFTBPlusPath: \"dftb+\"  \n"
-                   "Testsets:\n"))
-    for subset in subsets:
-        print(f"parsing subset {subset}")
-        subpath = join(data_path, subset)
-        reactions = reactions_from_file(subset, subpath)
-        input_base += subset_to_config(reactions, subset)
+    os.makedirs(join(output_path, OBJECT_DIR), exist_ok=True)
+    manifest = read_manifest(output_path)
+    subsets = sorted(get_subsets(data_path))
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        hashes = dict(zip(subsets, pool.map(
+            subset_hash, [join(data_path, x) for x in subsets])))
+        changed = [x for x in subsets
+                   if manifest.get(x, dict()).get("hash") != hashes[x]
+                   or not isdir(join(output_path, x))]
+        print(f"{len(subsets) - len(changed)} subsets unchanged, "
+              f"parsing {len(changed)}")
+        parsed = pool.map(parse_subset,
+                          [join(data_path, x) for x in changed],
+                          [output_path] * len(changed))
+        for subset, (fragment, objects) in zip(changed, parsed):
+            manifest[subset] = {"hash": hashes[subset], "config": fragment,
+                                "objects": objects}
+    for subset in set(manifest) - set(subsets):
+        del manifest[subset]
+    remove_objects(output_path, manifest)
+    input_base = [(f"Options:\n  # Input file to use for all calculations.\n"
+                   "  # All skf paths have to be absolute. The Geometry block "
+                   "is replaced by the\n  # geometry of each system, so it "
+                   "can be left as is.\n  DFTBPlusHSD: "
+                   "\"dftb_in.hsd\"\n  DFTBPlusPath: \"dftb+\"\n"
+                   "Testsets:\n")]
+    input_base.extend(manifest[x]["config"] for x in subsets)
+    input_base = "".join(input_base)
     print(f"writing config file to {join(output_path, 'testsets_config.yml')}")
     with open(join(output_path, "testsets_config.yml"), "w") as out_file:
         out_file.write(input_base)
+    write_manifest(output_path, manifest)
     return input_base
 
 
+def parse_subset(subpath, output_path):
+    """Parses one subset and writes its geometries.
+
+    @:returns config file fragment of the subset and sorted list of the
+        names of the stored geometries it uses.
+    """
+    subset = os.path.basename(subpath.rstrip("/"))
+    print(f"parsing subset {subset}")
+    reactions = reactions_from_file(subset, subpath)
+    systems = system_settings(subpath)
+    objects = write_geometries(subpath, output_path)
+    return subset_to_config(reactions, subset, systems), sorted(objects)
+
+
+def subset_hash(subpath):
+    """Returns a hash over the .ref file and all structure files."""
+    digest = sha1()
+    for f in sorted(os.listdir(subpath)):
+        if isdir(join(subpath, f)):
+            names = [join(f, x) for x in STRUCTURE_FILES]
+        else:
+            names = [f]
+        for name in names:
+            if exists(join(subpath, name)):
+                digest.update(name.encode())
+                digest.update(file_hash(join(subpath, name)).encode())
+    return digest.hexdigest()
+
+
+def file_hash(path):
+    with open(path, "rb") as file:
+        return sha1(file.read()).hexdigest()
+
+
+def read_manifest(output_path):
+    """Returns the subsets of the manifest, empty for other versions."""
+    try:
+        with open(join(output_path, MANIFEST), "r") as file:
+            manifest = json.load(file)
+        if manifest.get("version") != MANIFEST_VERSION:
+            return dict()
+        return manifest["subsets"]
+    except (OSError, ValueError, AttributeError, KeyError):
+        return dict()
+
+
+def write_manifest(output_path, manifest):
+    with open(join(output_path, MANIFEST), "w") as file:
+        json.dump({"version": MANIFEST_VERSION, "subsets": manifest}, file,
+                  indent=1, sort_keys=True)
+
+
+def remove_objects(output_path, manifest):
+    """Removes stored geometries no subset of the manifest uses."""
+    used = {x for y in manifest.values() for x in y["objects"]}
+    object_dir = join(output_path, OBJECT_DIR)
+    for f in os.listdir(object_dir):
+        if f.endswith(".xyz") and f not in used:
+            os.remove(join(object_dir, f))
+
+
 def reactions_from_file(subset, subpath):
     refname = f"{subset}.ref"
     reactions = dict()
@@ -41,33 +139,62 @@ def reactions_from_file(subset, subpath):
             nreactants = len(split[1:-1])//2
             reactants = split[1:nreactants+1]
             stoich = split[nreactants+1:-1]
-            eq = f""
-            prev = 0
+            educts = []
+            products = []
             for factor, reactant in sorted(zip(stoich, reactants)):
                 factor = int(factor)
-                if factor > 0 > prev:
-                    eq += "-> "
-                eq += f"{abs(factor)} {reactant} "
-                prev = factor
+                if factor < 0:
+                    educts.append(f"{abs(factor)} {reactant}")
+                else:
+                    products.append(f"{factor} {reactant}")
+            eq = " + ".join(educts)
+            if educts and products:
+                eq += " -> "
+            eq += " + ".join(products)
             reactions[eq] = ref
     return reactions
 
 
-def subset_to_config(reactions, subset):
-    template_string = ((f"  {subset}:  # Testset name\n"
-                        "    path: \"{subset}_geom\"  \n"
-                        "    type: \"reaction\"\n"
-                        "    reactions: \n"))
+def system_settings(subpath):
+    """Reads charges (.CHRG) and unpaired electrons (.UHF) of structures."""
+    systems = dict()
+    for f in os.listdir(subpath):
+        settings = dict()
+        for filename, key in ((".CHRG", "charge"),
+                              (".UHF", "unpaired_electrons")):
+            path = join(subpath, f, filename)
+            if exists(path):
+                with open(path, "r") as file:
+                    value = int(file.read().split()[0])
+                if value:
+                    settings[key] = value
+        if settings:
+            systems[f] = settings
+    return systems
+
+
+def subset_to_config(reactions, subset, systems=None):
+    lines = [f"  {subset}:  # Testset name",
+             f"    path: \"{subset}\"",
+             "    type: \"reaction\"",
+             "    collection: \"GMTKN55\"",
+             "    reactions:"]
     for eq, ref in reactions.items():
-        template_string += (f"      - equation: \"{eq}\"\n      "
-                            f"reference: \"{ref}\" \n")
-    return template_string
+        lines.append(f"      - equation: \"{eq}\"")
+        lines.append(f"        reference: {ref}")
+    if systems:
+        lines.append("    systems:")
+        for name, settings in sorted(systems.items()):
+            lines.append(f"      \"{name}\":")
+            for key, value in settings.items():
+                lines.append(f"        {key}: {value}")
+    return "\n".join(lines) + "\n"
 
 
 def get_subsets(data_path):
     subsets = []
     for f in os.listdir(data_path):
-        if "backup" in f:
+        if "backup" in f or not isdir(join(data_path, f)):
             continue
         else:
             subsets.append(f)
@@ -75,19 +202,52 @@ def get_subsets(data_path):
 
 
 def write_geometries(subpath, output_path):
-    subname = subpath.split("/")[-1]
+    """Links all structures of a subset into output_path/<subset>.
+
+    Every distinct structure file is stored once in the object directory and
+    hard linked to its place (copied if the file system has no hard links).
+    Geometries of structures that no longer exist are removed.
+
+    @:returns set of the names of the stored geometries.
+    """
+    subname = os.path.basename(subpath.rstrip("/"))
+    newpath = join(output_path, subname)
+    os.makedirs(newpath, exist_ok=True)
+    wanted = set()
+    objects = set()
     for f in os.listdir(subpath):
-        if ".res" in f or "ref" in f:
+        old_file = join(subpath, f, "struc.xyz")
+        if not exists(old_file):
             continue
-        else:
-            old_file = join(subpath, f, "struc.xyz")
-            newpath = join(output_path, subname)
-            if not exists(newpath):
-                os.makedirs(newpath)
-            new_file = join(newpath, f"{f}.xyz")
-            copy2(old_file, new_file)
+        new_file = join(newpath, f"{f}.xyz")
+        wanted.add(f"{f}.xyz")
+        name = file_hash(old_file) + ".xyz"
+        objects.add(name)
+        stored = join(output_path, OBJECT_DIR, name)
+        if not exists(stored):
+            tmp = f"{stored}.{os.getpid()}.tmp"
+            copy2(old_file, tmp)
+            os.replace(tmp, stored)
+        if exists(new_file) and samefile(new_file, stored):
+            continue
+        tmp = f"{new_file}.tmp"
+        try:
+            os.link(stored, tmp)
+        except OSError:
+            copy2(stored, tmp)
+        os.replace(tmp, new_file)
+    for f in os.listdir(newpath):
+        if f.endswith(".xyz") and f not in wanted:
+            os.remove(join(newpath, f))
+    return objects
 
 
 if __name__ == "__main__":
-    config_string = parse_gmtkn_55("path/to/GMTKN55",
-                                   "output/path/GMTKN55_parsed")
+    parser = argparse.ArgumentParser(description="Creates a testset config "
+                                     "and geometries from GMTKN55 data.")
+    parser.add_argument("data_path", help="Path to the GMTKN55 data.")
+    parser.add_argument("output_path", help="Output directory.")
+    parser.add_argument("--workers", type=int, default=None,
+                        help="Number of parallel processes.")
+    args = parser.parse_args()
+    parse_gmtkn_55(args.data_path, args.output_path, args.workers)